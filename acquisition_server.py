@@ -0,0 +1,351 @@
+import argparse
+import json
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+from sweep_queue import SweepQueue, SweepRecipe, load_recipes
+
+"""
+Local acquisition daemon.
+
+One process owns the chromometer and source meter sessions and runs sweep jobs from a queue.  Every measured point is
+published as a small binary message to all connected clients while the sweep runs, so plotters, loggers and analysis
+clients see the data live without any extra instrument traffic.  Jobs are submitted over the same connection.
+
+Wire format, little endian, every message is a header followed by a payload:
+    header  <BI   message type (uint8), payload length in bytes (uint32)
+    POINT   <IIddd   job id, point index, wavelength [nm], current [A], unix time [s]     (server -> client)
+    JOB     JSON recipe, same keys as a sweep_queue recipe                              (client -> server)
+    STATUS  JSON {"event": "queued"|"started"|"finished"|"failed"|"rejected", "job": id, ...}   (server -> client)
+
+A client that reads too slowly loses POINT messages (its send queue is bounded) instead of stalling the sweep.  STATUS
+messages are not dropped: a client whose queue stays full for send_timeout_s, or whose connection failed, is
+disconnected instead.
+
+Ex.
+    python acquisition_server.py serve --smu-resource GPIB0::30::INSTR
+    python acquisition_server.py serve --simulate
+    python acquisition_server.py submit tonight.json
+    python acquisition_server.py listen
+"""
+
+HEADER = struct.Struct("<BI")
+POINT = struct.Struct("<IIddd")
+
+MSG_POINT = 1
+MSG_JOB = 2
+MSG_STATUS = 3
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 50210
+
+
+def encode_message(message_type, payload):
+    return HEADER.pack(message_type, len(payload)) + payload
+
+
+def encode_point(job_id, index, wavelength, current, timestamp):
+    return encode_message(MSG_POINT, POINT.pack(job_id, index, wavelength, current, timestamp))
+
+
+def encode_json(message_type, content):
+    return encode_message(message_type, json.dumps(content).encode("utf-8"))
+
+
+def _receive_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def receive_message(sock):
+    """
+    :return: (message type, payload bytes), or None once the other side closed the connection
+    """
+    header = _receive_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    message_type, length = HEADER.unpack(header)
+    payload = _receive_exactly(sock, length)
+    if payload is None:
+        return None
+    return message_type, payload
+
+
+def decode_message(message_type, payload):
+    """
+    :return: dict, POINT as {"job", "index", "wavelength", "current", "time"}, JOB and STATUS as sent
+    """
+    if message_type == MSG_POINT:
+        return dict(zip(("job", "index", "wavelength", "current", "time"), POINT.unpack(payload)))
+    return json.loads(payload.decode("utf-8"))
+
+
+class _Subscriber:
+    """
+    Connected client.  A sender thread drains a bounded queue so a slow client never blocks the sweep.
+    """
+    def __init__(self, sock, queue_size, send_timeout_s=5.0):
+        self.sock = sock
+        self.queue = queue.Queue(queue_size)
+        self.send_timeout_s = send_timeout_s
+        self.dropped_points = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self._send_loop, daemon=True)
+        self.thread.start()
+
+    def send(self, data, droppable=True):
+        if self.closed:
+            return
+        try:
+            if droppable:
+                self.queue.put_nowait(data)
+            else:
+                self.queue.put(data, timeout=self.send_timeout_s)
+        except queue.Full:
+            if droppable:
+                self.dropped_points += 1
+            else:
+                print("Disconnecting a client that stopped reading")
+                self.disconnect()
+
+    def disconnect(self):
+        """
+        Shuts the socket down: a blocked sendall fails and the client's handler sees the connection end.
+        """
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        self.closed = True
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            self.disconnect()
+
+    def _send_loop(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                break
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.disconnect()
+                break
+
+
+class _ClientHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        subscriber = _Subscriber(self.request, server.queue_size, server.send_timeout_s)
+        server.add_subscriber(subscriber)
+        try:
+            while True:
+                message = receive_message(self.request)
+                if message is None:
+                    break
+                message_type, payload = message
+                if message_type != MSG_JOB:
+                    continue
+                try:
+                    server.submit(decode_message(message_type, payload), subscriber)
+                except (ValueError, TypeError) as e:
+                    subscriber.send(encode_json(MSG_STATUS, {"event": "rejected", "error": str(e)}), droppable=False)
+        except OSError:
+            pass
+        finally:
+            server.remove_subscriber(subscriber)
+            subscriber.close()
+
+
+class AcquisitionServer(socketserver.ThreadingTCPServer):
+    """
+    Owns the instruments through a sweep_queue.SweepQueue; jobs run one at a time on a single worker thread, which
+    is the only thread touching the instruments.
+
+    :param chromometer: sp_2150i_chromometer_driver.Chromometer
+    :param keithley: smu_interface.SourceMeter
+    :param queue_size: messages buffered per client before POINT messages are dropped
+    :param send_timeout_s: how long a STATUS message may wait for room in a client's queue before that client is
+        disconnected
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, chromometer, keithley, host=DEFAULT_HOST, port=DEFAULT_PORT, queue_size=100000,
+                 send_timeout_s=5.0):
+        super().__init__((host, port), _ClientHandler)
+        self.sweep_queue = SweepQueue(chromometer, keithley)
+        self.queue_size = queue_size
+        self.send_timeout_s = send_timeout_s
+        self.jobs = queue.Queue()
+        self.subscribers = []
+        self.subscribers_lock = threading.Lock()
+        self.next_job_id = 1
+        self.job_id_lock = threading.Lock()
+        self.worker = threading.Thread(target=self._work, daemon=True)
+
+    def add_subscriber(self, subscriber):
+        with self.subscribers_lock:
+            self.subscribers.append(subscriber)
+
+    def remove_subscriber(self, subscriber):
+        with self.subscribers_lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def broadcast(self, data, droppable=True):
+        with self.subscribers_lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.send(data, droppable)
+
+    def submit(self, recipe, subscriber=None):
+        """
+        :param recipe: recipe dict, see sweep_queue
+        :param subscriber: client that submitted the job, sent the "queued" STATUS before the worker can start the job
+        :return: job id
+        """
+        recipe = SweepRecipe(**recipe)
+        with self.job_id_lock:
+            job_id = self.next_job_id
+            self.next_job_id += 1
+        if subscriber is not None:
+            subscriber.send(encode_json(MSG_STATUS, {"event": "queued", "job": job_id}), droppable=False)
+        self.jobs.put((job_id, recipe))
+        return job_id
+
+    def serve_forever(self, poll_interval=0.5):
+        if not self.worker.is_alive():
+            self.worker.start()
+        super().serve_forever(poll_interval)
+
+    def server_close(self):
+        self.jobs.put(None)
+        super().server_close()
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            job_id, recipe = job
+
+            def on_point(index, wavelength, current):
+                self.broadcast(encode_point(job_id, index, wavelength, current, time.time()))
+
+            self.broadcast(encode_json(MSG_STATUS, {"event": "started", "job": job_id, "name": recipe.name,
+                                                    "points": len(recipe.wavelengths)}), droppable=False)
+            try:
+                df = self.sweep_queue.run_recipe(recipe, on_point=on_point)
+            except Exception as e:
+                print("Job", job_id, "failed:", repr(e))
+                self.broadcast(encode_json(MSG_STATUS, {"event": "failed", "job": job_id, "error": repr(e)}),
+                               droppable=False)
+                continue
+            self.broadcast(encode_json(MSG_STATUS, {"event": "finished", "job": job_id, "points": len(df)}),
+                           droppable=False)
+
+
+class AcquisitionClient:
+    """
+    Ex.
+        client = AcquisitionClient()
+        client.submit({"device": "red", "segments": [[400, 1100, 10]], "bias": 0})
+        for message_type, message in client.messages():
+            print(message)
+    """
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None):
+        self.sock = socket.create_connection((host, port), timeout)
+
+    def submit(self, recipe):
+        self.sock.sendall(encode_json(MSG_JOB, recipe))
+
+    def messages(self):
+        """
+        :return: generator of (message type, decoded message), ends when the server closes the connection
+        """
+        while True:
+            message = receive_message(self.sock)
+            if message is None:
+                return
+            yield message[0], decode_message(*message)
+
+    def close(self):
+        self.sock.close()
+
+
+def arg_handler(argv=None):
+    parser = argparse.ArgumentParser(description="Acquisition daemon publishing sweep points over a local socket.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve = subparsers.add_parser("serve", help="Own the instruments and run submitted jobs.")
+    serve.add_argument("--chromometer-resource", default="COM4",
+                       help="Serial port of the chromometer, ex. COM4 or /dev/ttyUSB0.")
+    serve.add_argument("--smu-resource", default="GPIB0::30::INSTR",
+                       help="VISA resource of the source meter, model detected from *IDN?.")
+    serve.add_argument("--simulate", action="store_true", help="Use simulated_instruments instead of the bench.")
+
+    submit = subparsers.add_parser("submit", help="Queue the recipes of JSON recipe files and follow them.")
+    submit.add_argument("recipe_files", nargs="+")
+
+    subparsers.add_parser("listen", help="Print every message published by the server.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = arg_handler()
+
+    if args.command == "serve":
+        if args.simulate:
+            from simulated_instruments import connect_simulated
+            chromometer, keithley = connect_simulated()
+        else:
+            from sp_2150i_chromometer_driver import Chromometer
+            from smu_interface import connect_smu
+            chromometer = Chromometer(resource_name=args.chromometer_resource)
+            keithley = connect_smu(args.smu_resource)
+
+        with AcquisitionServer(chromometer, keithley, args.host, args.port) as server:
+            print(f"Serving on {args.host}:{args.port}")
+            server.serve_forever()
+    else:
+        client = AcquisitionClient(args.host, args.port)
+        unacknowledged = 0  # submitted, not yet queued or rejected
+        running = set()  # queued job ids not finished yet
+        if args.command == "submit":
+            for path in args.recipe_files:
+                load_recipes(path)  # validate locally first, the server only reports a rejection
+                with open(path) as f:
+                    content = json.load(f)
+                for recipe in content if isinstance(content, list) else [content]:
+                    client.submit(recipe)
+                    unacknowledged += 1
+
+        for message_type, message in client.messages():
+            print(message)
+            if args.command != "submit" or message_type != MSG_STATUS:
+                continue
+            if message["event"] in ("queued", "rejected"):
+                unacknowledged -= 1
+                if message["event"] == "queued":
+                    running.add(message["job"])
+            elif message["event"] in ("finished", "failed"):
+                running.discard(message["job"])
+            if not unacknowledged and not running:
+                break
+        client.close()
@@ -0,0 +1,187 @@
+import asyncio
+import contextlib
+import time
+
+from instrument_io import is_timeout
+
+"""
+asyncio wrappers for the instrument drivers.
+
+Blocking VISA I/O runs in a worker thread (asyncio.to_thread) so one event loop can coordinate the chromometer and both
+SMUs.  Each instrument has its own asyncio.Lock: calls to one instrument are serialized, calls to different
+instruments overlap.  A VISA call that is already running cannot be interrupted: on timeout or cancellation the caller
+gets the error at once, while the instrument stays locked until that call has returned, so the next caller never shares
+a half-finished exchange.
+
+Ex.
+    chromometer = AsyncChromometer(Chromometer())
+    smu = AsyncInstrument(connect_smu("GPIB0::30::INSTR"))
+    move = asyncio.create_task(chromometer.set_wavelength_nm(650))
+    while not move.done():
+        print(await smu.measure_current(timeout=2))
+        await asyncio.sleep(0.5)
+"""
+
+
+class AsyncInstrument:
+    """
+    Async view of any driver: every driver method is available as a coroutine taking an extra timeout [s] keyword,
+    ex. await AsyncInstrument(Keithley2410()).get_voltage_source(timeout=1).
+    """
+    def __init__(self, driver):
+        self.driver = driver
+        self.lock = asyncio.Lock()
+        self._pending = None  # thread call of the lock holder, possibly still running after a timeout
+
+    async def run(self, function, *args, timeout=None, **kwargs):
+        """
+        Runs a blocking driver call in a worker thread with the instrument locked.
+
+        :param function: bound driver method or any blocking callable using this instrument
+        :param timeout: seconds, None waits forever
+        :return: the call's return value
+        """
+        async with self._locked():
+            return await self._run_locked(function, *args, timeout=timeout, **kwargs)
+
+    @contextlib.asynccontextmanager
+    async def _locked(self):
+        await self.lock.acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        pending, self._pending = self._pending, None
+        if pending is None or pending.done():
+            self.lock.release()
+        else:
+            # the I/O in the thread cannot be interrupted, keep the instrument locked until it returns
+            pending.add_done_callback(self._release_after)
+
+    def _release_after(self, call):
+        if not call.cancelled():
+            call.exception()  # the caller already got the timeout, nobody else wants this result
+        self.lock.release()
+
+    async def _run_locked(self, function, *args, timeout=None, **kwargs):
+        """
+        Needs the lock held (_locked).  Raises asyncio.TimeoutError as soon as timeout has passed.
+        """
+        if self._pending is not None and not self._pending.done():
+            # an earlier call of this lock holder timed out but is still on the bus
+            await asyncio.wait([self._pending])
+        call = asyncio.ensure_future(asyncio.to_thread(function, *args, **kwargs))
+        self._pending = call
+        result = await asyncio.wait_for(asyncio.shield(call), timeout)
+        self._pending = None
+        return result
+
+    def __getattr__(self, name):
+        attribute = getattr(self.driver, name)
+        if not callable(attribute):
+            return attribute
+
+        async def method(*args, timeout=None, **kwargs):
+            return await self.run(attribute, *args, timeout=timeout, **kwargs)
+
+        method.__name__ = name
+        return method
+
+
+class AsyncKeithley2602B(AsyncInstrument):
+    """
+    Ex. smu = AsyncKeithley2602B(Keithley2602B()); await smu.smua_measure_i_buffer(9, timeout=5)
+    """
+
+
+class AsyncKeithley2410(AsyncInstrument):
+    """
+    Ex. smu = AsyncKeithley2410(Keithley2410()); await smu.get_measure_voltage_current_and_other(timeout=2)
+    """
+
+
+class AsyncChromometer(AsyncInstrument):
+    """
+    Moves use the chromometer's non-blocking commands: ">NM" starts a move, "MONO-?DONE" is polled with asyncio.sleep
+    in between, and cancelling the awaiting task sends "MONO-STOP".
+    """
+    async def set_wavelength_nm(self, wavelength, timeout=None, poll_interval_s=0.2, safety_factor=1.1):
+        """
+        :param wavelength: target [nm]
+        :param timeout: seconds for the whole move, defaults to the expected travel time times 2 plus 5 s
+        :return: wavelength read back after the move
+        """
+        async with self._locked():
+            current = await self._run_locked(self.driver.get_wavelength_nm_clean_output)
+            speed = await self._run_locked(self.driver.get_scan_speed_nm_p_min_clean_output)
+            travel_s = 60 * abs(current - wavelength) / speed * safety_factor
+            if timeout is None:
+                timeout = travel_s * 2 + 5
+
+            deadline = time.monotonic() + timeout
+            await self._run_locked(self.driver.start_scan_to, wavelength)
+            try:
+                # no point polling before the expected travel time is nearly over, but check the deadline in time
+                await asyncio.sleep(max(0.0, min(travel_s - poll_interval_s, deadline - time.monotonic())))
+                while not await self._run_locked(self.driver.is_scan_done):
+                    if time.monotonic() > deadline:
+                        raise asyncio.TimeoutError(f"Chromometer did not reach {wavelength} nm within {timeout:.1f} s")
+                    await asyncio.sleep(max(0.0, min(poll_interval_s, deadline - time.monotonic())))
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                await asyncio.shield(self._run_locked(self.driver.stop_scan))
+                raise
+
+            return await self._run_locked(self.driver.get_wavelength_nm_clean_output)
+
+    async def set_grating(self, grating, timeout=60, poll_interval_s=0.5):
+        """
+        Indexing a grating (~20 s) cannot be aborted.  Cancelling the awaiting task returns immediately; the chromometer
+        stays locked in the background until the change has finished and its reply has been read.
+
+        :param grating: 1 or 2
+        :param timeout: seconds
+        :return: measured change time [s]
+        """
+        change = asyncio.ensure_future(self._change_grating(grating, timeout, poll_interval_s))
+        return await asyncio.shield(change)
+
+    async def _change_grating(self, grating, timeout, poll_interval_s):
+        async with self._locked():
+            start = time.monotonic()
+            await self._run_locked(self.driver.device_handle.write, str(grating) + " GRATING")
+            while True:
+                try:
+                    await self._run_locked(self.driver.read)
+                    break
+                except Exception as e:
+                    if not is_timeout(e):
+                        raise
+                    # read timed out, grating still moving
+                    if time.monotonic() - start > timeout:
+                        raise asyncio.TimeoutError(f"Grating {grating} not indexed after {timeout} s")
+                    await asyncio.sleep(poll_interval_s)
+
+            self.driver.last_grating_change_s = time.monotonic() - start
+            return self.driver.last_grating_change_s
+
+
+async def _demo():
+    from sp_2150i_chromometer_driver import Chromometer
+    from smu_interface import connect_smu
+
+    chromometer = AsyncChromometer(Chromometer())
+    smu = AsyncInstrument(connect_smu("GPIB0::30::INSTR"))
+
+    await smu.output_on()
+    move = asyncio.create_task(chromometer.set_wavelength_nm(650))
+    while not move.done():
+        print("current while moving:", await smu.measure_current(timeout=2))
+        await asyncio.sleep(0.5)
+    print("reached", await move)
+    await smu.output_off()
+
+
+if __name__ == "__main__":
+    asyncio.run(_demo())
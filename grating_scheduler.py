@@ -0,0 +1,53 @@
+import math
+
+"""
+Assigns sweep wavelengths to gratings and orders them so each grating is indexed at most once per pass.
+
+A grating is most efficient near its blaze wavelength and usable from roughly 2/3 to 2x blaze in first order, so each
+wavelength goes to the grating whose blaze is closest on a log scale (ratio, not difference), unless an explicit
+crossover wavelength is given.
+"""
+
+
+def assign_gratings(wl_list, gratings, crossover_nm=None):
+    """
+    :param wl_list: sweep wavelengths [nm]
+    :param gratings: list of dict with "grating" (1 or 2) and "blaze_nm", ex. Chromometer().get_turret_gratings()
+    :param crossover_nm: optional fixed crossover; wavelengths below it use the lower-blaze grating
+    :return: list of grating numbers, one per wavelength
+    """
+    if not gratings:
+        raise ValueError("No gratings installed on the selected turret")
+
+    by_blaze = sorted(gratings, key=lambda g: g["blaze_nm"])
+    if crossover_nm is not None:
+        return [by_blaze[0]["grating"] if wl < crossover_nm else by_blaze[-1]["grating"] for wl in wl_list]
+
+    return [min(by_blaze, key=lambda g: abs(math.log(wl / g["blaze_nm"])))["grating"] for wl in wl_list]
+
+
+def plan_grating_passes(wl_list, assignment, current_grating=None):
+    """
+    Groups the sweep by grating.  The group of the grating already in position goes first, so a sweep spanning the
+    crossover costs exactly one grating change, and one that doesn't costs none.  Sweep order is kept inside a group.
+
+    :param wl_list: sweep wavelengths [nm]
+    :param assignment: grating per wavelength from assign_gratings
+    :param current_grating: grating in position now
+    :return: list of (grating, [wavelengths]) in execution order
+    """
+    groups = {}
+    for wavelength, grating in zip(wl_list, assignment):
+        groups.setdefault(grating, []).append(wavelength)
+
+    order = sorted(groups, key=lambda grating: (grating != current_grating, min(groups[grating])))
+    return [(grating, groups[grating]) for grating in order]
+
+
+def count_grating_changes(passes, current_grating=None):
+    changes = 0
+    for grating, wavelengths in passes:
+        if grating != current_grating:
+            changes += 1
+            current_grating = grating
+    return changes
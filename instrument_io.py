@@ -0,0 +1,237 @@
+import re
+import time
+
+from pyvisa import constants, errors
+
+from sweep_trace import span
+
+"""
+Shared I/O policy for all instrument sessions: per-command timeouts, classified errors, bounded retries with
+exponential backoff and device clear between attempts.
+
+Drivers wrap their pyvisa resource in a PolicyHandle, so driver code keeps calling device_handle.write/query/read and a
+transient fault (garbled reply, one lost GPIB exchange) costs a clear plus a few ms instead of a stall or an endless
+retry loop.  Anything still failing after the retries is raised as one of the InstrumentIOError subclasses below.
+"""
+
+
+class InstrumentIOError(Exception):
+    def __init__(self, message, command=None):
+        super().__init__(message)
+        self.command = command
+
+
+class InstrumentBusyError(InstrumentIOError):
+    """Instrument is executing something else (ex. chromometer still moving) or the resource is locked."""
+
+
+class InstrumentTimeoutError(InstrumentIOError):
+    """No reply within the command's timeout."""
+
+
+class InstrumentParseError(InstrumentIOError):
+    """Reply arrived but could not be interpreted."""
+
+
+class InstrumentProtocolError(InstrumentIOError):
+    """Bus or session level failure (lost connection, framing, other VISA errors)."""
+
+
+BUSY_STATUS_CODES = (constants.StatusCode.error_resource_busy, constants.StatusCode.error_resource_locked)
+
+
+def classify_exception(exc):
+    """
+    Maps an exception raised during instrument I/O to an InstrumentIOError subclass.
+
+    :param exc: exception instance
+    :return: InstrumentIOError subclass, or None if exc is not an I/O error
+    """
+    if isinstance(exc, InstrumentIOError):
+        return type(exc)
+    if isinstance(exc, errors.VisaIOError):
+        if exc.error_code == constants.StatusCode.error_timeout:
+            return InstrumentTimeoutError
+        if exc.error_code in BUSY_STATUS_CODES:
+            return InstrumentBusyError
+        return InstrumentProtocolError
+    if isinstance(exc, TimeoutError):
+        return InstrumentTimeoutError
+    if isinstance(exc, (ValueError, IndexError)):
+        return InstrumentParseError
+    if isinstance(exc, OSError):
+        return InstrumentProtocolError
+    return None
+
+
+_sleep = time.sleep
+
+
+def sleep(seconds):
+    """
+    Fixed waits on the instruments (move waits, retry backoff).  Transcript replay swaps the function with set_sleep
+    so a replay does not wait for a chromometer that is not there.
+    """
+    _sleep(seconds)
+
+
+def set_sleep(function):
+    """
+    :param function: replacement for time.sleep, ex. lambda seconds: None
+    :return: the previous function
+    """
+    global _sleep
+    previous, _sleep = _sleep, function
+    return previous
+
+
+def is_timeout(exc):
+    return classify_exception(exc) is InstrumentTimeoutError
+
+
+class CommandRule:
+    """
+    Overrides the policy defaults for commands matching a regular expression.  Reads are matched against the last
+    command written, since that is the reply they collect.
+
+    Ex. CommandRule(r"^[\\d.]+ NM$", retries=0) - a move may legitimately outlast any timeout, never re-send it.
+    """
+    def __init__(self, pattern, timeout_ms=None, retries=None):
+        self.pattern = re.compile(pattern)
+        self.timeout_ms = timeout_ms
+        self.retries = retries
+
+
+class IOPolicy:
+    def __init__(self, default_timeout_ms=2000, retries=2, backoff_s=0.005, backoff_factor=2, max_backoff_s=0.2,
+                 retry_on=(InstrumentBusyError, InstrumentTimeoutError, InstrumentParseError, InstrumentProtocolError),
+                 rules=()):
+        """
+        :param default_timeout_ms: VISA timeout for commands without a rule
+        :param retries: additional attempts after the first one
+        :param backoff_s: wait before the first retry, multiplied by backoff_factor each retry up to max_backoff_s
+        :param retry_on: error classes that are retried
+        :param rules: list of CommandRule, first match wins
+        """
+        self.default_timeout_ms = default_timeout_ms
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.backoff_factor = backoff_factor
+        self.max_backoff_s = max_backoff_s
+        self.retry_on = tuple(retry_on)
+        self.rules = list(rules)
+
+    def rule_for(self, command):
+        for rule in self.rules:
+            if command is not None and rule.pattern.search(command):
+                return rule
+        return None
+
+    def timeout_ms_for(self, command):
+        rule = self.rule_for(command)
+        return rule.timeout_ms if rule is not None and rule.timeout_ms is not None else self.default_timeout_ms
+
+    def retries_for(self, command):
+        rule = self.rule_for(command)
+        return rule.retries if rule is not None and rule.retries is not None else self.retries
+
+    def backoff(self, attempt):
+        return min(self.backoff_s * self.backoff_factor ** attempt, self.max_backoff_s)
+
+
+# the chromometer answers a move or grating change only once it is done, so those must never be re-sent or cleared
+CHROMOMETER_POLICY = IOPolicy(default_timeout_ms=2000,
+                              rules=[CommandRule(r"^[\d.]+ ?NM$", retries=0),
+                                     CommandRule(r"^\d+ GRATING$", retries=0),
+                                     CommandRule(r"^\?GRATINGS$", retries=0)])
+# acquisition queries return only after all readings are taken, which can take many seconds at high NPLC.  Never
+# retried: a hung acquisition would cost several long timeouts, and after a device clear has aborted a burst, *OPC? or
+# :TRAC:DATA? would collect partial data
+SMU_POLICY = IOPolicy(default_timeout_ms=5000,
+                      rules=[CommandRule(r"printbuffer|^sweep_point\(|^:READ\?$|^:TRAC:DATA\?$|^\*OPC\?$",
+                                         timeout_ms=120000, retries=0)])
+
+
+class PolicyHandle:
+    """
+    Wraps a pyvisa resource.  write/query/read follow the policy; every other attribute (timeout, clear, baud_rate...)
+    is passed through to the resource.
+    """
+    def __init__(self, handle, policy=None):
+        object.__setattr__(self, "handle", handle)
+        object.__setattr__(self, "policy", policy or IOPolicy())
+        object.__setattr__(self, "last_command", None)
+        object.__setattr__(self, "_timeout_ms", None)
+
+    def __getattr__(self, name):
+        return getattr(self.handle, name)
+
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.handle, name, value)
+
+    def write(self, command, *args, **kwargs):
+        object.__setattr__(self, "last_command", command)
+        return self._call(command, self.handle.write, command, *args, **kwargs)
+
+    def query(self, command, *args, **kwargs):
+        object.__setattr__(self, "last_command", command)
+        return self._call(command, self.handle.query, command, *args, **kwargs)
+
+    def read(self, *args, **kwargs):
+        """
+        Not retried: the device clear between attempts drops the pending reply, so only re-sending its command could
+        bring it back.
+        """
+        return self._call(self.last_command, self.handle.read, *args, retries=0, **kwargs)
+
+    def query_parsed(self, command, parser):
+        """
+        Query whose reply is converted by parser (ex. float, a regex extraction).  A reply that fails to parse (parser
+        raises ValueError or IndexError) is classified as InstrumentParseError and retried like any other fault.
+        """
+        object.__setattr__(self, "last_command", command)
+        return self._call(command, lambda: parser(self.handle.query(command)))
+
+    def recover(self):
+        """
+        Device clear: GPIB selected device clear / serial buffer flush, drops any half-read reply.
+        """
+        try:
+            self.handle.clear()
+        except Exception:
+            pass
+
+    def _set_timeout(self, timeout_ms):
+        if timeout_ms != self._timeout_ms:
+            try:
+                self.handle.timeout = timeout_ms
+            except Exception:
+                pass
+            object.__setattr__(self, "_timeout_ms", timeout_ms)
+
+    def _call(self, command, function, *args, retries=None, **kwargs):
+        policy = self.policy
+        if retries is None:
+            retries = policy.retries_for(command)
+        self._set_timeout(policy.timeout_ms_for(command))
+
+        attempt = 0
+        while True:
+            try:
+                with span(command if function is not self.handle.read else "read", "io", attempt=attempt):
+                    return function(*args, **kwargs)
+            except Exception as exc:
+                error_class = classify_exception(exc)
+                if error_class is None:
+                    raise
+                if attempt >= retries or not issubclass(error_class, policy.retry_on):
+                    if isinstance(exc, InstrumentIOError):
+                        raise
+                    raise error_class(f"{error_class.__name__} on {command!r}: {exc}", command) from exc
+
+            sleep(policy.backoff(attempt))
+            self.recover()
+            attempt += 1
@@ -0,0 +1,152 @@
+import json
+import math
+import os
+import statistics
+import time
+
+from instrument_io import SMU_POLICY
+
+"""
+Chooses SMU integration time (NPLC), on-instrument filter count and the number of readings averaged per point.
+
+Noise and time per reading are measured once per device for a grid of NPLC/filter count settings and cached in a JSON
+file.  For a target noise floor on the per-point mean, the planner then picks the setting and reading count that reaches
+it in the least time, assuming the readings of one setting are independent (noise of the mean ~ std / sqrt(n)).
+Readings are timed the way the sweep takes them, all readings of a point in one SMU exchange, so the time per point
+is a fixed per-exchange overhead plus the time per reading.
+"""
+
+DEFAULT_NPLC_VALUES = (0.01, 0.1, 1, 5, 10)
+DEFAULT_FILTER_COUNTS = (1, 4, 16)
+# half the SMU acquisition timeout: a point somewhat slower than characterized must still not time out
+DEFAULT_MAX_POINT_S = SMU_POLICY.timeout_ms_for(":READ?") / 1000 / 2
+
+
+def smu_settings_functions(smu):
+    """
+    Setting/measuring callables for a source meter.
+
+    :param smu: smu_interface.SourceMeter
+    :return: (apply(nplc, count), measure(n) -> list of n float [A] taken in one exchange)
+    """
+    def apply(nplc, count):
+        smu.set_nplc(nplc)
+        smu.set_filter_count(count)
+
+    return apply, smu.measure_currents
+
+
+class IntegrationPlanner:
+    """
+    Ex.
+        planner = IntegrationPlanner("noise_models.json", "red_diode")
+        if not planner.has_model():
+            planner.characterize(*smu_settings_functions(keithley))
+        plan = planner.plan(target_noise=1e-12)
+        planner.apply(plan, smu_settings_functions(keithley)[0])
+        readings_per_point = plan["readings"]
+    """
+    def __init__(self, cache_path, device, max_readings=100, max_point_s=DEFAULT_MAX_POINT_S):
+        """
+        :param cache_path: JSON file holding noise models of all devices
+        :param device: device name, the model is cached per device
+        :param max_readings: upper bound of readings averaged per point
+        :param max_point_s: upper bound of the acquisition time per point [s], must stay below the SMU acquisition
+            timeout since acquisitions are not retried
+        """
+        self.cache_path = cache_path
+        self.device = device
+        self.max_readings = max_readings
+        self.max_point_s = max_point_s
+        self.model = self._load().get(device, [])
+
+    def has_model(self):
+        return bool(self.model)
+
+    def characterize(self, apply, measure, nplc_values=DEFAULT_NPLC_VALUES, filter_counts=DEFAULT_FILTER_COUNTS,
+                     repeats=20):
+        """
+        Measures standard deviation, wall time per reading and per-exchange overhead for every NPLC/filter count
+        combination and caches the result.  Light and bias should be as during the sweep.
+
+        :param apply: apply(nplc, count) callable
+        :param measure: measure(n) -> list of n float callable, one exchange like a point of the sweep
+        :param repeats: readings per combination
+        :return: list of {"nplc", "count", "std", "seconds", "overhead_s"} entries
+        """
+        model = []
+        for nplc in nplc_values:
+            for count in filter_counts:
+                apply(nplc, count)
+                start = time.perf_counter()
+                measure(1)  # first reading after a settings change is not representative, timed as a short exchange
+                single = time.perf_counter() - start
+
+                start = time.perf_counter()
+                readings = measure(repeats)
+                seconds = (time.perf_counter() - start) / repeats
+
+                entry = {"nplc": nplc, "count": count, "std": statistics.stdev(readings), "seconds": seconds,
+                         "overhead_s": max(single - seconds, 0.0)}
+                print("NPLC {nplc} count {count}: std {std:.3e} A, {seconds:.4f} s/reading, "
+                      "{overhead_s:.4f} s/exchange".format(**entry))
+                model.append(entry)
+
+        self.model = model
+        self._save()
+        return model
+
+    def plan(self, target_noise):
+        """
+        Cheapest combination of setting and readings per point whose noise of the mean is at or below target_noise.
+        Readings per point are capped by max_readings and max_point_s.  If no combination gets there, the lowest-noise
+        one is returned.
+
+        :param target_noise: target standard deviation of the per-point mean [A]
+        :return: {"nplc", "count", "readings", "noise", "seconds"}, seconds per point
+        """
+        if not self.model:
+            raise RuntimeError(f"No noise model for device {self.device}, run characterize() first")
+
+        best = None
+        quietest = None
+        for entry in self.model:
+            readings = max(1, math.ceil((entry["std"] / target_noise) ** 2)) if target_noise > 0 else self.max_readings
+            readings = min(readings, self.max_readings)
+            overhead_s = entry.get("overhead_s", 0.0)
+            if entry["seconds"] > 0:
+                readings = min(readings, math.floor((self.max_point_s - overhead_s) / entry["seconds"]))
+            if readings < 1:
+                continue  # a single reading already outlasts max_point_s
+            candidate = {"nplc": entry["nplc"],
+                         "count": entry["count"],
+                         "readings": readings,
+                         "noise": entry["std"] / math.sqrt(readings),
+                         "seconds": overhead_s + entry["seconds"] * readings}
+
+            if quietest is None or candidate["noise"] < quietest["noise"]:
+                quietest = candidate
+            if candidate["noise"] <= target_noise and (best is None or candidate["seconds"] < best["seconds"]):
+                best = candidate
+
+        if quietest is None:
+            raise RuntimeError(f"Every setting of {self.device} takes longer than {self.max_point_s} s per point")
+        if best is None:
+            print(f"Target noise {target_noise:.3e} A not reachable, using lowest noise setting.")
+            return quietest
+        return best
+
+    def apply(self, plan, apply):
+        apply(plan["nplc"], plan["count"])
+
+    def _load(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        with open(self.cache_path) as f:
+            return json.load(f)
+
+    def _save(self):
+        models = self._load()
+        models[self.device] = self.model
+        with open(self.cache_path, "w") as f:
+            json.dump(models, f, indent=2)
@@ -1,9 +1,17 @@
 import pyvisa
 import time
 
+import numpy as np
+
+from instrument_io import PolicyHandle, SMU_POLICY
+
 #TODO:
 # Finish/test voltage_sweep
 
+BUFFER_MAX_POINTS = 2500
+BURST_STATISTICS = ('MEAN', 'SDEV', 'MIN', 'MAX')
+
+
 class Keithley2410:
     '''
     Keithley 2602B uses TSP (Test Script Processor) commands and a limited number of SCPI commands.
@@ -19,12 +27,21 @@ class Keithley2410:
     See basic source-measure commands pg. 73
     '''
 
-    def __init__(self):
-        self.rm = pyvisa.ResourceManager()
-        self.device_handle = self.rm.open_resource('GPIB0::24::INSTR')  # for keithely 2410
+    def __init__(self, resource_name='GPIB0::24::INSTR', device_handle=None, io_policy=SMU_POLICY):
+        '''
+        :param resource_name: VISA resource, GPIB0::24::INSTR for the lab's keithely 2410
+        :param device_handle: already opened resource (ex. from smu_interface.connect_smu), skips opening
+        '''
+        if device_handle is None:
+            self.rm = pyvisa.ResourceManager()
+            device_handle = self.rm.open_resource(resource_name)
+        else:
+            self.rm = None
+        self.device_handle = PolicyHandle(device_handle, io_policy)
 
     def __del__(self):
-        self.rm.close()
+        if self.rm is not None:
+            self.rm.close()
 
     # def keithley_initialize_2602B(self):
     #     # safety limits
@@ -384,6 +401,17 @@ class Keithley2410:
         '''
         self.device_handle.write(f':CURR:PROT {value}')
 
+    def get_current_compliance_tripped(self):
+        '''
+        1 if the source is in current compliance, 0 if not (pg. 357).
+
+        Full SCPI command:
+        :SENSe:CURRent:PROTection:TRIPped?
+
+        :return: bool
+        '''
+        return self.device_handle.query_parsed(':SENS:CURR:PROT:TRIP?', lambda reply: bool(int(reply)))
+
     def get_measurement_count(self, option=None):
         '''
         These commands are used to specify the filter count. In general, the filter count is the number of readings that
@@ -435,7 +463,64 @@ class Keithley2410:
         elif value in ['min', 'minimum']:
             self.device_handle.write(':AVER:COUN MIN')
         else:
-            print('Invalid string input.')
+            raise ValueError(f'Invalid measurement count: {value!r}')
+
+    def get_current_measure_range(self, option=None):
+        '''
+        Current measurement range.  Ranges: 1uA, 10uA, 100uA, 1mA, 20mA, 100mA, 1A.  Setting a value selects the
+        lowest range that can measure it and turns autorange off.
+
+        Full SCPI command:
+        :SENSe:CURRent:RANGe:UPPer?
+
+        :param option: <n>, def, default, max, maximum, min, minimum
+        :return:
+        '''
+        cmd = ':SENS:CURR:RANG?'
+        return self.processor_query_def_min_max(cmd, option)
+
+    def set_current_measure_range(self, value):
+        '''
+        Full SCPI command:
+        :SENSe:CURRent:RANGe:UPPer <n>
+
+        :param value: expected maximum current [A]
+        :return:
+        '''
+        self.device_handle.write(f':SENS:CURR:RANG {value}')
+
+    def set_current_measure_autorange(self, state=True):
+        '''
+        Full SCPI command:
+        :SENSe:CURRent:RANGe:AUTO <b>
+
+        :param state: bool
+        :return:
+        '''
+        self.device_handle.write(f':SENS:CURR:RANG:AUTO {"ON" if state else "OFF"}')
+
+    def get_average_state(self):
+        '''
+        0 for OFF.  1 for ON.
+
+        Full SCPI command:
+        :SENSe:AVERage:STATe?
+
+        :return:
+        '''
+        return self.device_handle.query(':AVER:STAT?')
+
+    def set_average_state(self, state=True):
+        '''
+        Enables/disables the averaging filter set by set_measurement_count.
+
+        Full SCPI command:
+        :SENSe:AVERage:STATe <b>
+
+        :param state: bool
+        :return:
+        '''
+        self.device_handle.write(f':AVER:STAT {"ON" if state else "OFF"}')
 
     def get_current_integration_time(self, option=None):
         '''
@@ -492,10 +577,111 @@ class Keithley2410:
         return self.device_handle.query(':MEAS:CURR:DC?')
 
     def get_measure_current(self):
-        return self.get_measure_voltage_current_other().split(',')[1:2][0]
+        return self.get_measure_voltage_current_and_other().split(',')[1:2][0]
 
     def get_measure_voltage(self):
-        return self.get_measure_voltage_current_other().split(',')[0:1][0]
+        return self.get_measure_voltage_current_and_other().split(',')[0:1][0]
+
+    def clear_buffer(self):
+        '''
+        Clears the readings from the buffer (pg. 398).
+
+        Full SCPI command:
+        :TRACe:CLEar
+        '''
+        self.device_handle.write(':TRAC:CLE')
+
+    def get_buffer_points(self, option=None):
+        '''
+        Full SCPI command:
+        :TRACe:POINts?
+
+        :param option: <n>, def, default, max, maximum, min, minimum
+        :return:
+        '''
+        cmd = ':TRAC:POIN?'
+        return self.processor_query_def_min_max(cmd, option)
+
+    def set_buffer_points(self, value):
+        '''
+        Buffer size, 1 to 2500 readings (pg. 398).
+
+        Full SCPI command:
+        :TRACe:POINts <n>
+
+        :param value: number of readings
+        :return:
+        '''
+        self.device_handle.write(f':TRAC:POIN {value}')
+
+    def set_buffer_feed_control(self, mode='NEXT'):
+        '''
+        NEXT — readings are stored until the buffer is full, then storage stops and the control goes back to NEVer.
+        NEVer — storage off.
+        Has to be set again for every buffer fill (pg. 399).
+
+        Full SCPI command:
+        :TRACe:FEED:CONTrol <name>
+
+        :param mode: NEXT or NEVer
+        :return:
+        '''
+        self.device_handle.write(f':TRAC:FEED:CONT {mode}')
+
+    def initiate(self):
+        '''
+        Takes the trigger model out of idle; the SourceMeter runs arm count x trigger count source-measure operations,
+        during which commands other than DCL, SDC, IFC, *RST, *TRG, GET and ABORt wait (pg. 389).
+
+        Full SCPI command:
+        :INITiate
+        '''
+        self.device_handle.write(':INIT')
+
+    def get_buffer_data(self):
+        '''
+        All readings in the buffer, in the elements set by :FORMat:ELEMents.
+
+        Full SCPI command:
+        :TRACe:DATA?
+
+        :return: numpy array of float
+        '''
+        return self.device_handle.query_parsed(':TRAC:DATA?',
+                                               lambda reply: np.array(reply.split(','), dtype=np.float64))
+
+    def get_buffer_statistic(self, name):
+        '''
+        Statistic of the readings in the buffer, calculated on the SourceMeter (pg. 400).
+
+        Full SCPI commands:
+        :CALCulate3:FORMat <name>
+        :CALCulate3:DATA?
+
+        :param name: MEAN, SDEViation, MAXimum, MINimum or PKPK
+        :return: float
+        '''
+        return self.device_handle.query_parsed(f':CALC3:FORM {name};:CALC3:DATA?',
+                                               lambda reply: float(reply.split(',')[0]))
+
+    def burst_measure(self, count, statistics=BURST_STATISTICS, fetch_data=True):
+        '''
+        count readings taken on one trigger into the buffer, fetched with one :TRAC:DATA? after *OPC? instead of count
+        queries.  Buffer, trigger count and INIT go out as one message.  Readings contain the :FORM:ELEM elements, so
+        set :FORM:ELEM CURR first for currents only.
+
+        :param count: number of readings, 1 to BUFFER_MAX_POINTS
+        :param statistics: :CALC3 statistic names calculated on the SourceMeter, () for none
+        :param fetch_data: False leaves the readings in the buffer and returns None for them
+        :return: (numpy array of readings or None, dict lower case statistic name -> float)
+        '''
+        if not 1 <= count <= BUFFER_MAX_POINTS:
+            raise ValueError(f'Burst of {count} readings, the buffer holds 1 to {BUFFER_MAX_POINTS}')
+        self.device_handle.write(f':TRAC:CLE;:TRAC:FEED SENS;:TRAC:POIN {count};:TRAC:FEED:CONT NEXT;'
+                                 f':TRIG:SEQ:COUN {count};:INIT')
+        self.operation_complete()
+        readings = self.get_buffer_data() if fetch_data else None
+        return readings, {name.lower(): self.get_buffer_statistic(name) for name in statistics}
 
     def output_on(self):
         """
@@ -557,27 +743,24 @@ class Keithley2410:
         '''
 
         :param cmd (str): SCPI command
-        :param option: <n>, def, default, max, maximum, min, minimum
+        :param option: None, def, default, max, maximum, min, minimum
         :return:
         '''
         if option is None:
             return self.device_handle.query(cmd)
 
-        try:
-            option = option.lower()
-        except Exception:
-            print('Entry does not do anything.  Set value is::')
-            return self.device_handle.query(cmd)
+        if not isinstance(option, str):
+            raise ValueError(f'Invalid option {option!r} for {cmd}, use def, max or min')
+        option = option.lower()
 
         if option in ['def', 'default']:
             return self.device_handle.query(f'{cmd} DEF')
         elif option in ['max', 'maximum']:
             return self.device_handle.query(f'{cmd} MAX')
-        elif option in ['min', 'maximum']:
+        elif option in ['min', 'minimum']:
             return self.device_handle.query(f'{cmd} MIN')
         else:
-            print('Entered string does not do anything.  Set value is:')
-            return self.device_handle.query(cmd)
+            raise ValueError(f'Invalid option {option!r} for {cmd}, use def, max or min')
 
 
 if __name__ == '__main__':
@@ -603,6 +786,7 @@ if __name__ == '__main__':
     # print(k.get_current_integration_time())
     # k.set_measurement_count(100)
     # k.set_current_integration_time(10)
+    # long runs: stability_monitor.py keeps buffered readings and min/mean/max aggregates with bounded memory and disk
     # while True:
     #     print(k.get_measure_current())
     #     print(k.get_measure_voltage())
@@ -2,6 +2,56 @@ import pyvisa
 import time
 import re
 
+from instrument_io import PolicyHandle, SMU_POLICY
+
+
+# Loaded with loadscript at connect.  One call per wavelength: set bias (nil keeps it), settle, take count readings into
+# smua.nvbuffer1 and reply "mean,std,min,max,compliance,overflows" - one short line whatever count is.
+POINT_SCRIPT_NAME = "SweepPointScript"
+POINT_SCRIPT = """
+function sweep_point(bias, settle, count)
+    if bias ~= nil then smua.source.levelv = bias end
+    if settle > 0 then delay(settle) end
+    smua.nvbuffer1.clear()
+    smua.measure.count = count
+    smua.measure.i(smua.nvbuffer1)
+    local n = smua.nvbuffer1.n
+    local sum, lo, hi, overflows = 0, smua.nvbuffer1.readings[1], smua.nvbuffer1.readings[1], 0
+    for i = 1, n do
+        local r = smua.nvbuffer1.readings[i]
+        sum = sum + r
+        if r < lo then lo = r end
+        if r > hi then hi = r end
+        if math.abs(r) >= 9.9e37 then overflows = overflows + 1 end
+    end
+    local mean, sq = sum / n, 0
+    for i = 1, n do sq = sq + (smua.nvbuffer1.readings[i] - mean) ^ 2 end
+    local std = 0
+    if n > 1 then std = math.sqrt(sq / (n - 1)) end
+    local compliance = 0
+    if smua.source.compliance then compliance = 1 end
+    print(string.format("%.7e,%.7e,%.7e,%.7e,%d,%d", mean, std, lo, hi, compliance, overflows))
+end
+"""
+
+
+def parse_readings(reply):
+    """
+    :param reply: printbuffer() output, ex. "-1.000e-06, -1.001e-06"
+    :return: list of float [A]
+    """
+    return [float(value) for value in reply.split(",")]
+
+
+def parse_point(reply):
+    """
+    :param reply: sweep_point() output "mean,std,min,max,compliance,overflows"
+    :return: dict as from Keithley2602B.smua_measure_point
+    """
+    mean, std, low, high, compliance, overflows = reply.strip().split(",")
+    return {"mean": float(mean), "std": float(std), "min": float(low), "max": float(high),
+            "compliance": compliance == "1", "overflows": int(overflows)}
+
 
 class Keithley2602B():
     """
@@ -12,13 +62,22 @@ class Keithley2602B():
         an external PC.  It is Lua-based so it's compatible w/ related programs.
     In manual ("2600BS-901-01E_Jan2019_Ref.pdf") Pg. 11 has compact list of command names and pg. 375 details commands.
     """
-    def __init__(self):
-        self.rm = pyvisa.ResourceManager()
-        print(self.rm.list_resources())
-        self.device_handle = self.rm.open_resource("GPIB0::30::INSTR") # for keithely 2602B
+    def __init__(self, resource_name="GPIB0::30::INSTR", device_handle=None, io_policy=SMU_POLICY):
+        """
+        :param resource_name: VISA resource, GPIB0::30::INSTR for the lab's keithely 2602B
+        :param device_handle: already opened resource (ex. from smu_interface.connect_smu), skips opening
+        """
+        if device_handle is None:
+            self.rm = pyvisa.ResourceManager()
+            print(self.rm.list_resources())
+            device_handle = self.rm.open_resource(resource_name)
+        else:
+            self.rm = None
+        self.device_handle = PolicyHandle(device_handle, io_policy)
 
     def __del__(self):
-        self.rm.close()
+        if self.rm is not None:
+            self.rm.close()
 
     def get_id(self):
         return self.device_handle.query("*IDN?")
@@ -98,7 +157,7 @@ class Keithley2602B():
         pg. 304 Performs 'one-shot' measurement by executing CONFigure <function> and READ?
 
         '''
-        return float(self.device_handle.query(":MEAS:CURR:DC?").split(",")[1:2][0])
+        return self.device_handle.query_parsed(":MEAS:CURR:DC?", lambda reply: float(reply.split(",")[1]))
 
     def SCPI_get_source_voltage(self):
         return self.device_handle.query(":SOURce:VOLTage:AMPLitude?").rstrip()
@@ -130,6 +189,74 @@ class Keithley2602B():
     def smub_measure_p(self):
         return self.device_handle.write("smub.measure.p()")
 
+    def smua_measure_i_clean(self):
+        """
+        One TSP current reading of smua as float.
+
+        :return: float [A]
+        """
+        return self.device_handle.query_parsed("print(smua.measure.i())", float)
+
+    def smua_measure_i_buffer(self, count):
+        """
+        Takes count current readings into smua.nvbuffer1 on the instrument and returns them with a single bus transfer
+        (one query instead of count).
+
+        :param count: number of readings, 1 to the buffer size
+        :return: list of float [A]
+        """
+        return self.device_handle.query_parsed(f"smua.nvbuffer1.clear() smua.measure.count = {int(count)} "
+                                               f"smua.measure.i(smua.nvbuffer1) "
+                                               f"printbuffer(1, smua.nvbuffer1.n, smua.nvbuffer1.readings)",
+                                               parse_readings)
+
+    def load_point_script(self):
+        """
+        Loads POINT_SCRIPT as a named script and runs it once, which defines sweep_point() on the instrument.  The
+        script stays in the run-time environment until reset or power off.
+
+        :return:
+        """
+        self.device_handle.write(f"loadscript {POINT_SCRIPT_NAME}")
+        for line in POINT_SCRIPT.strip().splitlines():
+            self.device_handle.write(line)
+        self.device_handle.write("endscript")
+        return self.device_handle.write(f"{POINT_SCRIPT_NAME}.run()")
+
+    def smua_measure_point(self, count, bias=None, settle_s=0):
+        """
+        Calls sweep_point() loaded by load_point_script(): one short exchange per point independent of count.
+
+        :param count: readings averaged on the instrument
+        :param bias: source voltage [V] set first, None keeps the present level
+        :param settle_s: wait after setting the bias [s]
+        :return: dict {"mean", "std", "min", "max"} [A], "compliance" bool, "overflows" int
+        """
+        return self.device_handle.query_parsed(f"sweep_point({'nil' if bias is None else bias}, {settle_s}, "
+                                               f"{int(count)})", parse_point)
+
+    def smua_set_source_voltage(self, voltage):
+        """
+        Sources DC volts on smua at the given level.
+
+        :param voltage: [V]
+        :return:
+        """
+        self.device_handle.write("smua.source.func = smua.OUTPUT_DCVOLTS")
+        return self.device_handle.write(f"smua.source.levelv = {voltage}")
+
+    def smua_get_source_voltage(self):
+        return self.device_handle.query_parsed("print(smua.source.levelv)", float)
+
+    def smua_get_compliance(self):
+        """
+        True if smua's source is in compliance (current limit reached), pg. 11-210.
+
+        :return: bool
+        """
+        return self.device_handle.query_parsed("print(smua.source.compliance)",
+                                               lambda reply: {"true": True, "false": False}[reply.strip().lower()])
+
     def smu_measure(self, ab, virp):
         # replace string with the faster & shorter f'smu{ab}.measure.{vip}()'
         return self.device_handle.write("smu" + str(ab) + ".measure." + str(virp) + "()")
@@ -194,6 +321,60 @@ class Keithley2602B():
     def smua_set_to_measure_current(self):
         return self.device_handle.write('smua.measure.func = smua.FUNC_DC_CURRENT')
 
+    def smua_set_measure_range_i(self, value):
+        """
+        Sets a fixed current measure range (turns autorange off).  The instrument picks the lowest range that can
+        measure the value, ex. 2e-6 selects the 10 uA range.
+
+        :param value: expected maximum current [A]
+        :return:
+        """
+        return self.device_handle.write(f'smua.measure.rangei = {value}')
+
+    def smub_set_measure_range_i(self, value):
+        return self.device_handle.write(f'smub.measure.rangei = {value}')
+
+    def smua_set_measure_autorange_i(self, state=True):
+        """
+        smua.AUTORANGE_ON or smua.AUTORANGE_OFF.  Turning autorange off keeps the present range.
+
+        :param state: bool
+        :return:
+        """
+        return self.device_handle.write(f'smua.measure.autorangei = smua.AUTORANGE_{"ON" if state else "OFF"}')
+
+    def smub_set_measure_autorange_i(self, state=True):
+        return self.device_handle.write(f'smub.measure.autorangei = smub.AUTORANGE_{"ON" if state else "OFF"}')
+
+    def smua_set_nplc(self, value):
+        """
+        Integration aperture in number of power line cycles, 0.001 to 25.  1 NPLC is 16.67 ms at 60 Hz.
+
+        :param value:
+        :return:
+        """
+        return self.device_handle.write(f'smua.measure.nplc = {value}')
+
+    def smub_set_nplc(self, value):
+        return self.device_handle.write(f'smub.measure.nplc = {value}')
+
+    def smua_set_filter_count(self, count):
+        """
+        Repeat-average filter: each returned reading is the mean of count conversions, 1 to 100.  A count of 1 turns
+        the filter off.
+
+        :param count:
+        :return:
+        """
+        self.device_handle.write(f'smua.measure.filter.count = {max(int(count), 1)}')
+        self.device_handle.write('smua.measure.filter.type = smua.FILTER_REPEAT_AVG')
+        return self.device_handle.write(f'smua.measure.filter.enable = smua.FILTER_{"ON" if count > 1 else "OFF"}')
+
+    def smub_set_filter_count(self, count):
+        self.device_handle.write(f'smub.measure.filter.count = {max(int(count), 1)}')
+        self.device_handle.write('smub.measure.filter.type = smub.FILTER_REPEAT_AVG')
+        return self.device_handle.write(f'smub.measure.filter.enable = smub.FILTER_{"ON" if count > 1 else "OFF"}')
+
 
 if __name__ == "__main__":
     k = Keithley2602B()
@@ -204,6 +385,7 @@ if __name__ == "__main__":
 
 
 
+    # long runs: stability_monitor.py keeps buffered readings and min/mean/max aggregates with bounded memory and disk
     # while True:
     #     avg_list = [k.SCPI_measure_i_clean() for i in range(0, 9)]
     #     avg = sum(avg_list) / len(avg_list)
@@ -0,0 +1,168 @@
+import multiprocessing
+import queue
+import time
+
+"""
+Live sweep view rendered in its own process.
+
+The acquisition loop only does a non-blocking put of (wavelength, current) into a multiprocessing queue, so drawing
+never adds latency to a measurement.  The plot process drains the queue in batches, blits the line artist onto a cached
+background and min/max-decimates the line once there are more points than pixels worth drawing.
+"""
+
+
+def decimate_min_max(x, y, max_points):
+    """
+    Reduces a line to at most ~max_points points while keeping each bucket's minimum and maximum, so spikes and dropouts
+    stay visible.
+
+    :param x: 1D numpy array
+    :param y: 1D numpy array, same length as x
+    :param max_points: target number of points
+    :return: (x, y) decimated numpy arrays in original order
+    """
+    import numpy as np
+
+    n = len(x)
+    if n <= max_points or max_points < 4:
+        return x, y
+
+    bucket_size = -(-n // (max_points // 2))  # ceil
+    buckets = -(-n // bucket_size)
+    padded = buckets * bucket_size
+    y_padded = np.concatenate([y, np.full(padded - n, np.nan)]).reshape(buckets, bucket_size)
+
+    starts = np.arange(buckets) * bucket_size
+    i_min = starts + np.nanargmin(y_padded, axis=1)
+    i_max = starts + np.nanargmax(y_padded, axis=1)
+    keep = np.unique(np.concatenate([i_min, i_max]))
+    return x[keep], y[keep]
+
+
+def _run_live_plot(data_queue, title, max_points, refresh_s):
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    wavelengths = []
+    currents = []
+
+    fig, ax = plt.subplots()
+    ax.set_title(title)
+    ax.set_xlabel("Wavelength [nm]")
+    ax.set_ylabel("Rev Bias Current [mA?]")
+    ax.grid(True)
+    (line,) = ax.plot([], [], "ro-", markersize=3, animated=True)
+    plt.show(block=False)
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(ax.bbox)
+
+    finished = False
+    while not finished:
+        new_points = 0
+        deadline = time.monotonic() + refresh_s
+        while time.monotonic() < deadline:
+            try:
+                item = data_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                finished = True
+                break
+            wavelengths.append(item[0])
+            currents.append(item[1])
+            new_points += 1
+
+        if new_points:
+            x, y = decimate_min_max(np.asarray(wavelengths, dtype=float), np.asarray(currents, dtype=float),
+                                    max_points)
+            x_lo, x_hi = ax.get_xlim()
+            y_lo, y_hi = ax.get_ylim()
+            if x.min() < x_lo or x.max() > x_hi or y.min() < y_lo or y.max() > y_hi or len(wavelengths) == new_points:
+                # limits changed, full redraw once and cache the new background
+                ax.set_xlim(*_padded_limits(x))
+                ax.set_ylim(*_padded_limits(y))
+                fig.canvas.draw()
+                background = fig.canvas.copy_from_bbox(ax.bbox)
+
+            line.set_data(x, y)
+            fig.canvas.restore_region(background)
+            ax.draw_artist(line)
+            fig.canvas.blit(ax.bbox)
+
+        fig.canvas.flush_events()
+        if not plt.fignum_exists(fig.number):
+            return
+
+    # sweep done, leave a normal (non-animated) figure open until the user closes it
+    line.set_animated(False)
+    fig.canvas.draw()
+    plt.show()
+
+
+def _padded_limits(values, fraction=0.05):
+    lo = float(values.min())
+    hi = float(values.max())
+    pad = (hi - lo) * fraction or abs(hi) * fraction or 1.0
+    return lo - pad, hi + pad
+
+
+class LivePlotter:
+    """
+    Ex.
+        live = LivePlotter("main_v4_red_0V_")
+        live.start()
+        for ...:
+            live.add_point(wavelength, current)
+        live.close()
+    """
+    def __init__(self, title="Rev Bias Current vs. Wavelength", max_points=2000, refresh_s=0.1, queue_size=100000):
+        self.title = title
+        self.max_points = max_points
+        self.refresh_s = refresh_s
+        self.queue = multiprocessing.Queue(queue_size)
+        self.process = None
+        self.dropped_points = 0
+
+    def start(self):
+        self.process = multiprocessing.Process(target=_run_live_plot,
+                                               args=(self.queue, self.title, self.max_points, self.refresh_s))
+        self.process.start()
+        return self
+
+    def add_point(self, wavelength, current):
+        """
+        Never blocks.  If the plot process falls behind and the queue is full, the point is dropped from the live view
+        only (the sweep data is unaffected).
+        """
+        try:
+            self.queue.put_nowait((float(wavelength), float(current)))
+        except queue.Full:
+            self.dropped_points += 1
+
+    def close(self):
+        """
+        Tells the plot process the sweep is done.  The window stays open until closed by the user.
+        """
+        if self.process is None:
+            return
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            self.process.terminate()
+
+    def join(self, timeout=None):
+        if self.process is not None:
+            self.process.join(timeout)
+
+
+if __name__ == "__main__":
+    import math
+    import random
+
+    live = LivePlotter("Live plot demo").start()
+    for i in range(3000):
+        wl = 400 + i * 0.2
+        live.add_point(wl, math.exp(-((wl - 700) / 80) ** 2) + random.gauss(0, 0.02))
+        time.sleep(0.002)
+    live.close()
+    live.join()
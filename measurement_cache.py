@@ -0,0 +1,148 @@
+import argparse
+import sqlite3
+import time
+
+"""
+Point-level measurement cache shared across sweeps.
+
+A point measured once is reused by later sweeps with the same device, bias, grating and SMU averaging settings
+(NPLC, filter count, readings per point) at the same wavelength, as long as it is younger than max_age_s.  The sweep
+then only moves to and measures the points that are missing or expired; served points are marked in the "cached"
+column of the sweep.  Points in compliance or over range are never stored.
+
+Stored in one SQLite file.  Keys are exact: wavelength in pm and bias in uV, rounded.  Entries older than max_age_s
+are deleted by evict(), and beyond max_entries the oldest entries go first.
+
+Ex.
+    cache = MeasurementCache("point_cache.sqlite", "red_diode", bias=-2, settings=settings_key(1, 1, 9))
+    df = run_sweep(..., cache=cache)
+    cache.evict()
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS points (
+    device TEXT NOT NULL,
+    bias_uv INTEGER NOT NULL,
+    grating INTEGER NOT NULL,
+    settings TEXT NOT NULL,
+    wavelength_pm INTEGER NOT NULL,
+    wavelength REAL NOT NULL,
+    mean REAL NOT NULL,
+    std REAL,
+    min REAL,
+    max REAL,
+    measured REAL NOT NULL,
+    PRIMARY KEY (device, bias_uv, grating, settings, wavelength_pm)
+);
+CREATE INDEX IF NOT EXISTS points_measured ON points (measured);
+"""
+
+
+def settings_key(nplc=None, filter_count=None, readings=None):
+    """
+    :return: string identifying the SMU averaging settings, part of the cache key
+    """
+    return f"nplc={nplc},filter={filter_count},readings={readings}"
+
+
+class MeasurementCache:
+    """
+    Cache view for one device, bias and settings combination.
+
+    :param path: SQLite file, created if missing
+    :param device: device name/ID
+    :param bias: source voltage [V]
+    :param settings: settings_key(...) of the sweep
+    :param max_age_s: points older than this [s] are re-measured
+    :param max_entries: entries kept in the file (all devices) by evict()
+    """
+    def __init__(self, path, device, bias, settings, max_age_s=3600, max_entries=100000):
+        self.path = path
+        self.device = device
+        self.bias_uv = round(bias * 1e6)
+        self.settings = settings
+        self.max_age_s = max_age_s
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def _key(self, wavelength, grating):
+        return self.device, self.bias_uv, int(grating), self.settings, round(wavelength * 1000)
+
+    def lookup(self, wavelength, grating):
+        """
+        :param wavelength: scheduled wavelength [nm]
+        :param grating: grating the point is measured with, the installed one if the sweep leaves the grating alone
+        :return: dict {"wavelength" (read back), "mean", "std", "min", "max", "age_s"} or None if missing or expired
+        """
+        row = self.connection.execute(
+            "SELECT wavelength, mean, std, min, max, measured FROM points WHERE device = ? AND bias_uv = ? "
+            "AND grating = ? AND settings = ? AND wavelength_pm = ?", self._key(wavelength, grating)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        age_s = time.time() - row[5]
+        if age_s > self.max_age_s:
+            self.expired += 1
+            return None
+        self.hits += 1
+        return {"wavelength": row[0], "mean": row[1], "std": row[2], "min": row[3], "max": row[4], "age_s": age_s}
+
+    def store(self, wavelength, grating, wavelength_read_back, point):
+        """
+        :param wavelength: scheduled wavelength [nm]
+        :param grating: see lookup
+        :param wavelength_read_back: chromometer wavelength after the move [nm]
+        :param point: statistics dict as from smu_interface.SourceMeter.measure_point
+        """
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                    self._key(wavelength, grating) + (wavelength_read_back, point["mean"],
+                                                                      point["std"], point["min"], point["max"],
+                                                                      time.time()))
+
+    def evict(self):
+        """
+        Deletes entries older than max_age_s, then the oldest ones beyond max_entries.
+
+        :return: number of entries deleted
+        """
+        with self.connection:
+            deleted = self.connection.execute("DELETE FROM points WHERE measured < ?",
+                                              (time.time() - self.max_age_s,)).rowcount
+            deleted += self.connection.execute(
+                "DELETE FROM points WHERE rowid IN (SELECT rowid FROM points ORDER BY measured DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)).rowcount
+        return deleted
+
+    def report(self):
+        return {"hits": self.hits, "misses": self.misses, "expired": self.expired}
+
+    def close(self):
+        self.connection.close()
+
+
+def arg_handler(argv=None):
+    parser = argparse.ArgumentParser(description="Show or evict a point measurement cache.")
+    parser.add_argument("cache")
+    parser.add_argument("--evict", action="store_true", help="Delete expired entries and entries beyond --max-entries.")
+    parser.add_argument("--max-age", type=float, default=3600, help="Validity window [s].")
+    parser.add_argument("--max-entries", type=int, default=100000, help="Entries kept.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = arg_handler()
+    cache = MeasurementCache(args.cache, None, 0, None, args.max_age, args.max_entries)
+    if args.evict:
+        print("Evicted", cache.evict(), "entries")
+    rows = cache.connection.execute("SELECT device, bias_uv, grating, settings, COUNT(*), MIN(wavelength), "
+                                    "MAX(wavelength), MAX(measured) FROM points "
+                                    "GROUP BY device, bias_uv, grating, settings").fetchall()
+    for device, bias_uv, grating, settings, count, wl_min, wl_max, measured in rows:
+        print(f"{device}  {bias_uv / 1e6:g} V  grating {grating}  {settings}: {count} points {wl_min:.2f}-"
+              f"{wl_max:.2f} nm, newest {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(measured))}")
+    cache.close()
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+from sweep_engine import run_sweep
+
+"""
+Repeat-pass sweeps: the same schedule measured several times, alternating direction so no pass starts with a rewind
+(and the grating in position at the end of one pass is the first one needed by the next).  Every point is folded into
+per-wavelength running mean/variance (Welford) as it arrives, so memory is O(points) whatever the number of passes,
+and the result is one sweep with standard error and 95 % confidence interval per wavelength.
+
+Optional outlier rejection: once a wavelength has min_count accepted readings (5 by default, so from the sixth pass on),
+a reading further than reject_sigma standard deviations from its running mean is counted as rejected and not folded in
+(ex. a lamp flicker during one pass).  The minimum keeps the standard deviation estimate from being too noisy: from 2
+readings (1 degree of freedom) a 3 sigma test rejects about a quarter of clean Gaussian readings, and since rejected
+readings never enter the estimate the error would feed on itself.  The threshold is also widened to a prediction
+interval (sqrt(1 + 1/n) and the t/normal ratio for n - 1 degrees of freedom); with both, clean Gaussian readings are
+rejected at roughly 0.2-0.9 % at 3 sigma over 6-20 passes.  A median/MAD test per pass would be more robust from fewer
+passes but needs every reading kept, O(points x passes).
+
+Ex.
+    df = run_passes(chromometer, keithley, schedule, passes=5, reject_sigma=4)
+"""
+
+# two-sided 95 % Student t critical values for 1..30 degrees of freedom, 1.96 above
+T_CRITICAL_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228, 2.201, 2.179, 2.160, 2.145,
+                 2.131, 2.120, 2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048,
+                 2.045, 2.042]
+
+
+def t_critical_95(degrees_of_freedom):
+    """
+    :param degrees_of_freedom: array of int
+    :return: array, NaN where degrees_of_freedom < 1
+    """
+    dof = np.asarray(degrees_of_freedom)
+    table = np.array([np.nan] + T_CRITICAL_95)
+    return np.where(dof > len(T_CRITICAL_95), 1.96, table[np.clip(dof, 0, len(T_CRITICAL_95))])
+
+
+class PointAccumulator:
+    """
+    Welford running mean and variance for a fixed number of points.
+
+    :param points: number of points per pass
+    :param reject_sigma: reject readings this many standard deviations from the running mean, None keeps all
+    :param min_count: accepted readings a point needs before rejection applies, see the module docstring
+    """
+    def __init__(self, points, reject_sigma=None, min_count=5):
+        self.count = np.zeros(points, dtype=np.int64)
+        self.mean = np.zeros(points, dtype=np.float64)
+        self.m2 = np.zeros(points, dtype=np.float64)
+        self.rejected = np.zeros(points, dtype=np.int64)
+        self.wavelength_mean = np.zeros(points, dtype=np.float64)
+        self.reject_sigma = reject_sigma
+        self.min_count = min_count
+
+    def add(self, index, value, wavelength):
+        """
+        :return: False if the value was rejected as an outlier
+        """
+        n = self.count[index]
+        if self.reject_sigma is not None and n >= self.min_count:
+            std = np.sqrt(self.m2[index] / (n - 1))
+            # spread of a new reading around a mean estimated from n readings, widened for the few degrees of freedom
+            scale = np.sqrt(1 + 1 / n) * t_critical_95(n - 1) / 1.96
+            if abs(value - self.mean[index]) > self.reject_sigma * std * scale:
+                self.rejected[index] += 1
+                return False
+
+        n += 1
+        delta = value - self.mean[index]
+        self.mean[index] += delta / n
+        self.m2[index] += delta * (value - self.mean[index])
+        self.wavelength_mean[index] += (wavelength - self.wavelength_mean[index]) / n
+        self.count[index] = n
+        return True
+
+    def std(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, np.sqrt(self.m2 / np.maximum(self.count - 1, 1)), np.nan)
+
+    def standard_error(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.std() / np.sqrt(self.count)
+
+    def to_dataframe(self):
+        """
+        :return: DataFrame with the sweep columns ("wl_chromometer_list" is the mean read-back wavelength,
+            "rev_bias_list" the mean current) plus "std", "sem", "ci95_low", "ci95_high", "passes", "rejected"
+        """
+        half_width = t_critical_95(self.count - 1) * self.standard_error()
+        return pd.DataFrame({"wl_chromometer_list": self.wavelength_mean,
+                             "rev_bias_list": self.mean,
+                             "std": self.std(),
+                             "sem": self.standard_error(),
+                             "ci95_low": self.mean - half_width,
+                             "ci95_high": self.mean + half_width,
+                             "passes": self.count,
+                             "rejected": self.rejected})
+
+
+def run_passes(chromometer, keithley, schedule, passes=3, reject_sigma=None, min_count=5, on_point=None,
+               **sweep_settings):
+    """
+    :param schedule: list of (grating or None, wavelength) from sweep_engine.grating_schedule
+    :param passes: number of passes, odd passes run the schedule backwards
+    :param reject_sigma: see PointAccumulator
+    :param min_count: see PointAccumulator
+    :param on_point: optional callback on_point(index, wavelength, current) for every raw point of every pass
+    :param sweep_settings: passed to sweep_engine.run_sweep (scan_speed, readings_per_point, predictor, live...)
+    :return: aggregated DataFrame in schedule order, see PointAccumulator.to_dataframe (with "grating" if the
+        schedule sets gratings)
+    """
+    accumulator = PointAccumulator(len(schedule), reject_sigma, min_count)
+    current_grating = sweep_settings.pop("current_grating", None)
+
+    for pass_number in range(passes):
+        backwards = pass_number % 2 == 1
+        pass_schedule = schedule[::-1] if backwards else schedule
+        print(f"Pass {pass_number + 1}/{passes}", "backwards" if backwards else "forwards")
+
+        def fold(index, wavelength, current, backwards=backwards):
+            if not accumulator.add(len(schedule) - 1 - index if backwards else index, current, wavelength):
+                print("Rejected outlier", current, "A at", wavelength, "nm")
+            if on_point is not None:
+                on_point(index, wavelength, current)
+
+        run_sweep(chromometer, keithley, pass_schedule, current_grating=current_grating, on_point=fold,
+                  **sweep_settings)
+        if pass_schedule[-1][0] is not None:
+            current_grating = pass_schedule[-1][0]
+
+    df = accumulator.to_dataframe()
+    if schedule and schedule[0][0] is not None:
+        df = df.assign(grating=[grating for grating, wavelength in schedule])
+    print("Rejected outliers:", int(accumulator.rejected.sum()))
+    return df
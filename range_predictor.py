@@ -0,0 +1,104 @@
+import bisect
+
+"""
+Predicts a fixed current measure range per wavelength so the SMU does not autorange at every point.
+
+The wavelength -> current table comes from a previous sweep of the same device/bias (CSV or SweepArchive run) and/or
+is learned online from the points already measured in this sweep (ex. the coarse points around a fine window).
+"""
+
+# lowest to highest current measure range [A]
+RANGES_2602B = [100e-9, 1e-6, 10e-6, 100e-6, 1e-3, 10e-3, 100e-3, 1.0, 1.5, 3.0]
+RANGES_2410 = [1e-6, 10e-6, 100e-6, 1e-3, 20e-3, 100e-3, 1.0]
+
+OVERFLOW_READING = 9.9e37  # both SMUs return +/-9.9e37 (2602B: 9.91e37) for an over-range reading
+
+
+class RangePredictor:
+    """
+    Ex.
+        predictor = RangePredictor(RANGES_2602B).load_csv("main_v4_red_0V_2024-05-01_10-00-00.csv")
+        fixed_range = predictor.range_for(650)   # None -> no data, use autorange
+        ...
+        predictor.update(650, measured_current)
+    """
+    def __init__(self, ranges=RANGES_2602B, headroom=2.0):
+        """
+        :param ranges: available current measure ranges [A], ascending
+        :param headroom: predicted |current| is multiplied by this before picking a range, covers drift between
+            sweeps and the change between neighbouring wavelengths
+        """
+        self.ranges = sorted(ranges)
+        self.headroom = headroom
+        self.wavelengths = []
+        self.currents = []
+
+    def load_sweep(self, wavelengths, currents):
+        for wavelength, current in zip(wavelengths, currents):
+            self.update(wavelength, current)
+        return self
+
+    def load_csv(self, path):
+        import pandas as pd
+
+        df = pd.read_csv(path)
+        return self.load_sweep(df["wl_chromometer_list"], df["rev_bias_list"])
+
+    def update(self, wavelength, current):
+        """
+        Adds or replaces the current seen at a wavelength.  Over-range readings are ignored.
+        """
+        wavelength = float(wavelength)
+        current = abs(float(current))
+        if current >= OVERFLOW_READING or current != current:
+            return
+
+        i = bisect.bisect_left(self.wavelengths, wavelength)
+        if i < len(self.wavelengths) and self.wavelengths[i] == wavelength:
+            self.currents[i] = current
+        else:
+            self.wavelengths.insert(i, wavelength)
+            self.currents.insert(i, current)
+
+    def expected_current(self, wavelength):
+        """
+        Largest |current| of the known neighbours on either side of the wavelength (conservative, never interpolates
+        below a neighbour).
+
+        :return: float [A] or None if the table is empty
+        """
+        if not self.wavelengths:
+            return None
+        i = bisect.bisect_left(self.wavelengths, wavelength)
+        neighbours = self.currents[max(i - 1, 0):i + 1]
+        return max(neighbours)
+
+    def range_for(self, wavelength):
+        """
+        :return: smallest range covering the expected current times headroom, or None if nothing is known
+        """
+        expected = self.expected_current(wavelength)
+        if expected is None:
+            return None
+        return self.range_for_current(expected * self.headroom)
+
+    def range_for_current(self, current):
+        for measure_range in self.ranges:
+            if abs(current) <= measure_range:
+                return measure_range
+        return self.ranges[-1]
+
+
+def is_overflow(reading, measure_range=None):
+    """
+    True if the reading is over range for a fixed range (or the SMU reported overflow), i.e. the point must be
+    re-measured with autorange.
+
+    :param reading: current [A]
+    :param measure_range: fixed range in use [A], None when autoranging
+    :return: bool
+    """
+    reading = abs(reading)
+    if reading >= OVERFLOW_READING:
+        return True
+    return measure_range is not None and reading > measure_range
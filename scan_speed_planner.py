@@ -0,0 +1,95 @@
+"""
+Per-move scan speed for the chromometer.
+
+A sweep used to run every move at one fixed scan speed (300 nm/min), so a 500 nm rewind or a jump from the coarse to
+the fine segment waited as long per nm as a 1 nm step.  The planner slews long moves at a fast speed and, if asked,
+covers the last approach_nm at the normal step speed so the final position is reached the same way a step would.
+
+Speed changes go through a cached state: "NM/MIN" is only sent when the speed really changes, not on every move.
+
+Ex.
+    planner = ScanSpeedPlanner(step_speed=300, slew_speed=3000, slew_threshold_nm=20, approach_nm=5)
+    for wavelength, speed in planner.plan_move(400, 1100):
+        planner.apply_speed(chromometer, speed)
+        chromometer.set_wavelength_nm(wavelength)
+    print(planner.report())
+"""
+
+BASELINE_SPEED = 300  # [nm/min] fixed speed the sweep used before
+SAFETY_FACTOR = 1.2  # wait = travel time * SAFETY_FACTOR, as in sweep_engine.move_to_wavelength
+
+
+def move_time_s(distance_nm, speed):
+    """
+    :return: wait for a move of distance_nm at speed [nm/min], with the sweep's safety factor [s]
+    """
+    return 60 * abs(distance_nm) / speed * SAFETY_FACTOR
+
+
+class ScanSpeedPlanner:
+    """
+    :param step_speed: speed for moves up to slew_threshold_nm and for the final approach [nm/min]
+    :param slew_speed: speed for longer moves [nm/min]
+    :param slew_threshold_nm: moves longer than this use slew_speed
+    :param approach_nm: final part of a slewed move done at step_speed, 0 slews all the way
+    """
+    def __init__(self, step_speed=BASELINE_SPEED, slew_speed=3000, slew_threshold_nm=20, approach_nm=0):
+        if approach_nm >= slew_threshold_nm:
+            raise ValueError("approach_nm must be smaller than slew_threshold_nm")
+        self.step_speed = step_speed
+        self.slew_speed = slew_speed
+        self.slew_threshold_nm = slew_threshold_nm
+        self.approach_nm = approach_nm
+        self.current_speed = None  # last speed sent, None until the first change
+        self.speed_changes = 0
+        self.moves = 0
+        self.planned_s = 0.0
+        self.baseline_s = 0.0
+
+    def plan_move(self, start, target):
+        """
+        Splits a move into legs and adds its planned and baseline times to the totals.
+
+        :param start: wavelength now [nm]
+        :param target: destination [nm]
+        :return: list of (wavelength, speed [nm/min]) legs in order
+        """
+        distance = abs(target - start)
+        if distance <= self.slew_threshold_nm:
+            legs = [(target, self.step_speed)]
+        elif self.approach_nm > 0:
+            direction = 1 if target > start else -1
+            legs = [(target - direction * self.approach_nm, self.slew_speed), (target, self.step_speed)]
+        else:
+            legs = [(target, self.slew_speed)]
+
+        position = start
+        for wavelength, speed in legs:
+            self.planned_s += move_time_s(wavelength - position, speed)
+            position = wavelength
+        self.baseline_s += move_time_s(distance, BASELINE_SPEED)
+        self.moves += 1
+        return legs
+
+    def apply_speed(self, chromometer, speed):
+        """
+        Sends the speed only if it differs from the last one sent.
+
+        :return: True if a command was sent
+        """
+        if speed == self.current_speed:
+            return False
+        chromometer.set_scan_speed_nm_p_min(speed)
+        self.current_speed = speed
+        self.speed_changes += 1
+        return True
+
+    def report(self):
+        """
+        :return: dict with planned and fixed-300 nm/min move times [s], time saved [s], moves and speed changes sent
+        """
+        return {"moves": self.moves,
+                "speed_changes": self.speed_changes,
+                "planned_s": round(self.planned_s, 1),
+                "baseline_s": round(self.baseline_s, 1),
+                "saved_s": round(self.baseline_s - self.planned_s, 1)}
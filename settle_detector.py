@@ -0,0 +1,74 @@
+import math
+import time
+
+"""
+Decides when the photocurrent has settled after a chromometer move, instead of waiting a fixed speed-derived time.
+
+The SMU is sampled every interval_s; once the last window readings are flat (least-squares drift across the window)
+and quiet (standard deviation), both within tolerance = relative_tolerance * |mean| + absolute_tolerance, the point is
+measured.  Gives up waiting after max_wait_s.
+
+Ex.
+    detector = SettleDetector(window=5, interval_s=0.05, max_wait_s=5)
+    settle_s, settled = detector.wait(keithley.measure_current)
+"""
+
+
+def window_drift_and_std(times, values):
+    """
+    :return: (|least-squares slope| * window duration, sample standard deviation)
+    """
+    n = len(values)
+    mean_t = sum(times) / n
+    mean_v = sum(values) / n
+    var_t = sum((t - mean_t) ** 2 for t in times)
+    slope = sum((t - mean_t) * (v - mean_v) for t, v in zip(times, values)) / var_t if var_t > 0 else 0.0
+    std = math.sqrt(sum((v - mean_v) ** 2 for v in values) / (n - 1)) if n > 1 else 0.0
+    return abs(slope) * (times[-1] - times[0]), std
+
+
+class SettleDetector:
+    """
+    :param window: readings in the sliding window, at least 3
+    :param interval_s: pause between readings [s] on top of the reading time itself
+    :param max_wait_s: measure anyway after this long [s]
+    :param relative_tolerance: allowed drift and noise relative to |mean|
+    :param absolute_tolerance: floor [A] so dark-level points can settle
+    """
+    def __init__(self, window=5, interval_s=0.05, max_wait_s=5.0, relative_tolerance=0.01,
+                 absolute_tolerance=1e-11):
+        if window < 3:
+            raise ValueError("window needs at least 3 readings")
+        self.window = window
+        self.interval_s = interval_s
+        self.max_wait_s = max_wait_s
+        self.relative_tolerance = relative_tolerance
+        self.absolute_tolerance = absolute_tolerance
+        self.timeouts = 0
+
+    def is_settled(self, times, values):
+        if len(values) < self.window:
+            return False
+        times, values = times[-self.window:], values[-self.window:]
+        drift, std = window_drift_and_std(times, values)
+        tolerance = self.relative_tolerance * abs(sum(values) / len(values)) + self.absolute_tolerance
+        return drift <= tolerance and std <= tolerance
+
+    def wait(self, measure):
+        """
+        :param measure: callable returning one current reading [A]
+        :return: (settle time [s] from the call until the test passed or max_wait_s ran out, True if it passed)
+        """
+        start = time.monotonic()
+        times = []
+        values = []
+        while True:
+            values.append(measure())
+            times.append(time.monotonic())
+            if self.is_settled(times, values):
+                return times[-1] - start, True
+            if times[-1] - start >= self.max_wait_s:
+                self.timeouts += 1
+                return times[-1] - start, False
+            del times[:-self.window], values[:-self.window]
+            time.sleep(self.interval_s)
@@ -0,0 +1,306 @@
+import math
+import random
+import re
+import time
+
+"""
+Simulated VISA resources for the SP-2150i chromometer, Keithley 2602B and Keithley 2410.
+
+They answer the commands the drivers in this repo send, with reply formats copied from the real instruments, so the
+drivers, sweep engine, queue and acquisition server can run without the bench.  The SMU current follows the
+chromometer's wavelength through a simple photodiode model.
+
+Ex.
+    chromometer, smu = connect_simulated()
+"""
+
+
+class SimulatedChromometerHandle:
+    """
+    :param move_time_scale: 1 sleeps the real travel time of a move, 0 moves instantly
+    """
+    def __init__(self, wavelength=500.0, scan_speed=100.0, grating=1, move_time_scale=0.0):
+        self.wavelength = wavelength
+        self.scan_speed = scan_speed
+        self.grating = grating
+        self.turret = 1
+        self.move_time_scale = move_time_scale
+        self.gratings = [(1, 1200, "500NM"), (2, 600, "1.0UM")]
+        self.timeout = 2000
+        self._pending = []
+        self._move = None  # (start wavelength, target, start time, end time) of a >NM move
+
+    def write(self, command):
+        command = command.strip()
+        if command == "?GRATINGS":
+            self._pending = [" ?GRATINGS"]
+            for position in range(1, 7):
+                installed = [g for g in self.gratings if g[0] == position]
+                if installed:
+                    marker = "\x1a" if position == self.grating else " "
+                    self._pending.append(f" {marker}{position}  {installed[0][1]} g/mm BLZ=  {installed[0][2]}")
+                else:
+                    self._pending.append(f"  {position}  Not Installed")
+            self._pending.append(" ok")
+        else:
+            self._pending = [self._execute(command)]
+
+    def read(self):
+        if not self._pending:
+            raise TimeoutError("simulated read timeout")
+        return self._pending.pop(0)
+
+    def query(self, command):
+        self.write(command)
+        return self.read()
+
+    def clear(self):
+        self._pending = []
+
+    def close(self):
+        pass
+
+    def _current_wavelength(self):
+        if self._move is None:
+            return self.wavelength
+        start_wl, target, start, end = self._move
+        if time.monotonic() >= end:
+            self.wavelength = target
+            self._move = None
+            return target
+        return start_wl + (target - start_wl) * (time.monotonic() - start) / (end - start)
+
+    def _travel_s(self, target):
+        return 60 * abs(target - self._current_wavelength()) / self.scan_speed * self.move_time_scale
+
+    def _execute(self, command):
+        if command == "?NM":
+            return f"?NM {self._current_wavelength():.3f} nm  ok"
+        if command == "?NM/MIN":
+            return f"?NM/MIN {self.scan_speed:.3f} nm/min  ok"
+        if command == "?GRATING":
+            return f"?GRATING {self.grating}  ok"
+        if command == "?TURRET":
+            return f"?TURRET {self.turret}  ok"
+        if command == "MONO-?DONE":
+            self._current_wavelength()  # ends the move once its time is up
+            moving = self._move is not None
+            return f"MONO-?DONE {0 if moving else 1}  ok"
+        if command == "MONO-STOP":
+            self.wavelength = self._current_wavelength()
+            self._move = None
+            return "MONO-STOP  ok"
+
+        match = re.fullmatch(r"([\d.]+) ?(NM/MIN|>NM|NM|GRATING|TURRET)", command)
+        if match is None:
+            return f"{command} ?"
+        value, name = float(match.group(1)), match.group(2)
+
+        if name == "NM/MIN":
+            self.scan_speed = value
+        elif name == "NM":
+            time.sleep(self._travel_s(value))
+            self.wavelength = value
+            self._move = None
+        elif name == ">NM":
+            travel = self._travel_s(value)
+            now = time.monotonic()
+            self._move = (self._current_wavelength(), value, now, now + travel)
+        elif name == "GRATING":
+            time.sleep(20 * self.move_time_scale)
+            self.grating = int(value)
+        elif name == "TURRET":
+            self.turret = int(value)
+        return f"{command}  ok"
+
+
+class _SimulatedSMUHandle:
+    """
+    Photodiode model: responsivity peak at peak_nm, Gaussian in wavelength, plus dark current and Gaussian noise.
+    """
+    def __init__(self, light=None, peak_current=1e-6, peak_nm=650.0, width_nm=120.0, dark_current=1e-10,
+                 noise=1e-10, reading_time_s=0.0):
+        self.light = light
+        self.peak_current = peak_current
+        self.peak_nm = peak_nm
+        self.width_nm = width_nm
+        self.dark_current = dark_current
+        self.noise = noise
+        self.reading_time_s = reading_time_s
+        self.source_voltage = 0.0
+        self.output = False
+        self.timeout = 2000
+        self._pending = []
+
+    def photocurrent(self):
+        wavelength = self.light._current_wavelength() if self.light is not None else self.peak_nm
+        signal = self.peak_current * math.exp(-((wavelength - self.peak_nm) / self.width_nm) ** 2)
+        # reverse bias current, negative like on the bench
+        return -(signal + self.dark_current) + random.gauss(0, self.noise)
+
+    def readings(self, count):
+        time.sleep(self.reading_time_s * count)
+        return [self.photocurrent() for i in range(count)]
+
+    def read(self):
+        if not self._pending:
+            raise TimeoutError("simulated read timeout")
+        return self._pending.pop(0)
+
+    def query(self, command):
+        self.write(command)
+        return self.read()
+
+    def clear(self):
+        self._pending = []
+
+    def close(self):
+        pass
+
+
+class SimulatedKeithley2602BHandle(_SimulatedSMUHandle):
+    def __init__(self, light=None, **model):
+        super().__init__(light, **model)
+        self.measure_count = 1
+        self.loading_script = False  # between loadscript and endscript, lines are stored not run
+
+    def write(self, command):
+        command = command.strip()
+        if command == "*IDN?":
+            self._pending.append("Keithley Instruments Inc., Model 2602B, 0000000, 3.0.0 (simulated)")
+            return
+        if command.startswith("loadscript"):
+            self.loading_script = True
+            return
+        if self.loading_script:
+            self.loading_script = command != "endscript"
+            return
+
+        point = re.fullmatch(r"sweep_point\((\S+), (\S+), (\d+)\)", command)
+        if point:
+            self._sweep_point(*point.groups())
+            return
+
+        for statement in re.findall(r"print\(.*\)|smua\.\w+(?:\.\w+)* = [^ ]+|\w+\([^)]*\)", command):
+            self._statement(statement)
+
+    def _sweep_point(self, bias, settle, count):
+        """
+        Same reply as the sweep_point() TSP routine of keithley_2602B_driver.POINT_SCRIPT.
+        """
+        if bias != "nil":
+            self.source_voltage = float(bias)
+        time.sleep(float(settle))
+        readings = self.readings(int(count))
+        n = len(readings)
+        mean = sum(readings) / n
+        std = math.sqrt(sum((r - mean) ** 2 for r in readings) / (n - 1)) if n > 1 else 0.0
+        self._pending.append(f"{mean:.7e},{std:.7e},{min(readings):.7e},{max(readings):.7e},0,0")
+
+    def _statement(self, statement):
+        assignment = re.fullmatch(r"smua\.([\w.]+) = (.+)", statement)
+        if assignment:
+            name, value = assignment.groups()
+            if name == "source.levelv":
+                self.source_voltage = float(value)
+            elif name == "measure.count":
+                self.measure_count = int(value)
+            elif name == "source.output":
+                self.output = value.endswith("OUTPUT_ON")
+        elif statement.startswith("printbuffer"):
+            self._pending.append(", ".join(f"{value:.6e}" for value in self.readings(self.measure_count)))
+        elif statement == "print(smua.measure.i())":
+            self._pending.append(f"{self.readings(1)[0]:.6e}")
+        elif statement == "print(smua.source.compliance)":
+            self._pending.append("false")
+        elif statement == "print(smua.source.levelv)":
+            self._pending.append(f"{self.source_voltage:.6e}")
+
+
+class SimulatedKeithley2410Handle(_SimulatedSMUHandle):
+    def __init__(self, light=None, **model):
+        super().__init__(light, **model)
+        self.trigger_count = 1
+        self.buffer_points = 100
+        self.buffer_feed = False
+        self.buffer = []
+        self.statistic = "MEAN"
+
+    def write(self, command):
+        # SCPI messages can hold several commands separated by ";"
+        for part in command.strip().split(";"):
+            self._command(part.strip())
+
+    def _command(self, command):
+        if command == "*IDN?":
+            self._pending.append("KEITHLEY INSTRUMENTS INC.,MODEL 2410,0000000,C34 (simulated)")
+        elif command == "*OPC?":
+            self._pending.append("1")
+        elif command in (":READ?", ":MEAS:CURR:DC?"):
+            count = self.trigger_count if command == ":READ?" else 1
+            self._pending.append(",".join(f"{value:+.6E}" for value in self.readings(count)))
+        elif command == ":INIT":
+            readings = self.readings(self.trigger_count)
+            if self.buffer_feed:
+                self.buffer = (self.buffer + readings)[:self.buffer_points]
+                self.buffer_feed = len(self.buffer) < self.buffer_points
+        elif command == ":TRAC:CLE":
+            self.buffer = []
+        elif command.startswith(":TRAC:POIN "):
+            self.buffer_points = int(float(command.split()[-1]))
+        elif command.startswith(":TRAC:FEED:CONT "):
+            self.buffer_feed = command.endswith("NEXT")
+        elif command == ":TRAC:DATA?":
+            self._pending.append(",".join(f"{value:+.6E}" for value in self.buffer))
+        elif command.startswith(":CALC3:FORM "):
+            self.statistic = command.split()[-1]
+        elif command == ":CALC3:DATA?":
+            self._pending.append(f"{self._statistic():+.6E}")
+        elif command == ":SENS:CURR:PROT:TRIP?":
+            self._pending.append("0")
+        elif command in (":SOUR:VOLT?", ":SOURce:VOLTage:AMPLitude?"):
+            self._pending.append(f"{self.source_voltage:+.6E}")
+        elif command.startswith(":TRIG:SEQ:COUN "):
+            self.trigger_count = int(float(command.split()[-1]))
+        elif command.startswith(":SOUR:VOLT "):
+            self.source_voltage = float(command.split()[-1])
+        elif command.startswith(":OUTP:STAT "):
+            self.output = command.endswith("ON")
+
+    def _statistic(self):
+        n = len(self.buffer)
+        mean = sum(self.buffer) / n
+        if self.statistic.startswith("SDEV"):
+            return math.sqrt(sum((r - mean) ** 2 for r in self.buffer) / (n - 1)) if n > 1 else 0.0
+        if self.statistic.startswith("MIN"):
+            return min(self.buffer)
+        if self.statistic.startswith("MAX"):
+            return max(self.buffer)
+        if self.statistic == "PKPK":
+            return max(self.buffer) - min(self.buffer)
+        return mean
+
+
+def connect_simulated(smu_model="2602B", move_time_scale=0.0, **model):
+    """
+    Drivers wired to simulated resources that share one light path.
+
+    :param smu_model: "2602B" or "2410"
+    :param move_time_scale: see SimulatedChromometerHandle
+    :param model: photodiode model parameters, see _SimulatedSMUHandle
+    :return: (Chromometer, smu_interface.SourceMeter)
+    """
+    from sp_2150i_chromometer_driver import Chromometer
+    from keithley_2602B_driver import Keithley2602B
+    from keithley_2410_driver import Keithley2410
+    from smu_interface import Keithley2602BSourceMeter, Keithley2410SourceMeter
+
+    chromometer_handle = SimulatedChromometerHandle(move_time_scale=move_time_scale)
+    chromometer = Chromometer(device_handle=chromometer_handle)
+    if smu_model == "2410":
+        smu = Keithley2410SourceMeter(Keithley2410(device_handle=SimulatedKeithley2410Handle(chromometer_handle,
+                                                                                             **model)))
+    else:
+        smu = Keithley2602BSourceMeter(Keithley2602B(device_handle=SimulatedKeithley2602BHandle(chromometer_handle,
+                                                                                               **model)))
+    return chromometer, smu
@@ -0,0 +1,269 @@
+import math
+import time
+
+import pyvisa
+
+from keithley_2602B_driver import Keithley2602B, parse_readings
+from keithley_2410_driver import Keithley2410
+from range_predictor import RANGES_2602B, RANGES_2410, is_overflow
+
+"""
+Common source-measure interface over the Keithley 2602B (TSP) and 2410 (SCPI) drivers.
+
+connect_smu() probes *IDN? and returns the backend for the model found, so the sweep code calls one set of methods and
+each backend uses the fastest acquisition path its hardware has:
+    2602B: readings are taken into smua.nvbuffer1 on the instrument and returned by one printbuffer() query, or
+           reduced on the instrument by the sweep_point() TSP routine loaded at connect (measure_point)
+    2410:  trigger count N with :FORM:ELEM CURR, one :READ? returns all N currents, or N readings are taken into the
+           TRACe buffer on one INIT and reduced by :CALC3 on the instrument (measure_point)
+"""
+
+
+def point_statistics(readings, compliance=None):
+    """
+    :param readings: list of float [A]
+    :return: dict in the format of SourceMeter.measure_point
+    """
+    n = len(readings)
+    mean = sum(readings) / n
+    std = math.sqrt(sum((r - mean) ** 2 for r in readings) / (n - 1)) if n > 1 else 0.0
+    return {"mean": mean, "std": std, "min": min(readings), "max": max(readings), "compliance": compliance,
+            "overflows": sum(1 for r in readings if is_overflow(r))}
+
+
+class SourceMeter:
+    """
+    Interface, see Keithley2602BSourceMeter and Keithley2410SourceMeter.  The wrapped driver is available as
+    self.driver for anything model specific.
+    """
+    model = None
+    current_ranges = []
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.device_handle = driver.device_handle
+
+    def get_id(self):
+        return self.driver.get_id()
+
+    def initialize(self, bias_voltage, current_limit):
+        """
+        Voltage source at bias_voltage with current compliance current_limit, measuring DC current.
+        """
+        raise NotImplementedError
+
+    def output_on(self):
+        raise NotImplementedError
+
+    def output_off(self):
+        raise NotImplementedError
+
+    def set_bias_voltage(self, voltage):
+        raise NotImplementedError
+
+    def set_current_limit(self, current):
+        raise NotImplementedError
+
+    def get_source_voltage(self):
+        raise NotImplementedError
+
+    def in_compliance(self):
+        """
+        :return: True if the source is in compliance now, None if the backend cannot tell
+        """
+        return None
+
+    def measure_current(self):
+        raise NotImplementedError
+
+    def measure_currents(self, count):
+        """
+        :param count: number of readings
+        :return: list of float [A]
+        """
+        raise NotImplementedError
+
+    def measure_point(self, count, bias=None, settle_s=0):
+        """
+        Everything measured at one wavelength: optional bias change and settle wait, then count readings reduced to
+        statistics.  Backends that can do this on the instrument override it.
+
+        :param count: number of readings
+        :param bias: source voltage [V] set first, None keeps the present level
+        :param settle_s: wait after setting the bias [s]
+        :return: dict {"mean", "std", "min", "max"} [A], "compliance" bool or None if unknown, "overflows" int
+        """
+        if bias is not None:
+            self.set_bias_voltage(bias)
+        if settle_s > 0:
+            time.sleep(settle_s)
+        readings = self.measure_currents(count)
+        return point_statistics(readings, self.in_compliance())
+
+    def set_nplc(self, nplc):
+        raise NotImplementedError
+
+    def set_filter_count(self, count):
+        raise NotImplementedError
+
+    def set_measure_range_i(self, value):
+        raise NotImplementedError
+
+    def set_measure_autorange_i(self, state=True):
+        raise NotImplementedError
+
+
+class Keithley2602BSourceMeter(SourceMeter):
+    model = "2602B"
+    current_ranges = RANGES_2602B
+
+    def __init__(self, driver):
+        super().__init__(driver)
+        self.driver.load_point_script()
+
+    def initialize(self, bias_voltage, current_limit):
+        self.device_handle.write("errorqueue.clear()")
+        self.device_handle.write(f"smua.source.limiti = {current_limit}")
+        self.driver.smua_set_source_voltage(bias_voltage)
+        self.driver.smua_set_to_measure_current()
+        self.driver.smua_display_current()
+
+    def output_on(self):
+        return self.driver.smua_output_on()
+
+    def output_off(self):
+        return self.driver.smua_output_off()
+
+    def set_bias_voltage(self, voltage):
+        return self.device_handle.write(f"smua.source.levelv = {voltage}")
+
+    def set_current_limit(self, current):
+        return self.device_handle.write(f"smua.source.limiti = {current}")
+
+    def get_source_voltage(self):
+        return self.driver.smua_get_source_voltage()
+
+    def in_compliance(self):
+        return self.driver.smua_get_compliance()
+
+    def measure_current(self):
+        return self.driver.smua_measure_i_clean()
+
+    def measure_currents(self, count):
+        return self.driver.smua_measure_i_buffer(count)
+
+    def measure_point(self, count, bias=None, settle_s=0):
+        return self.driver.smua_measure_point(count, bias, settle_s)
+
+    def set_nplc(self, nplc):
+        return self.driver.smua_set_nplc(nplc)
+
+    def set_filter_count(self, count):
+        return self.driver.smua_set_filter_count(count)
+
+    def set_measure_range_i(self, value):
+        return self.driver.smua_set_measure_range_i(value)
+
+    def set_measure_autorange_i(self, state=True):
+        return self.driver.smua_set_measure_autorange_i(state)
+
+
+class Keithley2410SourceMeter(SourceMeter):
+    model = "2410"
+    current_ranges = RANGES_2410
+
+    def __init__(self, driver):
+        super().__init__(driver)
+        self._trigger_count = None
+
+    def initialize(self, bias_voltage, current_limit):
+        self.driver.set_as_voltage_source()
+        self.driver.set_voltage_source(bias_voltage)
+        self.driver.set_current_sense()
+        self.driver.set_current_compliance(current_limit)
+        self.device_handle.write(":FORM:ELEM CURR")  # :READ? returns currents only
+        self._trigger_count = None
+
+    def output_on(self):
+        return self.driver.output_on()
+
+    def output_off(self):
+        return self.driver.output_off()
+
+    def set_bias_voltage(self, voltage):
+        return self.driver.set_voltage_source(voltage)
+
+    def set_current_limit(self, current):
+        return self.driver.set_current_compliance(current)
+
+    def get_source_voltage(self):
+        return float(self.driver.get_voltage_source())
+
+    def in_compliance(self):
+        return self.driver.get_current_compliance_tripped()
+
+    def measure_current(self):
+        return self.measure_currents(1)[0]
+
+    def measure_currents(self, count):
+        if count != self._trigger_count:
+            self.driver.set_trigger_count(count)
+            self._trigger_count = count
+        return self.device_handle.query_parsed(":READ?", parse_readings)
+
+    def measure_point(self, count, bias=None, settle_s=0):
+        """
+        Buffer burst, only the :CALC3 statistics are transferred.  Over-range is seen from min/max, so "overflows" is
+        1 if any reading was over range.
+        """
+        if bias is not None:
+            self.set_bias_voltage(bias)
+        if settle_s > 0:
+            time.sleep(settle_s)
+        readings, statistics = self.driver.burst_measure(count, fetch_data=False)
+        self._trigger_count = count
+        return {"mean": statistics["mean"], "std": statistics["sdev"] if count > 1 else 0.0,
+                "min": statistics["min"], "max": statistics["max"], "compliance": self.in_compliance(),
+                "overflows": int(is_overflow(statistics["min"]) or is_overflow(statistics["max"]))}
+
+    def set_nplc(self, nplc):
+        return self.driver.set_current_integration_time(nplc)
+
+    def set_filter_count(self, count):
+        self.driver.set_measurement_count(count)
+        return self.driver.set_average_state(count > 1)
+
+    def set_measure_range_i(self, value):
+        return self.driver.set_current_measure_range(value)
+
+    def set_measure_autorange_i(self, state=True):
+        return self.driver.set_current_measure_autorange(state)
+
+
+def connect_smu(resource_name="GPIB0::30::INSTR", device_handle=None):
+    """
+    Opens the resource, identifies the model from *IDN? and wraps it in the matching backend.
+    Ex. *IDN? -> "Keithley Instruments Inc., Model 2602B, 4123456, 3.2.2"
+
+    :param resource_name: VISA resource name
+    :param device_handle: already opened resource (ex. visa_transcript recording or replay), skips opening
+    :return: SourceMeter
+    """
+    rm = None
+    if device_handle is None:
+        rm = pyvisa.ResourceManager()
+        device_handle = rm.open_resource(resource_name)
+    idn = device_handle.query("*IDN?")
+
+    if "2602" in idn or "MODEL 26" in idn.upper():
+        smu = Keithley2602BSourceMeter(Keithley2602B(device_handle=device_handle))
+    elif "2410" in idn or "MODEL 24" in idn.upper():
+        smu = Keithley2410SourceMeter(Keithley2410(device_handle=device_handle))
+    else:
+        if rm is not None:
+            rm.close()
+        raise ValueError(f"Unsupported source meter at {resource_name}: {idn.strip()}")
+
+    smu.driver.rm = rm  # driver closes the resource manager when deleted
+    print("Connected", smu.model, "at", resource_name)
+    return smu
@@ -1,7 +1,65 @@
+import argparse
 import pyvisa
 import time
 import re
 
+from pyvisa import constants
+
+from instrument_io import PolicyHandle, CHROMOMETER_POLICY, is_timeout, sleep
+
+
+def serial_resource_name(resource_name):
+    """
+    Accepts Windows port names and Linux device paths as well as full VISA resource names.
+    Ex. "COM4" -> "COM4", "/dev/ttyUSB0" -> "ASRL/dev/ttyUSB0::INSTR"
+    """
+    if resource_name.startswith("/dev/"):
+        return "ASRL" + resource_name + "::INSTR"
+    return resource_name
+
+
+def parse_number(reply):
+    """
+    Ex. "?NM 300.000 nm ok" -> 300.0
+
+    :return: float
+    """
+    return float(re.sub(r"[^0123456789.]", "", reply))
+
+
+def parse_position(reply):
+    """
+    Ex. "?GRATING 2  ok" -> 2
+
+    :return: int
+    """
+    match = re.search(r"(\d+)\s*ok", reply)
+    if match is None:
+        raise ValueError(f"No position in {reply!r}")
+    return int(match.group(1))
+
+
+def open_serial_port(rm, resource_name="COM4", baud_rate=9600, read_termination="\r\n", write_termination="\r",
+                     chunk_size=64):
+    """
+    Opens the chromometer's port with explicit serial settings, see Chromometer.__init__.
+
+    :param rm: pyvisa.ResourceManager
+    :return: pyvisa resource
+    """
+    device_handle = rm.open_resource(serial_resource_name(resource_name),
+                                     baud_rate=baud_rate,
+                                     data_bits=8,
+                                     parity=constants.Parity.none,
+                                     stop_bits=constants.StopBits.one,
+                                     flow_control=constants.ControlFlow.none,
+                                     read_termination=read_termination,
+                                     write_termination=write_termination,
+                                     chunk_size=chunk_size)
+    # end reads on the last character of read_termination, not on timeout
+    device_handle.end_input = constants.SerialTermination.termination_char
+    return device_handle
+
 
 class Chromometer:
     """
@@ -10,16 +68,63 @@ class Chromometer:
     ftp://ftp.princetoninstruments.com/Public/Software/Official/Acton/Mono-Control%205.2.4.zip
     Run app as administrator.
     """
-    def __init__(self):
-        self.rm = pyvisa.ResourceManager()
-        self.device_handle = self.rm.open_resource("COM4")
+    def __init__(self, io_policy=CHROMOMETER_POLICY, device_handle=None, resource_name="COM4", baud_rate=9600,
+                 read_termination="\r\n", write_termination="\r", chunk_size=64):
+        """
+        The SP-2150i talks 8N1 at 9600 baud, commands end with a carriage return and every reply ends with
+        " ok\r\n" (only ?GRATINGS spans several lines).  Reads stop at the termination character instead of waiting
+        for the timeout, and a reply is far shorter than chunk_size, so one bus read per reply.
+
+        :param io_policy: instrument_io.IOPolicy for all chromometer I/O
+        :param device_handle: already opened resource (ex. simulated_instruments), skips opening resource_name
+        :param resource_name: VISA resource, ex. "COM4", "ASRL/dev/ttyUSB0::INSTR" or just "/dev/ttyUSB0"
+        :param baud_rate: must match the chromometer's setting
+        :param read_termination: reply line ending
+        :param write_termination: command ending
+        :param chunk_size: bytes requested per read
+        """
+        if device_handle is None:
+            self.rm = pyvisa.ResourceManager()
+            device_handle = open_serial_port(self.rm, resource_name, baud_rate, read_termination, write_termination,
+                                             chunk_size)
+        else:
+            self.rm = None
+        self.device_handle = PolicyHandle(device_handle, io_policy)
+        self.last_grating_change_s = None
+        self.scan_speed = None  # last speed set through this driver [nm/min], saves a ?NM/MIN per move
+        self.flush_input()
 
     def __del__(self):
-        self.rm.close()
+        if self.rm is not None:
+            self.rm.close()
+
+    def flush_input(self):
+        """
+        Discards unread bytes (power-on banner, reply left over from an interrupted exchange) so the next read gets the
+        reply to the next command.
+        """
+        try:
+            self.device_handle.flush(constants.BufferOperation.discard_read_buffer)
+        except (AttributeError, NotImplementedError, pyvisa.errors.VisaIOError):
+            # resource without a serial buffer (simulated handle)
+            pass
+
+    def measure_round_trip(self, count=20):
+        """
+        Times count "?NM" queries, the call made most often during a sweep.
+
+        :return: dict {"min", "mean", "max"} [s]
+        """
+        times = []
+        for i in range(count):
+            start = time.perf_counter()
+            self.get_wavelength_nm_raw_output()
+            times.append(time.perf_counter() - start)
+        return {"min": min(times), "mean": sum(times) / len(times), "max": max(times)}
 
     def initialize_defaults(self):
-        self.set_wavelength_nm("200.0 NM")
-        self.set_scan_speed_nm_p_min("120 NM/MIN")
+        self.set_wavelength_nm(200.0)
+        self.set_scan_speed_nm_p_min(120)
 
     def print_resource_ids(self):
         return print("Resource List: ", self.rm.list_resources(), "\n")
@@ -35,7 +140,9 @@ class Chromometer:
         :param rate:
         :return: str "[rate] NM/MIN ok"
         """
-        return self.device_handle.query(str(rate) + " NM/MIN")
+        reply = self.device_handle.query(str(rate) + " NM/MIN")
+        self.scan_speed = float(rate)
+        return reply
 
     def scan_to(self, wavelength):
         """
@@ -56,25 +163,55 @@ class Chromometer:
         Ex. 250.0 NM (causes the SP-2150i to go to 250 nm).
 
         Must wait until target wavelength reached.  Safety factor of 1.1 used.
-        Pinging chromometer while adjusting throws pyVISA IOError.
+        Pinging chromometer while adjusting throws pyVISA IOError.  Only a timeout means "still moving", any other
+        I/O error is raised.
 
 
         :param wavelength:
         :return:
         """
         delta_wavelength_nm = abs(round(self.get_wavelength_nm_clean_output() - wavelength))
-        time_to_sleep = round((60 * delta_wavelength_nm) / self.get_scan_speed_nm_p_min_clean_output() * 1.1, 2)
+        scan_speed = self.scan_speed or self.get_scan_speed_nm_p_min_clean_output()
+        time_to_sleep = round((60 * delta_wavelength_nm) / scan_speed * 1.1, 2)
         try:
             self.device_handle.query(str(wavelength) + " NM")
 
-        except Exception:
+        except Exception as e:
+            if not is_timeout(e):
+                raise
             print("Adjustment Time:", time_to_sleep, "seconds")
-            time.sleep(time_to_sleep)
+            sleep(time_to_sleep)
             self.read()
 
         return self.get_wavelength_nm_clean_output()
 
-    def set_grating(self, grating):
+    def start_scan_to(self, wavelength):
+        """
+        Non-blocking version of set_wavelength_nm.  Ex. 500.0 >NM starts the move and returns "ok" right away; poll
+        is_scan_done() and use stop_scan() to abort.
+
+        :param wavelength:
+        :return: str reply
+        """
+        return self.device_handle.query(str(wavelength) + " >NM")
+
+    def is_scan_done(self):
+        """
+        MONO-?DONE replies "1 ok" once a move started with start_scan_to() has finished, "0 ok" while moving.
+
+        :return: bool
+        """
+        return re.search(r"([01])\s*ok", self.device_handle.query("MONO-?DONE")).group(1) == "1"
+
+    def stop_scan(self):
+        """
+        MONO-STOP stops a move started with start_scan_to().
+
+        :return: str reply
+        """
+        return self.device_handle.query("MONO-STOP")
+
+    def set_grating(self, grating, timeout_s=60, poll_interval_s=1):
         """
         Selects either the first or second grating on the selected turret. Requires approximately 20 seconds.
         Ex. 2 GRATING (indexes grating number 2 into position.  Moves to the same wavelength as the previous grating
@@ -83,15 +220,36 @@ class Chromometer:
         Input "1" or "2".
         Ex. Chromometer().set_grating(2))
 
-        :return:
+        The reply ("ok") only arrives once the grating is indexed, so the first query usually times out.  The pending
+        reply is then polled for until timeout_s instead of re-sending the command.  The measured duration is kept in
+        self.last_grating_change_s.
+
+        :param grating: 1 or 2
+        :param timeout_s: give up after this many seconds
+        :param poll_interval_s: wait between polls
+        :return: str reply
         """
+        start = time.monotonic()
         try:
-            return self.device_handle.query(str(grating) + " GRATING")
-
-        except Exception:
+            reply = self.device_handle.query(str(grating) + " GRATING")
+        except Exception as e:
+            if not is_timeout(e):
+                raise
             print("Please Wait...")
-            time.sleep(1)
-            self.set_grating(grating)
+            reply = None
+            while reply is None:
+                if time.monotonic() - start > timeout_s:
+                    raise TimeoutError(f"Grating {grating} not indexed after {timeout_s} s")
+                time.sleep(poll_interval_s)
+                try:
+                    reply = self.read()
+                except Exception as e:
+                    if not is_timeout(e):
+                        raise
+
+        self.last_grating_change_s = time.monotonic() - start
+        print("Grating Change Time:", round(self.last_grating_change_s, 2), "seconds")
+        return reply
 
     def set_turret(self, turret):
         """
@@ -119,7 +277,7 @@ class Chromometer:
 
         :return: float
         """
-        return float(re.sub(r"[^0123456789.]", "", self.get_wavelength_nm_raw_output()))
+        return self.device_handle.query_parsed("?NM", parse_number)
 
     def get_scan_speed_nm_p_min_raw_output(self):
         """
@@ -137,7 +295,7 @@ class Chromometer:
 
         :return: float "[rate]"
         """
-        return float(re.sub(r"[^0123456789.]", "", self.get_scan_speed_nm_p_min_raw_output()))
+        return self.device_handle.query_parsed("?NM/MIN", parse_number)
 
     def get_grating(self):
         """
@@ -159,6 +317,45 @@ class Chromometer:
             print(self.read())
         return self.read()
 
+    def get_grating_number(self):
+        """
+        Present grating position (1 or 2) on the selected turret.
+
+        :return: int
+        """
+        return self.device_handle.query_parsed("?GRATING", parse_position)
+
+    def get_gratings(self):
+        """
+        Parses the "?GRATINGS" listing, ex. line " 2  600 g/mm BLZ=  1.0UM".  Lines reading "Not Installed" are skipped.
+
+        :return: list of dict {"position": 1-6, "grooves": g/mm, "blaze_nm": float}
+        """
+        self.device_handle.write("?GRATINGS")
+        gratings = []
+        for i in range(20):
+            line = self.read()
+            match = re.search(r"(\d+)\s+(\d+)\s*g/mm\s+BLZ=\s*([\d.]+)\s*(NM|UM)", line, re.IGNORECASE)
+            if match:
+                blaze = float(match.group(3)) * (1000 if match.group(4).upper() == "UM" else 1)
+                gratings.append({"position": int(match.group(1)), "grooves": int(match.group(2)), "blaze_nm": blaze})
+            if line.rstrip().endswith("ok"):
+                break
+        return gratings
+
+    def get_turret_gratings(self):
+        """
+        Gratings of the selected turret, numbered 1 and 2 as used by set_grating.
+
+        :return: list of dict {"grating": 1 or 2, "position", "grooves", "blaze_nm"}
+        """
+        turret = self.device_handle.query_parsed("?TURRET", parse_position)
+        turret_gratings = []
+        for grating in self.get_gratings():
+            if (grating["position"] - 1) // 2 + 1 == turret:
+                turret_gratings.append(dict(grating, grating=(grating["position"] - 1) % 2 + 1))
+        return turret_gratings
+
     def get_turret_number(self):
         """
         Sends the selected turret number (1,2,3, or 4) to the computer terminal.
@@ -176,9 +373,19 @@ class Chromometer:
         return self.device_handle.query("?TURRETS")
 
 
+def arg_handler(argv=None):
+    parser = argparse.ArgumentParser(description="Chromometer connection check and ?NM round-trip timing.")
+    parser.add_argument("--resource", default="COM4", help="Serial port, ex. COM4 or /dev/ttyUSB0.")
+    parser.add_argument("--baud", type=int, default=9600)
+    parser.add_argument("--count", type=int, default=50, help="?NM queries timed.")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    c = Chromometer()
+    args = arg_handler()
+    c = Chromometer(resource_name=args.resource, baud_rate=args.baud)
     c.print_resource_ids()
+    print("?NM round trip [ms]:", {k: round(v * 1000, 2) for k, v in c.measure_round_trip(args.count).items()})
     c.set_scan_speed_nm_p_min(300)
     print("Current wavelength: ", c.get_wavelength_nm_clean_output())
     print(c.set_wavelength_nm(300))
@@ -0,0 +1,265 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from sweep_trace import span
+
+"""
+Long-duration drift and stability monitoring at one fixed wavelength.
+
+Replaces the print loops in the drivers' __main__: readings are taken in buffered blocks (one bus exchange per block),
+the most recent ones kept in a fixed-size ring buffer, and min/mean/max aggregates kept at several resolutions (ex.
+1 s, 10 s, 1 min, 10 min, 1 h).  Every finished aggregate interval is appended to that resolution's CSV, which is
+rotated once it reaches max_rows, keeping keep_files old files.  Memory and disk use stay constant however long the
+run is.
+
+Output files, per resolution: <out_dir>/monitor_<interval>s.csv (+ .1.csv, .2.csv ... rotated), columns
+    time (unix [s], interval start), count, min, mean, max [A]
+
+Ex.
+    python stability_monitor.py 650 --bias -2 --hours 72 --out-dir monitor_red
+"""
+
+AGGREGATE_COLUMNS = "time,count,min,mean,max"
+
+
+class ReadingRing:
+    """
+    Fixed-size ring of (time, current), the newest capacity readings.
+    """
+    def __init__(self, capacity=100000):
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.currents = np.zeros(capacity, dtype=np.float64)
+        self.capacity = capacity
+        self.count = 0  # readings ever added
+
+    def extend(self, times, currents):
+        n = len(currents)
+        if n >= self.capacity:
+            self.count += n - self.capacity  # dropped readings still count as added
+            times, currents = times[-self.capacity:], currents[-self.capacity:]
+            n = self.capacity
+        start = self.count % self.capacity
+        first = min(n, self.capacity - start)
+        self.times[start:start + first] = times[:first]
+        self.currents[start:start + first] = currents[:first]
+        self.times[:n - first] = times[first:]
+        self.currents[:n - first] = currents[first:]
+        self.count += n
+
+    def latest(self, n=None):
+        """
+        :return: (times, currents) of the newest n readings (all kept if None), oldest first
+        """
+        size = min(self.count, self.capacity)
+        n = size if n is None else min(n, size)
+        end = self.count % self.capacity
+        index = np.arange(end - n, end) % self.capacity
+        return self.times[index], self.currents[index]
+
+
+class RollingCsv:
+    """
+    Append-only CSV rotated at max_rows: name.csv -> name.1.csv -> ... -> name.<keep_files>.csv, oldest deleted.
+    """
+    def __init__(self, path, header, max_rows=100000, keep_files=2):
+        self.path = path
+        self.header = header
+        self.max_rows = max_rows
+        self.keep_files = keep_files
+        self.rows = 0
+        self.file = self._open()
+
+    def _rotated(self, i):
+        root, ext = os.path.splitext(self.path)
+        return f"{root}.{i}{ext}"
+
+    def _open(self):
+        new = not os.path.exists(self.path)
+        f = open(self.path, "a")
+        if new:
+            f.write(self.header + "\n")
+        else:
+            with open(self.path) as existing:
+                self.rows = sum(1 for line in existing) - 1
+        return f
+
+    def append(self, line):
+        if self.rows >= self.max_rows:
+            self.rotate()
+        self.file.write(line + "\n")
+        self.file.flush()
+        self.rows += 1
+
+    def rotate(self):
+        self.file.close()
+        for i in range(self.keep_files, 0, -1):
+            source = self._rotated(i - 1) if i > 1 else self.path
+            if os.path.exists(source):
+                os.replace(source, self._rotated(i))
+        if self.keep_files == 0:
+            os.remove(self.path)
+        self.rows = 0
+        self.file = self._open()
+
+    def close(self):
+        self.file.close()
+
+
+class MultiResolutionAggregator:
+    """
+    Min/mean/max of consecutive fixed intervals at several resolutions.  Intervals are aligned to multiples of their
+    length in unix time, so the files of different runs line up.
+
+    :param intervals_s: interval lengths [s]
+    :param sink: callable sink(interval_s, start, count, minimum, mean, maximum) for every finished interval
+    """
+    def __init__(self, intervals_s, sink):
+        self.intervals_s = list(intervals_s)
+        self.sink = sink
+        # per resolution: [interval start, count, sum, min, max]
+        self.open = {interval: None for interval in self.intervals_s}
+
+    def add(self, times, currents):
+        for interval in self.intervals_s:
+            bucket = self.open[interval]
+            starts = np.floor(np.asarray(times) / interval) * interval
+            # readings of one block usually fall into one or two intervals, aggregate per run of equal starts
+            boundaries = np.flatnonzero(np.diff(starts)) + 1
+            for run_times, run_currents in zip(np.split(starts, boundaries), np.split(np.asarray(currents),
+                                                                                      boundaries)):
+                start = run_times[0]
+                if bucket is not None and bucket[0] != start:
+                    self._emit(interval, bucket)
+                    bucket = None
+                if bucket is None:
+                    bucket = [start, 0, 0.0, np.inf, -np.inf]
+                bucket[1] += len(run_currents)
+                bucket[2] += float(run_currents.sum())
+                bucket[3] = min(bucket[3], float(run_currents.min()))
+                bucket[4] = max(bucket[4], float(run_currents.max()))
+            self.open[interval] = bucket
+
+    def flush(self):
+        for interval, bucket in self.open.items():
+            if bucket is not None:
+                self._emit(interval, bucket)
+                self.open[interval] = None
+
+    def _emit(self, interval, bucket):
+        start, count, total, minimum, maximum = bucket
+        self.sink(interval, start, count, minimum, total / count, maximum)
+
+
+class StabilityMonitor:
+    """
+    :param keithley: smu_interface.SourceMeter, output on and biased
+    :param out_dir: directory for the aggregate CSVs
+    :param block_size: readings per buffered SMU exchange
+    :param intervals_s: aggregate resolutions [s]
+    :param ring_size: raw readings kept in memory
+    :param max_rows: rows per aggregate file before rotation
+    :param keep_files: rotated files kept per resolution
+    """
+    def __init__(self, keithley, out_dir, block_size=50, intervals_s=(1, 10, 60, 600, 3600), ring_size=100000,
+                 max_rows=100000, keep_files=2):
+        os.makedirs(out_dir, exist_ok=True)
+        self.keithley = keithley
+        self.block_size = block_size
+        self.ring = ReadingRing(ring_size)
+        self.files = {interval: RollingCsv(os.path.join(out_dir, f"monitor_{interval:g}s.csv"), AGGREGATE_COLUMNS,
+                                           max_rows, keep_files)
+                      for interval in intervals_s}
+        self.aggregator = MultiResolutionAggregator(intervals_s, self._write_aggregate)
+
+    def _write_aggregate(self, interval, start, count, minimum, mean, maximum):
+        self.files[interval].append(f"{start:.3f},{count},{minimum:.7e},{mean:.7e},{maximum:.7e}")
+
+    def acquire_block(self):
+        """
+        One buffered exchange.  Reading times are spread evenly across the exchange.
+
+        :return: (times, currents) arrays
+        """
+        with span("acquire block", "smu", readings=self.block_size):
+            start = time.time()
+            currents = np.asarray(self.keithley.measure_currents(self.block_size), dtype=np.float64)
+            end = time.time()
+        times = np.linspace(start, end, len(currents) + 1)[1:]
+        self.ring.extend(times, currents)
+        self.aggregator.add(times, currents)
+        return times, currents
+
+    def run(self, duration_s=None, report_s=10):
+        """
+        Monitors until duration_s has passed (forever if None) or Ctrl+C.
+
+        :param report_s: print the mean of the last report_s seconds this often
+        """
+        start = last_report = time.time()
+        try:
+            while duration_s is None or time.time() - start < duration_s:
+                times, currents = self.acquire_block()
+                if times[-1] - last_report >= report_s:
+                    recent_times, recent = self.ring.latest()
+                    recent = recent[recent_times >= times[-1] - report_s]
+                    print(time.strftime("%Y-%m-%d %H:%M:%S"), f"mean {recent.mean():.6e} A",
+                          f"std {recent.std():.3e} A", f"({len(recent)} readings)")
+                    last_report = times[-1]
+        except KeyboardInterrupt:
+            print("Stopped")
+        finally:
+            self.close()
+
+    def close(self):
+        self.aggregator.flush()
+        for f in self.files.values():
+            f.close()
+
+
+def arg_handler(argv=None):
+    parser = argparse.ArgumentParser(description="Monitor the SMU current at a fixed wavelength with bounded memory "
+                                                 "and disk use.")
+    parser.add_argument("wavelength", type=float, help="Chromometer wavelength [nm].")
+    parser.add_argument("--chromometer-resource", default="COM4",
+                        help="Serial port of the chromometer, ex. COM4 or /dev/ttyUSB0.")
+    parser.add_argument("--smu-resource", default="GPIB0::30::INSTR",
+                        help="VISA resource of the source meter, model detected from *IDN?.")
+    parser.add_argument("--simulate", action="store_true", help="Use simulated_instruments instead of the bench.")
+    parser.add_argument("--bias", type=float, default=-2, help="Source voltage [V].")
+    parser.add_argument("--current-limit", type=float, default=500e-6, help="Current compliance [A].")
+    parser.add_argument("--hours", type=float, help="Run time, until Ctrl+C if left out.")
+    parser.add_argument("--block", type=int, default=50, help="Readings per buffered SMU exchange.")
+    parser.add_argument("--intervals", default="1,10,60,600,3600", help="Aggregate resolutions [s], comma separated.")
+    parser.add_argument("--ring", type=int, default=100000, help="Raw readings kept in memory.")
+    parser.add_argument("--max-rows", type=int, default=100000, help="Rows per aggregate file before rotation.")
+    parser.add_argument("--keep-files", type=int, default=2, help="Rotated files kept per resolution.")
+    parser.add_argument("--out-dir", default="monitor", help="Directory for the aggregate CSVs.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = arg_handler()
+
+    if args.simulate:
+        from simulated_instruments import connect_simulated
+        chromometer, keithley = connect_simulated()
+    else:
+        from sp_2150i_chromometer_driver import Chromometer
+        from smu_interface import connect_smu
+        chromometer = Chromometer(resource_name=args.chromometer_resource)
+        keithley = connect_smu(args.smu_resource)
+
+    keithley.initialize(args.bias, args.current_limit)
+    print("Chromometer at", chromometer.set_wavelength_nm(args.wavelength), "nm")
+
+    monitor = StabilityMonitor(keithley, args.out_dir, args.block,
+                               [float(interval) for interval in args.intervals.split(",")], args.ring,
+                               args.max_rows, args.keep_files)
+    keithley.output_on()
+    try:
+        monitor.run(None if args.hours is None else args.hours * 3600)
+    finally:
+        keithley.output_off()
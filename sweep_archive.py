@@ -0,0 +1,241 @@
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+"""
+Append-only columnar archive for sweeps.
+
+Layout of an archive directory:
+    wavelength.f8   all wavelengths of all runs, little-endian float64, back to back
+    current.f8      matching currents, same offsets as wavelength.f8
+    index.csv       one row per run: metadata plus offset/length into the column files and the run's wavelength range
+
+Column files are memory-mapped on read, so a query only touches the pages of the runs it returns and memory stays
+constant no matter how large the archive grows.  The index is a few hundred bytes per run and is the only thing read in
+full.
+"""
+
+INDEX_COLUMNS = ["run_id", "date", "device", "bias", "grating", "scan_speed", "source",
+                 "offset", "length", "wl_min", "wl_max"]
+COLUMN_DTYPE = np.dtype("<f8")
+DATE_FORMAT = "%Y-%m-%d_%H-%M-%S"  # same as the sweep file name timestamp, sorts lexicographically
+
+
+class SweepArchive:
+    """
+    Ex.
+        archive = SweepArchive("sweep_archive")
+        archive.append(df["wl_chromometer_list"], df["rev_bias_list"], device="red", bias=0, grating=1, scan_speed=300)
+        for run, data in archive.query(bias=0, wl_min=600, wl_max=700, date_from="2024-05-01"):
+            ...
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.wavelength_path = os.path.join(path, "wavelength.f8")
+        self.current_path = os.path.join(path, "current.f8")
+        self.index_path = os.path.join(path, "index.csv")
+
+    def append(self, wavelengths, currents, device, bias, grating=None, scan_speed=None, date=None, source=""):
+        """
+        Appends one sweep.  Column data is written before the index row, so an interrupted append never leaves an index
+        entry pointing at missing data.  The offset comes from the last index row, and both column files are cut back
+        to it first, so data left by an interrupted append (ex. wavelengths written, currents not) is overwritten
+        instead of shifting every later run.
+
+        :param wavelengths: sequence of wavelengths [nm]
+        :param currents: sequence of currents, same length as wavelengths
+        :param device: device name/ID
+        :param bias: source voltage [V]
+        :param grating: grating position (1 or 2)
+        :param scan_speed: chromometer scan speed [nm/min]
+        :param date: "%Y-%m-%d_%H-%M-%S" string, defaults to now
+        :param source: original file name or free text
+        :return: run_id of the new run
+        """
+        wavelengths = np.asarray(wavelengths, dtype=COLUMN_DTYPE)
+        currents = np.asarray(currents, dtype=COLUMN_DTYPE)
+        if wavelengths.shape != currents.shape or wavelengths.ndim != 1:
+            raise ValueError("wavelengths and currents must be 1D arrays of the same length")
+
+        index = self.index()
+        offset = int((index["offset"] + index["length"]).max()) if len(index) else 0
+        for path, column in ((self.wavelength_path, wavelengths), (self.current_path, currents)):
+            with open(path, "ab") as f:
+                f.truncate(offset * COLUMN_DTYPE.itemsize)
+                column.tofile(f)
+
+        run_id = int(index["run_id"].max()) + 1 if len(index) else 0
+        row = pd.DataFrame([{"run_id": run_id,
+                             "date": date or time.strftime(DATE_FORMAT),
+                             "device": device,
+                             "bias": bias,
+                             "grating": grating,
+                             "scan_speed": scan_speed,
+                             "source": source,
+                             "offset": offset,
+                             "length": len(wavelengths),
+                             "wl_min": float(wavelengths.min()) if len(wavelengths) else np.nan,
+                             "wl_max": float(wavelengths.max()) if len(wavelengths) else np.nan}],
+                           columns=INDEX_COLUMNS)
+        row.to_csv(self.index_path, mode="a", header=not os.path.exists(self.index_path), index=None)
+        return run_id
+
+    def append_csv(self, path, device, bias=None, grating=None, scan_speed=None):
+        """
+        Imports a sweep CSV written by the sweep script.  Bias defaults to the file's "Voltage" column and the date to
+        the timestamp in the file name.
+
+        :return: run_id
+        """
+        df = pd.read_csv(path)
+        if bias is None and "Voltage" in df and len(df):
+            bias = float(df["Voltage"].iloc[0])
+        date = None
+        stem = os.path.splitext(os.path.basename(path))[0]
+        try:
+            date = time.strftime(DATE_FORMAT, time.strptime(stem[-19:], DATE_FORMAT))
+        except ValueError:
+            pass
+        return self.append(df["wl_chromometer_list"], df["rev_bias_list"], device, bias, grating, scan_speed, date,
+                           os.path.basename(path))
+
+    def index(self):
+        if not os.path.exists(self.index_path):
+            return pd.DataFrame(columns=INDEX_COLUMNS)
+        return pd.read_csv(self.index_path, dtype={"device": str, "source": str, "date": str})
+
+    def select(self, device=None, bias=None, grating=None, scan_speed=None, date_from=None, date_to=None,
+               wl_min=None, wl_max=None):
+        """
+        Filters the index only, no column data is read.
+
+        :param date_from: inclusive, "%Y-%m-%d" or full "%Y-%m-%d_%H-%M-%S"
+        :param date_to: inclusive, "%Y-%m-%d" or full "%Y-%m-%d_%H-%M-%S"
+        :return: DataFrame of matching index rows
+        """
+        index = self.index()
+        mask = pd.Series(True, index=index.index)
+        if device is not None:
+            mask &= index["device"] == str(device)
+        if bias is not None:
+            mask &= np.isclose(index["bias"].astype(float), float(bias))
+        if grating is not None:
+            mask &= index["grating"] == grating
+        if scan_speed is not None:
+            mask &= np.isclose(index["scan_speed"].astype(float), float(scan_speed))
+        if date_from is not None:
+            mask &= index["date"] >= date_from
+        if date_to is not None:
+            if len(date_to) == 10:
+                date_to += "_99"  # "2024-05-31" must include the whole day
+            mask &= index["date"] <= date_to
+        if wl_min is not None:
+            mask &= index["wl_max"] >= wl_min
+        if wl_max is not None:
+            mask &= index["wl_min"] <= wl_max
+        return index[mask]
+
+    def query(self, wl_min=None, wl_max=None, **metadata):
+        """
+        Generator over matching runs, one run in memory at a time.  Only the byte ranges of the matching runs are paged
+        in from the memory-mapped column files.
+
+        :param wl_min: lower wavelength bound [nm], inclusive
+        :param wl_max: upper wavelength bound [nm], inclusive
+        :param metadata: see select()
+        :return: yields (index row, DataFrame with "wl_chromometer_list" and "rev_bias_list")
+        """
+        selected = self.select(wl_min=wl_min, wl_max=wl_max, **metadata)
+        return self._read_runs(selected, wl_min, wl_max)
+
+    def latest(self, **metadata):
+        """
+        Most recent run matching the metadata, ex. the previous sweep of the same device and bias.
+
+        :param metadata: see select()
+        :return: (index row, DataFrame) or None
+        """
+        selected = self.select(**metadata)
+        if selected.empty:
+            return None
+        return next(self._read_runs(selected.sort_values("date").tail(1)))
+
+    def _read_runs(self, selected, wl_min=None, wl_max=None):
+        if selected.empty:
+            return
+
+        wavelength_column = np.memmap(self.wavelength_path, dtype=COLUMN_DTYPE, mode="r")
+        current_column = np.memmap(self.current_path, dtype=COLUMN_DTYPE, mode="r")
+
+        for _, run in selected.iterrows():
+            start = int(run["offset"])
+            stop = start + int(run["length"])
+            wavelengths = np.array(wavelength_column[start:stop])
+
+            mask = np.ones(len(wavelengths), dtype=bool)
+            if wl_min is not None:
+                mask &= wavelengths >= wl_min
+            if wl_max is not None:
+                mask &= wavelengths <= wl_max
+            positions = start + np.flatnonzero(mask)
+
+            yield run, pd.DataFrame({"wl_chromometer_list": wavelengths[mask],
+                                     "rev_bias_list": np.array(current_column[positions])})
+
+
+def arg_handler(argv=None):
+    parser = argparse.ArgumentParser(description="Columnar sweep archive.")
+    parser.add_argument("archive", help="Archive directory.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Append sweep CSV files to the archive.")
+    import_parser.add_argument("pattern", nargs="+", help="Sweep CSV files or glob patterns.")
+    import_parser.add_argument("--device", required=True)
+    import_parser.add_argument("--bias", type=float, help="Defaults to the file's Voltage column.")
+    import_parser.add_argument("--grating", type=int)
+    import_parser.add_argument("--scan-speed", type=float)
+
+    query_parser = subparsers.add_parser("query", help="Print matching runs, optionally export them to CSV.")
+    query_parser.add_argument("--device")
+    query_parser.add_argument("--bias", type=float)
+    query_parser.add_argument("--grating", type=int)
+    query_parser.add_argument("--scan-speed", type=float)
+    query_parser.add_argument("--date-from")
+    query_parser.add_argument("--date-to")
+    query_parser.add_argument("--wl-min", type=float)
+    query_parser.add_argument("--wl-max", type=float)
+    query_parser.add_argument("--export-dir", help="Write each matching run as CSV into this directory.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = arg_handler(argv)
+    archive = SweepArchive(args.archive)
+
+    if args.command == "import":
+        paths = sorted({path for pattern in args.pattern for path in glob.glob(pattern)})
+        for path in paths:
+            run_id = archive.append_csv(path, args.device, args.bias, args.grating, args.scan_speed)
+            print(f"{path} -> run {run_id}")
+        return
+
+    filters = {"device": args.device, "bias": args.bias, "grating": args.grating, "scan_speed": args.scan_speed,
+               "date_from": args.date_from, "date_to": args.date_to, "wl_min": args.wl_min, "wl_max": args.wl_max}
+    if args.export_dir is None:
+        print(archive.select(**filters))
+        return
+
+    os.makedirs(args.export_dir, exist_ok=True)
+    for run, data in archive.query(**filters):
+        out_path = os.path.join(args.export_dir, f"run_{int(run['run_id'])}_{run['device']}_{run['date']}.csv")
+        data.assign(Voltage=run["bias"]).to_csv(out_path, index=None)
+        print(out_path)
+
+
+if __name__ == "__main__":
+    main()
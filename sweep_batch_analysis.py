@@ -0,0 +1,227 @@
+import argparse
+import glob
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+"""
+Batch analysis over many sweep files written by wavelength_sweeper_chromometer_keithley_2602B.py.
+
+Every sweep is resampled onto one common wavelength grid so all runs live in a single (runs x wavelengths) array and
+peak, cutoff edges and responsivity/EQE are computed across all runs at once instead of per-file loops.
+
+Ex. python sweep_batch_analysis.py "data/main_v4_red_0V_*.csv" 400 1100 1 --power-reference pm100_power.csv
+"""
+
+HC_OVER_Q_NM = 1239.84193  # h * c / q in [W/A * nm], EQE = responsivity * HC_OVER_Q_NM / wavelength_nm
+TIMESTAMP_PATTERN = re.compile(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})")
+
+
+def load_sweep(path, grid):
+    """
+    Reads one sweep CSV and resamples the current onto the common wavelength grid.
+    Grid points outside of the measured range are NaN (no extrapolation).
+
+    :param path: sweep CSV with columns "wl_chromometer_list", "rev_bias_list" and optionally "Voltage"
+    :param grid: 1D array of wavelengths [nm]
+    :return: dict with file, voltage, number of points and the resampled current
+    """
+    df = pd.read_csv(path)
+    df = df.dropna(subset=["wl_chromometer_list", "rev_bias_list"]).sort_values("wl_chromometer_list")
+    wl = df["wl_chromometer_list"].to_numpy(dtype=float)
+    current = df["rev_bias_list"].to_numpy(dtype=float)
+
+    if len(wl) == 0:
+        resampled = np.full(len(grid), np.nan)
+    else:
+        resampled = np.interp(grid, wl, current, left=np.nan, right=np.nan)
+
+    voltage = float(df["Voltage"].iloc[0]) if "Voltage" in df and len(df) else np.nan
+    match = TIMESTAMP_PATTERN.search(os.path.basename(path))
+
+    return {"file": os.path.basename(path),
+            "timestamp": match.group(1) if match else "",
+            "voltage": voltage,
+            "n_points": len(wl),
+            "current": resampled}
+
+
+def load_sweeps(paths, grid, workers=8):
+    """
+    Loads and resamples sweep files in parallel.
+
+    :param paths: list of sweep CSV paths
+    :param grid: 1D array of wavelengths [nm]
+    :param workers: number of loader threads
+    :return: (DataFrame of per-run metadata, 2D array of shape (runs, len(grid)))
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        runs = list(pool.map(lambda path: load_sweep(path, grid), paths))
+
+    currents = np.vstack([run.pop("current") for run in runs]) if runs else np.empty((0, len(grid)))
+    return pd.DataFrame(runs), currents
+
+
+def load_power_reference(path, grid):
+    """
+    Reads optical power reference (ex. PM100 readings) and resamples it onto the wavelength grid.
+
+    :param path: CSV with columns "wavelength" [nm] and "power" [W]
+    :param grid: 1D array of wavelengths [nm]
+    :return: 1D array of power [W]
+    """
+    df = pd.read_csv(path).sort_values("wavelength")
+    return np.interp(grid, df["wavelength"].to_numpy(dtype=float), df["power"].to_numpy(dtype=float),
+                     left=np.nan, right=np.nan)
+
+
+def responsivity_and_eqe(currents, grid, power):
+    """
+    Responsivity [A/W] and external quantum efficiency for every run and wavelength.
+
+    :param currents: 2D array (runs, wavelengths) of photocurrent [A]
+    :param grid: 1D array of wavelengths [nm]
+    :param power: 1D array of optical power [W] on the same grid
+    :return: (responsivity, eqe) 2D arrays
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        responsivity = np.abs(currents) / power[np.newaxis, :]
+        eqe = responsivity * HC_OVER_Q_NM / grid[np.newaxis, :]
+    return responsivity, eqe
+
+
+def peak_and_edges(signal, grid, fraction=0.5):
+    """
+    Peak wavelength and the cutoff edges where the signal drops below fraction * peak on either side of the peak.
+    Edges are linearly interpolated between the grid points around the crossing.
+
+    :param signal: 2D array (runs, wavelengths), NaN where not measured
+    :param grid: 1D array of wavelengths [nm]
+    :param fraction: edge threshold relative to peak, 0.5 gives the FWHM edges
+    :return: (peak_index, peak_wavelength, peak_value, low_edge_nm, high_edge_nm) 1D arrays
+    """
+    n_runs, n_grid = signal.shape
+    valid = ~np.isnan(signal)
+    filled = np.where(valid, signal, -np.inf)
+
+    peak_index = np.argmax(filled, axis=1)
+    rows = np.arange(n_runs)
+    peak_value = signal[rows, peak_index]
+    has_data = valid.any(axis=1)
+
+    threshold = fraction * peak_value[:, np.newaxis]
+    below = valid & (signal < threshold)
+    index = np.arange(n_grid)[np.newaxis, :]
+
+    # last grid point below threshold before the peak, first one after the peak
+    low_below = np.where(below & (index < peak_index[:, np.newaxis]), index, -1).max(axis=1)
+    high_below = np.where(below & (index > peak_index[:, np.newaxis]), index, n_grid).min(axis=1)
+
+    low_edge = _interpolate_crossing(signal, grid, threshold[:, 0], low_below, low_below + 1)
+    high_edge = _interpolate_crossing(signal, grid, threshold[:, 0], high_below - 1, high_below)
+
+    peak_wavelength = np.where(has_data, grid[peak_index], np.nan)
+    peak_value = np.where(has_data, peak_value, np.nan)
+    return peak_index, peak_wavelength, peak_value, low_edge, high_edge
+
+
+def _interpolate_crossing(signal, grid, threshold, left, right):
+    """
+    Wavelength where the signal crosses threshold between grid columns left and right (per row).
+    NaN where no crossing exists inside the grid.
+    """
+    n_runs, n_grid = signal.shape
+    found = (left >= 0) & (right < n_grid)
+    left_c = np.clip(left, 0, n_grid - 1)
+    right_c = np.clip(right, 0, n_grid - 1)
+    rows = np.arange(n_runs)
+
+    y0 = signal[rows, left_c]
+    y1 = signal[rows, right_c]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(y1 != y0, (threshold - y0) / (y1 - y0), 0.0)
+    edge = grid[left_c] + np.clip(t, 0.0, 1.0) * (grid[right_c] - grid[left_c])
+    return np.where(found, edge, np.nan)
+
+
+def summarize(runs, currents, grid, power=None, fraction=0.5):
+    """
+    Builds the per-run summary table.
+
+    :param runs: DataFrame of per-run metadata from load_sweeps
+    :param currents: 2D array (runs, wavelengths)
+    :param grid: 1D array of wavelengths [nm]
+    :param power: optional 1D array of optical power [W]
+    :param fraction: cutoff edge threshold relative to peak
+    :return: DataFrame
+    """
+    signal = np.abs(currents)
+    peak_index, peak_wl, peak_current, low_edge, high_edge = peak_and_edges(signal, grid, fraction)
+
+    summary = runs.copy()
+    summary["peak_wavelength_nm"] = peak_wl
+    summary["peak_current"] = peak_current
+    summary["cutoff_low_nm"] = low_edge
+    summary["cutoff_high_nm"] = high_edge
+
+    if power is not None:
+        responsivity, eqe = responsivity_and_eqe(currents, grid, power)
+        rows = np.arange(len(summary))
+        summary["peak_responsivity_A_per_W"] = np.where(np.isnan(peak_wl), np.nan, responsivity[rows, peak_index])
+        summary["peak_eqe"] = np.where(np.isnan(peak_wl), np.nan, eqe[rows, peak_index])
+        summary["mean_eqe"] = _nanmean_rows(eqe)
+
+    return summary
+
+
+def _nanmean_rows(values):
+    valid = np.isfinite(values)
+    counts = valid.sum(axis=1)
+    totals = np.where(valid, values, 0.0).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(counts > 0, totals / counts, np.nan)
+
+
+def arg_handler(argv=None):
+    parser = argparse.ArgumentParser(description="Batch analysis of sweep CSV files on a common wavelength grid.")
+    parser.add_argument("pattern", nargs="+", help="Sweep CSV files or glob patterns.")
+    parser.add_argument("grid_start", type=float, help="Common grid start wavelength [nm].")
+    parser.add_argument("grid_stop", type=float, help="Common grid stop wavelength [nm] (inclusive).")
+    parser.add_argument("grid_step", type=float, help="Common grid step [nm].")
+    parser.add_argument("--power-reference", help="CSV with 'wavelength' [nm] and 'power' [W] for responsivity/EQE.")
+    parser.add_argument("--edge-fraction", type=float, default=0.5, help="Cutoff threshold relative to peak.")
+    parser.add_argument("--workers", type=int, default=8, help="Number of parallel loader threads.")
+    parser.add_argument("--output", default="sweep_summary.csv", help="Summary table output path.")
+    parser.add_argument("--resampled-output", help="Optional CSV of all runs on the common grid.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = arg_handler(argv)
+
+    paths = sorted({path for pattern in args.pattern for path in glob.glob(pattern)})
+    if not paths:
+        print("No sweep files matched.")
+        return None
+
+    grid = np.arange(args.grid_start, args.grid_stop + args.grid_step / 2, args.grid_step)
+    runs, currents = load_sweeps(paths, grid, args.workers)
+    power = load_power_reference(args.power_reference, grid) if args.power_reference else None
+
+    summary = summarize(runs, currents, grid, power, args.edge_fraction)
+    summary.to_csv(args.output, index=None)
+    print(summary)
+
+    if args.resampled_output:
+        resampled = pd.DataFrame(currents.T, columns=runs["file"])
+        resampled.insert(0, "wavelength", grid)
+        resampled.to_csv(args.resampled_output, index=None)
+
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import time
+
+import pandas as pd
+
+from grating_scheduler import assign_gratings, plan_grating_passes
+from instrument_io import sleep
+from range_predictor import is_overflow
+from scan_speed_planner import move_time_s
+from smu_interface import point_statistics
+from sweep_samples import STATUS_OVERFLOW, STATUS_COMPLIANCE, STATUS_REMEASURED, STATUS_FIXED_RANGE
+from sweep_trace import span
+
+"""
+Per-point sweep loop shared by the sweep script and the recipe queue.
+
+chromometer is a sp_2150i_chromometer_driver.Chromometer, keithley a smu_interface.SourceMeter.
+"""
+
+
+def build_wavelength_list(segments):
+    """
+    Merges sweep segments like the coarse/fine arguments of the sweep script: every later segment replaces the points
+    of the earlier ones inside its own range.  Stop is inclusive.
+    Ex. [(400, 1100, 10), (600, 700, 1)] -> 400, 410, ..., 590, 600, 601, ..., 700, 710, ..., 1100
+
+    :param segments: list of (start, stop, step) [nm]
+    :return: ascending list of wavelengths
+    """
+    wl_list = []
+    for start, stop, step in segments:
+        count = int(round((stop - start) / step)) + 1
+        segment = [start + i * step for i in range(count)]
+        if all(float(wl).is_integer() for wl in segment):
+            segment = [int(wl) for wl in segment]
+        else:
+            segment = [round(wl, 3) for wl in segment]
+        wl_list = [wl for wl in wl_list if wl < start] + segment + [wl for wl in wl_list if wl > stop]
+    return wl_list
+
+
+def grating_schedule(chromometer, wl_list, grating=None, crossover_nm=None):
+    """
+    :param grating: None (stay on the present grating), 1 or 2 (fixed) or "auto" (closest blaze per wavelength)
+    :return: (list of (grating or None, wavelength) in execution order, grating in position now)
+    """
+    if grating is None:
+        return [(None, wl) for wl in wl_list], None
+
+    current_grating = chromometer.get_grating_number()
+    if grating == "auto":
+        assignment = assign_gratings(wl_list, chromometer.get_turret_gratings(), crossover_nm)
+    else:
+        assignment = [int(grating)] * len(wl_list)
+    passes = plan_grating_passes(wl_list, assignment, current_grating)
+    return [(g, wl) for g, wls in passes for wl in wls], current_grating
+
+
+def move_to_wavelength(chromometer, wavelength, scan_speed, speed_planner=None, wait=True):
+    """
+    Moves and waits until the chromometer reaches the target wavelength, with safety factor at end.
+
+    :param speed_planner: optional scan_speed_planner.ScanSpeedPlanner choosing the speed of each leg of the move,
+        scan_speed is used otherwise
+    :param wait: False skips the speed-derived wait after the move (set_wavelength_nm itself only returns once the
+        move is done), ex. when a settle_detector.SettleDetector decides when to measure
+    :return: chromometer wavelength read back after the move
+    """
+    # find wavelength difference btwn current and target value
+    position = chromometer.get_wavelength_nm_clean_output()
+    if speed_planner is None:
+        legs = [(wavelength, scan_speed)]
+    else:
+        legs = speed_planner.plan_move(position, wavelength)
+
+    for leg_wavelength, speed in legs:
+        delta_wavelength_nm = abs(round(position - leg_wavelength))
+        if speed_planner is not None:
+            speed_planner.apply_speed(chromometer, speed)
+        with span("move", "chromometer", wavelength=leg_wavelength, delta_nm=delta_wavelength_nm, speed=speed):
+            chromometer.set_wavelength_nm(leg_wavelength)
+
+        # must wait until chromometer reaches target wavelength, with safety factor at end
+        if wait:
+            with span("move wait", "chromometer"):
+                sleep(move_time_s(delta_wavelength_nm, speed))
+        position = leg_wavelength
+    return chromometer.get_wavelength_nm_clean_output()
+
+
+def run_sweep(chromometer, keithley, schedule, scan_speed=300, readings_per_point=9, predictor=None, live=None,
+              current_grating=None, on_point=None, speed_planner=None, samples=None, settle_detector=None, cache=None):
+    """
+    Measures every scheduled point.  Source output and scan speed must already be set.
+
+    :param schedule: list of (grating or None, wavelength) from grating_schedule
+    :param scan_speed: chromometer scan speed in use [nm/min]
+    :param readings_per_point: SMU readings averaged per wavelength
+    :param predictor: optional range_predictor.RangePredictor for fixed current ranges
+    :param live: optional live_plotter.LivePlotter
+    :param current_grating: grating in position now
+    :param on_point: optional callback on_point(index, wavelength, current) after every point
+    :param speed_planner: optional scan_speed_planner.ScanSpeedPlanner, see move_to_wavelength
+    :param samples: optional sweep_samples.SweepSamples receiving every reading.  The readings then cross the bus
+        (one buffer query per point) instead of being reduced on the SMU.
+    :param settle_detector: optional settle_detector.SettleDetector replacing the fixed post-move wait; the settle time
+        of every point goes into a "settle_s" column
+    :param cache: optional measurement_cache.MeasurementCache.  Points it holds are not moved to or measured, newly
+        measured points known to be out of compliance and not over range are stored; a "cached" column marks served
+        points
+    :return: DataFrame with "wl_chromometer_list", "rev_bias_list" (and "grating" if the schedule sets gratings)
+    """
+    wl_chromometer_list = []
+    rev_bias_list = []
+    grating_list = []
+    settle_list = []
+    cached_list = []
+    fixed_range = None  # None means the SMU is autoranging
+    if cache is not None and current_grating is None:
+        current_grating = chromometer.get_grating_number()  # part of the cache key even if the sweep keeps it
+
+    for grating, wavelength in schedule:
+        with span("point", "sweep", wavelength=wavelength):
+            cache_grating = grating if grating is not None else current_grating
+            cached = cache.lookup(wavelength, cache_grating) if cache is not None else None
+            if cached is not None:
+                print("cached wl: ", wavelength, "measured", round(cached["age_s"]), "s ago")
+                wl_chromometer_list.append(cached["wavelength"])
+                rev_bias_list.append(cached["mean"])
+                if settle_detector is not None:
+                    settle_list.append(float("nan"))
+            else:
+                if grating is not None and grating != current_grating:
+                    with span("grating change", "chromometer", grating=grating):
+                        chromometer.set_grating(grating)
+                    current_grating = grating
+
+                print("set wl: ", wavelength)
+                print("current chrom wl: ", move_to_wavelength(chromometer, wavelength, scan_speed, speed_planner,
+                                                               settle_detector is None))
+
+                if predictor is not None:
+                    with span("plan range", "sweep"):
+                        predicted_range = predictor.range_for(wavelength)
+                    if predicted_range != fixed_range:
+                        if predicted_range is None:
+                            keithley.set_measure_autorange_i(True)
+                        else:
+                            keithley.set_measure_range_i(predicted_range)
+                        fixed_range = predicted_range
+
+                if settle_detector is not None:
+                    with span("settle", "smu"):
+                        settle_s, settled = settle_detector.wait(keithley.measure_current)
+                    if not settled:
+                        print("Not settled after", round(settle_s, 2), "s at", wavelength, "nm")
+                    settle_list.append(settle_s)
+
+                status = STATUS_FIXED_RANGE if fixed_range is not None else 0
+                with span("acquire", "smu", readings=readings_per_point):
+                    started = time.time()
+                    readings, point = _acquire(keithley, readings_per_point, samples is not None)
+
+                # a fixed range below the current can also show up as compliance (2410 range compliance)
+                if fixed_range is not None and (point["overflows"] or point["compliance"]
+                                                or is_overflow(point["min"], fixed_range)
+                                                or is_overflow(point["max"], fixed_range)):
+                    print("Over range or in compliance at", wavelength, "nm, re-measuring with autorange")
+                    keithley.set_measure_autorange_i(True)
+                    fixed_range = None
+                    status = STATUS_REMEASURED
+                    with span("acquire", "smu", readings=readings_per_point, retry=True):
+                        started = time.time()
+                        readings, point = _acquire(keithley, readings_per_point, samples is not None)
+                acquire_s = time.time() - started
+                if point["compliance"]:
+                    print("In compliance at", wavelength, "nm")
+                    status |= STATUS_COMPLIANCE
+                if point["overflows"]:
+                    status |= STATUS_OVERFLOW
+
+                with span("read back", "chromometer"):
+                    wl_chromometer_list.append(chromometer.get_wavelength_nm_clean_output())
+                rev_bias_list.append(point["mean"])
+                if samples is not None:
+                    samples.add_point(wl_chromometer_list[-1], readings, started, acquire_s, status)
+                # compliance None: the backend cannot tell, not safe to reuse
+                if cache is not None and point["compliance"] is False and not status & STATUS_OVERFLOW:
+                    cache.store(wavelength, cache_grating, wl_chromometer_list[-1], point)
+
+            avg = rev_bias_list[-1]
+            cached_list.append(cached is not None)
+            if grating is not None:
+                grating_list.append(grating)
+
+            if predictor is not None:
+                predictor.update(wavelength, avg)
+
+            if live is not None:
+                with span("plot", "output"):
+                    live.add_point(wl_chromometer_list[-1], avg)
+
+            if on_point is not None:
+                with span("publish", "output"):
+                    on_point(len(wl_chromometer_list) - 1, wl_chromometer_list[-1], avg)
+
+    df = pd.DataFrame(list(zip(wl_chromometer_list, rev_bias_list)), columns=["wl_chromometer_list", "rev_bias_list"])
+    if grating_list:
+        df = df.assign(grating=grating_list)
+    if settle_list:
+        df = df.assign(settle_s=settle_list)
+    if cache is not None:
+        df = df.assign(cached=cached_list)
+    return df
+
+
+def _acquire(keithley, count, keep_readings):
+    """
+    :return: (list of readings or None, statistics dict as from SourceMeter.measure_point)
+    """
+    if not keep_readings:
+        return None, keithley.measure_point(count)
+    readings = keithley.measure_currents(count)
+    return readings, point_statistics(readings, keithley.in_compliance())
+
+
+def save_sweep(df, voltage, output_prefix, samples=None):
+    """
+    Writes output_prefix + timestamp + ".csv", sorted by wavelength when the sweep was split across gratings, and
+    with samples also output_prefix + timestamp + "_samples.npz".
+
+    :param voltage: source voltage [V], stored in the "Voltage" column
+    :param output_prefix: file name prefix, ex. "main_v4_red_0V_"
+    :param samples: optional sweep_samples.SweepSamples filled by run_sweep
+    :return: (DataFrame as written, timestamp string)
+    """
+    string_time = time.strftime("%Y-%m-%d_%H-%M-%S")
+    df = df.assign(Voltage=voltage)
+    if "grating" in df:
+        df = df.sort_values("wl_chromometer_list", kind="stable")
+    with span("save csv", "persistence", points=len(df)):
+        df.to_csv(output_prefix + string_time + ".csv", index=None)
+    if samples is not None:
+        with span("save samples", "persistence", samples=samples.sample_count):
+            samples.save(output_prefix + string_time + "_samples.npz")
+    return df, string_time
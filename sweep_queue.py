@@ -0,0 +1,194 @@
+import argparse
+import json
+
+from sp_2150i_chromometer_driver import Chromometer
+from smu_interface import connect_smu
+from sweep_archive import SweepArchive
+from sweep_samples import SweepSamples
+from sweep_engine import build_wavelength_list, grating_schedule, run_sweep, save_sweep
+
+"""
+Runs a queue of sweep recipes back to back in one process.
+
+Instrument sessions are opened once and stay open, only settings that differ from the previous job are sent, and jobs
+are reordered so the chromometer does not rewind or swap gratings more than needed.
+
+Recipe file, JSON, either one recipe or a list of recipes:
+[
+    {
+        "name": "red_0V",
+        "device": "red",
+        "segments": [[400, 1100, 10], [600, 700, 1]],
+        "bias": 0,
+        "current_limit": 500e-6,
+        "readings": 9,
+        "nplc": 1,
+        "filter_count": 1,
+        "scan_speed": 300,
+        "grating": null,
+        "output_prefix": "main_v4_red_0V_",
+        "archive": "sweep_archive",
+        "keep_samples": false
+    }
+]
+"segments" are (start, stop, step) [nm] merged like the coarse/fine sweep arguments.  "grating" is null (stay on the
+present grating), 1, 2 or "auto".  "keep_samples" also saves every reading, see sweep_samples.  Settings left out
+keep whatever the instrument has.
+
+Ex. python sweep_queue.py tonight.json --smu-resource GPIB0::30::INSTR
+"""
+
+RECIPE_DEFAULTS = {"name": None,
+                   "device": "unknown",
+                   "bias": -2,
+                   "current_limit": 500e-6,
+                   "readings": 9,
+                   "nplc": None,
+                   "filter_count": None,
+                   "scan_speed": 300,
+                   "grating": None,
+                   "crossover_nm": None,
+                   "output_prefix": None,
+                   "archive": None,
+                   "keep_samples": False}
+
+
+class SweepRecipe:
+    def __init__(self, segments, **settings):
+        unknown = set(settings) - set(RECIPE_DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown recipe keys: {sorted(unknown)}")
+        if not segments:
+            raise ValueError("A recipe needs at least one segment")
+
+        self.segments = [tuple(segment) for segment in segments]
+        for key, default in RECIPE_DEFAULTS.items():
+            setattr(self, key, settings.get(key, default))
+        if self.name is None:
+            self.name = f"{self.device}_{self.bias}V"
+        if self.output_prefix is None:
+            self.output_prefix = self.name + "_"
+        self.wavelengths = build_wavelength_list(self.segments)
+
+    def __repr__(self):
+        return f"SweepRecipe({self.name!r}, {self.wavelengths[0]}-{self.wavelengths[-1]} nm)"
+
+
+def load_recipes(path):
+    with open(path) as f:
+        content = json.load(f)
+    if isinstance(content, dict):
+        content = [content]
+    return [SweepRecipe(**recipe) for recipe in content]
+
+
+def order_recipes(recipes, current_grating=None, current_wavelength=None):
+    """
+    Greedy ordering: prefer recipes that need no grating change, then the one starting closest to where the
+    chromometer is (the end of the previous sweep).
+
+    :return: reordered list
+    """
+    remaining = list(recipes)
+    ordered = []
+    while remaining:
+        def cost(recipe):
+            needs_change = recipe.grating not in (None, "auto", current_grating)
+            distance = abs(recipe.wavelengths[0] - current_wavelength) if current_wavelength is not None else 0
+            return needs_change, distance
+
+        recipe = min(remaining, key=cost)
+        remaining.remove(recipe)
+        ordered.append(recipe)
+        if recipe.grating not in (None, "auto"):
+            current_grating = int(recipe.grating)
+        current_wavelength = recipe.wavelengths[-1]
+    return ordered
+
+
+class SweepQueue:
+    """
+    Keeps the chromometer and source meter open across jobs and remembers the last setting sent for each parameter.
+    """
+    def __init__(self, chromometer, keithley):
+        self.chromometer = chromometer
+        self.keithley = keithley
+        self.applied = {}
+        self.initialized = False
+
+    def _changed(self, key, value):
+        if value is None or self.applied.get(key) == value:
+            return False
+        self.applied[key] = value
+        return True
+
+    def apply_settings(self, recipe):
+        """
+        Sends only the settings that differ from what the previous job left on the instruments.
+        """
+        if not self.initialized:
+            self.keithley.initialize(recipe.bias, recipe.current_limit)
+            self.applied.update(bias=recipe.bias, current_limit=recipe.current_limit)
+            self.initialized = True
+        if self._changed("current_limit", recipe.current_limit):
+            self.keithley.set_current_limit(recipe.current_limit)
+        if self._changed("bias", recipe.bias):
+            self.keithley.set_bias_voltage(recipe.bias)
+        if self._changed("nplc", recipe.nplc):
+            self.keithley.set_nplc(recipe.nplc)
+        if self._changed("filter_count", recipe.filter_count):
+            self.keithley.set_filter_count(recipe.filter_count)
+        if self._changed("scan_speed", recipe.scan_speed):
+            self.chromometer.set_scan_speed_nm_p_min(recipe.scan_speed)
+
+    def run_recipe(self, recipe, on_point=None):
+        print("Running", recipe)
+        self.apply_settings(recipe)
+        schedule, current_grating = grating_schedule(self.chromometer, recipe.wavelengths, recipe.grating,
+                                                     recipe.crossover_nm)
+
+        self.keithley.output_on()
+        try:
+            samples = SweepSamples(len(schedule), recipe.readings) if recipe.keep_samples else None
+            df = run_sweep(self.chromometer, self.keithley, schedule, recipe.scan_speed, recipe.readings,
+                           current_grating=current_grating, on_point=on_point, samples=samples)
+        finally:
+            self.keithley.output_off()
+
+        df, string_time = save_sweep(df, recipe.bias, recipe.output_prefix, samples)
+        if recipe.archive is not None:
+            gratings = set(df["grating"]) if "grating" in df else set()
+            SweepArchive(recipe.archive).append(df["wl_chromometer_list"], df["rev_bias_list"], recipe.device,
+                                                recipe.bias, grating=gratings.pop() if len(gratings) == 1 else None,
+                                                scan_speed=recipe.scan_speed, date=string_time,
+                                                source=recipe.output_prefix + string_time + ".csv")
+        return df
+
+    def run(self, recipes, reorder=True):
+        """
+        :return: list of (recipe, DataFrame) in execution order
+        """
+        if reorder:
+            recipes = order_recipes(recipes, self.chromometer.get_grating_number(),
+                                    self.chromometer.get_wavelength_nm_clean_output())
+        print("Queue:", recipes)
+        return [(recipe, self.run_recipe(recipe)) for recipe in recipes]
+
+
+def arg_handler(argv=None):
+    parser = argparse.ArgumentParser(description="Run sweep recipes back to back without re-initializing.")
+    parser.add_argument("recipe_files", nargs="+", help="JSON recipe files, run as one queue.")
+    parser.add_argument("--chromometer-resource", default="COM4",
+                        help="Serial port of the chromometer, ex. COM4 or /dev/ttyUSB0.")
+    parser.add_argument("--smu-resource", default="GPIB0::30::INSTR",
+                        help="VISA resource of the source meter, model detected from *IDN?.")
+    parser.add_argument("--keep-order", action="store_true", help="Run recipes in file order.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = arg_handler()
+    recipes = [recipe for path in args.recipe_files for recipe in load_recipes(path)]
+
+    queue = SweepQueue(Chromometer(resource_name=args.chromometer_resource), connect_smu(args.smu_resource))
+    queue.run(recipes, reorder=not args.keep_order)
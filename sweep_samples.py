@@ -0,0 +1,133 @@
+import numpy as np
+
+"""
+Array-backed store for every SMU reading of a sweep, not only the per-wavelength average.
+
+All readings go into one preallocated float32 block; point i owns samples[offsets[i]:offsets[i + 1]].  Per point a
+float64 wavelength, acquisition start time and duration and a uint16 status word are kept.  Blocks grow by doubling
+if a sweep takes more samples than planned (ex. re-measured points).  Saved as one uncompressed .npz next to the
+summary CSV, ~4 bytes per reading.
+
+Ex.
+    samples = SweepSamples(points=len(wl_list), samples_per_point=9)
+    df = run_sweep(..., samples=samples)
+    save_sweep(df, voltage, "main_v4_red_0V_", samples)   # writes main_v4_red_0V_<time>_samples.npz
+    samples = SweepSamples.load("main_v4_red_0V_2024-05-01_12-00-00_samples.npz")
+    readings = samples.point_samples(10)
+"""
+
+STATUS_OVERFLOW = 1  # at least one reading over range
+STATUS_COMPLIANCE = 2  # source in compliance
+STATUS_REMEASURED = 4  # over range or in compliance on a fixed range, samples are from the autorange re-measurement
+STATUS_FIXED_RANGE = 8  # measured on a predicted fixed range
+
+
+class SweepSamples:
+    """
+    :param points: expected number of points
+    :param samples_per_point: expected readings per point
+    :param sample_dtype: float32 keeps the SMUs' 6.5 digits, float64 doubles the size
+    """
+    def __init__(self, points=0, samples_per_point=1, sample_dtype=np.float32):
+        points = max(int(points), 1)
+        self.samples = np.empty(points * max(int(samples_per_point), 1), dtype=sample_dtype)
+        self.offsets = np.zeros(points + 1, dtype=np.int64)
+        self.wavelengths = np.empty(points, dtype=np.float64)
+        self.timestamps = np.empty(points, dtype=np.float64)
+        self.durations = np.empty(points, dtype=np.float64)
+        self.status = np.zeros(points, dtype=np.uint16)
+        self.point_count = 0
+        self.sample_count = 0
+
+    def __len__(self):
+        return self.point_count
+
+    def _grow_points(self):
+        size = len(self.wavelengths) * 2
+        for name in ("wavelengths", "timestamps", "durations", "status"):
+            old = getattr(self, name)
+            new = np.zeros(size, dtype=old.dtype)
+            new[:self.point_count] = old[:self.point_count]
+            setattr(self, name, new)
+        offsets = np.zeros(size + 1, dtype=np.int64)
+        offsets[:self.point_count + 1] = self.offsets[:self.point_count + 1]
+        self.offsets = offsets
+
+    def _grow_samples(self, needed):
+        size = max(len(self.samples) * 2, needed)
+        samples = np.empty(size, dtype=self.samples.dtype)
+        samples[:self.sample_count] = self.samples[:self.sample_count]
+        self.samples = samples
+
+    def add_point(self, wavelength, readings, timestamp, duration=0.0, status=0):
+        """
+        :param wavelength: [nm]
+        :param readings: sequence of currents [A]
+        :param timestamp: acquisition start, time.time() [s]
+        :param duration: acquisition time [s]
+        :param status: STATUS_* bits
+        :return: point index
+        """
+        index = self.point_count
+        if index >= len(self.wavelengths):
+            self._grow_points()
+        end = self.sample_count + len(readings)
+        if end > len(self.samples):
+            self._grow_samples(end)
+
+        self.samples[self.sample_count:end] = readings
+        self.wavelengths[index] = wavelength
+        self.timestamps[index] = timestamp
+        self.durations[index] = duration
+        self.status[index] = status
+        self.offsets[index + 1] = end
+        self.sample_count = end
+        self.point_count += 1
+        return index
+
+    def point_samples(self, index):
+        """
+        :return: view of the readings of one point
+        """
+        if not 0 <= index < self.point_count:
+            raise IndexError(f"point {index} out of range ({self.point_count} points)")
+        return self.samples[self.offsets[index]:self.offsets[index + 1]]
+
+    def save(self, path):
+        """
+        :param path: .npz file
+        :return: path
+        """
+        np.savez(path,
+                 samples=self.samples[:self.sample_count],
+                 offsets=self.offsets[:self.point_count + 1],
+                 wavelengths=self.wavelengths[:self.point_count],
+                 timestamps=self.timestamps[:self.point_count],
+                 durations=self.durations[:self.point_count],
+                 status=self.status[:self.point_count])
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            samples = cls(len(data["wavelengths"]), 1, data["samples"].dtype)
+            samples.samples = data["samples"]
+            samples.offsets = data["offsets"]
+            samples.wavelengths = data["wavelengths"]
+            samples.timestamps = data["timestamps"]
+            samples.durations = data["durations"]
+            samples.status = data["status"]
+        samples.point_count = len(samples.wavelengths)
+        samples.sample_count = len(samples.samples)
+        return samples
+
+    def point_std(self):
+        """
+        :return: sample standard deviation of every point, vectorized over the ragged blocks
+        """
+        counts = np.diff(self.offsets[:self.point_count + 1])
+        values = self.samples[:self.sample_count].astype(np.float64)
+        point_of_sample = np.repeat(np.arange(self.point_count), counts)
+        means = np.bincount(point_of_sample, values, self.point_count) / np.maximum(counts, 1)
+        squares = np.bincount(point_of_sample, (values - means[point_of_sample]) ** 2, self.point_count)
+        return np.sqrt(squares / np.maximum(counts - 1, 1))
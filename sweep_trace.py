@@ -0,0 +1,151 @@
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+"""
+Optional timeline tracing for the sweep.
+
+Spans (name, category, start, duration, thread) are appended to a fixed-size ring buffer, the oldest dropped once it
+is full, and exported as Chrome trace-event JSON for chrome://tracing or https://ui.perfetto.dev.  While tracing is
+off, span() returns a shared no-op context manager, so the hooks left in the sweep loop and the I/O layer cost one
+global lookup.
+
+Ex.
+    enable_tracing()
+    with span("acquire", "smu", wavelength=650):
+        keithley.measure_point(9)
+    export_trace("sweep_trace.json")
+"""
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class Tracer:
+    """
+    :param capacity: spans kept, the oldest are overwritten first
+    """
+    def __init__(self, capacity=200000):
+        self.events = collections.deque(maxlen=capacity)
+        self.thread_names = {}
+        self.recorded = 0
+        self.origin_ns = time.perf_counter_ns()
+
+    @contextlib.contextmanager
+    def span(self, name, category="sweep", **args):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, category, start, time.perf_counter_ns() - start, args)
+
+    def record(self, name, category, start_ns, duration_ns, args=None):
+        thread = threading.current_thread()
+        if thread.ident not in self.thread_names:
+            self.thread_names[thread.ident] = thread.name
+        self.events.append((name, category, start_ns, duration_ns, thread.ident, args))
+        self.recorded += 1
+
+    def instant(self, name, category="sweep", **args):
+        self.record(name, category, time.perf_counter_ns(), None, args)
+
+    @property
+    def dropped(self):
+        return self.recorded - len(self.events)
+
+    def trace_events(self):
+        """
+        :return: list of Chrome trace-event dicts, complete ("X") events for spans, instant ("i") events otherwise
+        """
+        pid = os.getpid()
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                  for tid, name in self.thread_names.items()]
+        for name, category, start_ns, duration_ns, tid, args in list(self.events):
+            event = {"name": name, "cat": category, "pid": pid, "tid": tid,
+                     "ts": (start_ns - self.origin_ns) / 1000}
+            if duration_ns is None:
+                event.update(ph="i", s="t")
+            else:
+                event.update(ph="X", dur=duration_ns / 1000)
+            if args:
+                event["args"] = {key: value if isinstance(value, (int, float, bool)) else str(value)
+                                 for key, value in args.items()}
+            events.append(event)
+        return events
+
+    def export(self, path):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms",
+                       "otherData": {"dropped_spans": self.dropped}}, f)
+        return path
+
+
+_tracer = None
+
+
+def enable_tracing(capacity=200000):
+    global _tracer
+    _tracer = Tracer(capacity)
+    return _tracer
+
+
+def disable_tracing():
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def get_tracer():
+    """
+    :return: active Tracer or None
+    """
+    return _tracer
+
+
+def span(name, category="sweep", **args):
+    """
+    Context manager timing its block on the active tracer, a no-op while tracing is off.
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, category, **args)
+
+
+def instant(name, category="sweep", **args):
+    if _tracer is not None:
+        _tracer.instant(name, category, **args)
+
+
+def export_trace(path):
+    """
+    :return: path, or None if tracing is off
+    """
+    if _tracer is None:
+        return None
+    _tracer.export(path)
+    print("Trace:", path, f"({len(_tracer.events)} spans, {_tracer.dropped} dropped)")
+    return path
+
+
+class TracedDriver:
+    """
+    Proxy timing every method call of a driver as a span named after the method.
+    Ex. chromometer = TracedDriver(Chromometer(), "chromometer")
+    """
+    def __init__(self, driver, category):
+        self.driver = driver
+        self.category = category
+
+    def __getattr__(self, name):
+        attribute = getattr(self.driver, name)
+        if not callable(attribute):
+            return attribute
+
+        def method(*args, **kwargs):
+            with span(name, self.category):
+                return attribute(*args, **kwargs)
+
+        method.__name__ = name
+        return method
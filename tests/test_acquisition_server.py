@@ -0,0 +1,99 @@
+import threading
+import time
+
+from acquisition_server import (MSG_POINT, MSG_STATUS, AcquisitionClient, AcquisitionServer, _Subscriber,
+                                encode_json)
+from simulated_instruments import connect_simulated
+
+
+def test_loopback_submit_and_receive(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # run_recipe writes the sweep CSV to the working directory
+    chromometer, keithley = connect_simulated()
+    server = AcquisitionServer(chromometer, keithley, port=0)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    client = AcquisitionClient(*server.server_address, timeout=30)
+    try:
+        client.submit({"device": "test", "segments": [[500, 501, 0.5]], "bias": -1, "scan_speed": 3000})
+        events = []
+        points = []
+        for message_type, message in client.messages():
+            if message_type == MSG_POINT:
+                points.append(message)
+            elif message_type == MSG_STATUS:
+                events.append(message["event"])
+                if message["event"] in ("finished", "failed"):
+                    break
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+    assert events == ["queued", "started", "finished"]
+    assert [point["index"] for point in points] == [0, 1, 2]
+    assert [round(point["wavelength"], 3) for point in points] == [500.0, 500.5, 501.0]
+    assert all(point["current"] < 0 for point in points)
+    assert list(tmp_path.glob("test_-1V_*.csv"))
+
+
+def test_rejected_recipe():
+    chromometer, keithley = connect_simulated()
+    server = AcquisitionServer(chromometer, keithley, port=0)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    client = AcquisitionClient(*server.server_address, timeout=10)
+    try:
+        client.submit({"device": "test", "segments": [[500, 501, 0.5]], "no_such_key": 1})
+        message_type, message = next(client.messages())
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+    assert message_type == MSG_STATUS and message["event"] == "rejected"
+
+
+def test_queued_status_is_sent_before_the_job_reaches_the_worker():
+    chromometer, keithley = connect_simulated()
+    server = AcquisitionServer(chromometer, keithley, port=0)
+    sent = []
+
+    class Submitter:
+        def send(self, data, droppable=True):
+            sent.append(data)
+
+    server.jobs.put = sent.append
+    try:
+        job_id = server.submit({"device": "test", "segments": [[500, 501, 0.5]]}, Submitter())
+    finally:
+        del server.jobs.put
+        server.server_close()
+
+    assert sent[0] == encode_json(MSG_STATUS, {"event": "queued", "job": job_id})
+    assert sent[1][0] == job_id
+
+
+class _StalledSocket:
+    """Client that stopped reading: sendall blocks until the socket is shut down."""
+    def __init__(self):
+        self.shut_down = threading.Event()
+
+    def sendall(self, data):
+        self.shut_down.wait()
+        raise OSError("shut down")
+
+    def shutdown(self, how):
+        self.shut_down.set()
+
+
+def test_stalled_client_is_disconnected_instead_of_blocking():
+    sock = _StalledSocket()
+    subscriber = _Subscriber(sock, queue_size=2, send_timeout_s=0.1)
+    subscriber.send(b"point")
+    while not subscriber.queue.empty():  # sender thread now stuck in sendall
+        time.sleep(0.01)
+    for i in range(5):
+        subscriber.send(b"point")
+    start = time.monotonic()
+    subscriber.send(b"status", droppable=False)
+    assert time.monotonic() - start < 1
+    assert subscriber.closed and sock.shut_down.is_set()
+    assert subscriber.dropped_points > 0
+    subscriber.send(b"status", droppable=False)  # returns at once once closed
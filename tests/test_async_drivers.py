@@ -0,0 +1,22 @@
+import asyncio
+import time
+
+import pytest
+
+from async_drivers import AsyncChromometer
+from simulated_instruments import SimulatedChromometerHandle
+from sp_2150i_chromometer_driver import Chromometer
+
+
+def test_move_timeout_shorter_than_travel_stops_the_scan():
+    light = SimulatedChromometerHandle(wavelength=500, scan_speed=100, move_time_scale=1)
+    chromometer = AsyncChromometer(Chromometer(device_handle=light))
+
+    started = time.monotonic()
+    # 300 nm at 100 nm/min travels for about 3 minutes
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(chromometer.set_wavelength_nm(800, timeout=0.5))
+
+    assert time.monotonic() - started < 5
+    assert light._move is None  # MONO-STOP was sent
+    assert 500 < light.wavelength < 800
@@ -0,0 +1,31 @@
+import pytest
+
+from grating_scheduler import assign_gratings, count_grating_changes, plan_grating_passes
+
+GRATINGS = [{"grating": 2, "blaze_nm": 1000}, {"grating": 1, "blaze_nm": 500}]
+
+
+def test_closest_blaze_on_a_log_scale():
+    # geometric mean of the blazes is 707.1 nm, the arithmetic one (750 nm) would be wrong
+    assert assign_gratings([400, 700, 720, 1200], GRATINGS) == [1, 1, 2, 2]
+
+
+def test_fixed_crossover():
+    assert assign_gratings([640, 650, 660], GRATINGS, crossover_nm=650) == [1, 2, 2]
+
+
+def test_no_gratings():
+    with pytest.raises(ValueError):
+        assign_gratings([600], [])
+
+
+def test_grating_in_position_goes_first():
+    wl_list = [600, 700, 800, 900]
+    assignment = assign_gratings(wl_list, GRATINGS)
+
+    passes = plan_grating_passes(wl_list, assignment, current_grating=2)
+
+    assert passes == [(2, [800, 900]), (1, [600, 700])]
+    assert count_grating_changes(passes, current_grating=2) == 1
+    assert count_grating_changes(plan_grating_passes(wl_list, assignment), current_grating=None) == 2
+    assert count_grating_changes(plan_grating_passes([600, 650], [1, 1], 1), current_grating=1) == 0
@@ -0,0 +1,120 @@
+import time
+
+import pytest
+from pyvisa import constants, errors
+
+import instrument_io
+from instrument_io import (SMU_POLICY, InstrumentBusyError, InstrumentParseError, InstrumentTimeoutError, IOPolicy,
+                           PolicyHandle)
+
+
+class FaultyHandle:
+    """
+    Stands in for a pyvisa resource.  Each write/query/read takes the next entry of replies: an exception instance is
+    raised, anything else returned.
+    """
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = []
+        self.clears = 0
+        self.timeout = None
+
+    def _next(self, call):
+        self.calls.append(call)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def write(self, command):
+        return self._next(command)
+
+    def query(self, command):
+        return self._next(command)
+
+    def read(self):
+        return self._next("read")
+
+    def clear(self):
+        self.clears += 1
+
+
+def busy():
+    return errors.VisaIOError(constants.StatusCode.error_resource_busy)
+
+
+def timeout():
+    return errors.VisaIOError(constants.StatusCode.error_timeout)
+
+
+@pytest.fixture
+def waits():
+    waits = []
+    instrument_io.set_sleep(waits.append)
+    yield waits
+    instrument_io.set_sleep(time.sleep)
+
+
+def test_busy_is_retried_after_a_device_clear(waits):
+    device = FaultyHandle([busy(), "650.000 NM ok"])
+    handle = PolicyHandle(device, IOPolicy(retries=2, backoff_s=0.005))
+
+    assert handle.query("?NM") == "650.000 NM ok"
+    assert device.calls == ["?NM", "?NM"]
+    assert device.clears == 1
+    assert waits == [0.005]
+
+
+def test_timeout_is_raised_after_the_retries_with_growing_backoff(waits):
+    device = FaultyHandle([timeout(), timeout(), timeout()])
+    handle = PolicyHandle(device, IOPolicy(retries=2, backoff_s=0.005, backoff_factor=2))
+
+    with pytest.raises(InstrumentTimeoutError) as raised:
+        handle.query("?NM")
+    assert raised.value.command == "?NM"
+    assert len(device.calls) == 3
+    assert device.clears == 2
+    assert waits == [0.005, 0.01]
+
+
+def test_unparsable_reply_is_retried_as_parse_error(waits):
+    device = FaultyHandle(["?NM garbled", " 650.000 NM  ok"])
+    handle = PolicyHandle(device, IOPolicy(retries=1))
+
+    assert handle.query_parsed("?NM", lambda reply: float(reply.split()[0])) == 650.0
+    assert device.clears == 1
+
+    device = FaultyHandle(["garbled", "garbled"])
+    handle = PolicyHandle(device, IOPolicy(retries=1))
+    with pytest.raises(InstrumentParseError):
+        handle.query_parsed("?NM", float)
+    assert len(device.calls) == 2
+
+
+def test_acquisition_rule_sets_long_timeout_and_never_retries(waits):
+    device = FaultyHandle([timeout()])
+    handle = PolicyHandle(device, SMU_POLICY)
+
+    with pytest.raises(InstrumentTimeoutError):
+        handle.query(":READ?")
+    assert device.timeout == 120000
+    assert len(device.calls) == 1
+    assert device.clears == 0
+    assert waits == []
+
+    device = FaultyHandle([busy(), "+1.0E-09"])
+    handle = PolicyHandle(device, SMU_POLICY)
+    assert handle.query(":SOUR:VOLT?") == "+1.0E-09"
+    assert device.timeout == SMU_POLICY.default_timeout_ms
+    assert device.clears == 1
+
+
+def test_read_is_not_retried(waits):
+    device = FaultyHandle(["", busy()])
+    handle = PolicyHandle(device, IOPolicy(retries=2))
+    handle.write("?NM")
+
+    with pytest.raises(InstrumentBusyError):
+        handle.read()
+    assert device.calls == ["?NM", "read"]
+    assert device.clears == 0
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from instrument_io import SMU_POLICY
+from integration_planner import IntegrationPlanner
+
+# NPLC 10 with filter count 16 at 50 Hz: 100 readings would take 267 s
+MODEL = [{"nplc": 0.1, "count": 1, "std": 1e-11, "seconds": 0.004, "overhead_s": 0.01},
+         {"nplc": 10, "count": 16, "std": 1e-13, "seconds": 2.67, "overhead_s": 0.01}]
+
+
+@pytest.fixture
+def planner(tmp_path):
+    path = tmp_path / "noise_models.json"
+    path.write_text(json.dumps({"diode": MODEL}))
+    return IntegrationPlanner(str(path), "diode")
+
+
+def test_unreachable_target_stays_within_the_acquisition_timeout(planner):
+    plan = planner.plan(1e-16)
+
+    assert plan["nplc"] == 10
+    assert plan["seconds"] <= planner.max_point_s < SMU_POLICY.timeout_ms_for(":READ?") / 1000
+    assert plan["readings"] == 22
+
+
+def test_reachable_target_takes_the_cheapest_setting(planner):
+    plan = planner.plan(1e-12)
+
+    assert (plan["nplc"], plan["count"], plan["readings"]) == (0.1, 1, 100)
+
+
+def test_setting_slower_than_max_point_s_is_skipped(planner):
+    planner.max_point_s = 1
+
+    assert planner.plan(1e-16)["nplc"] == 0.1
@@ -0,0 +1,46 @@
+import sweep_engine
+from measurement_cache import MeasurementCache, settings_key
+from simulated_instruments import connect_simulated
+
+
+def _sweep(chromometer, keithley, cache, wavelengths):
+    return sweep_engine.run_sweep(chromometer, keithley, [(None, wavelength) for wavelength in wavelengths],
+                                  scan_speed=30000, readings_per_point=3, cache=cache)
+
+
+def test_cached_points_are_served_and_marked(tmp_path):
+    chromometer, keithley = connect_simulated()
+    keithley.initialize(-2, 500e-6)
+    cache = MeasurementCache(str(tmp_path / "cache.sqlite"), "test", -2, settings_key(None, None, 3))
+
+    first = _sweep(chromometer, keithley, cache, [600, 601])
+    second = _sweep(chromometer, keithley, cache, [600, 601, 602])
+
+    assert list(first["cached"]) == [False, False]
+    assert list(second["cached"]) == [True, True, False]
+    assert list(second["rev_bias_list"][:2]) == list(first["rev_bias_list"])
+    assert cache.report() == {"hits": 2, "misses": 3, "expired": 0}
+
+
+def test_installed_grating_is_part_of_the_key(tmp_path):
+    chromometer, keithley = connect_simulated()
+    keithley.initialize(-2, 500e-6)
+    cache = MeasurementCache(str(tmp_path / "cache.sqlite"), "test", -2, settings_key(None, None, 3))
+
+    chromometer.set_grating(2)
+    _sweep(chromometer, keithley, cache, [600])
+    chromometer.set_grating(1)
+    assert not _sweep(chromometer, keithley, cache, [600])["cached"][0]
+
+
+def test_eviction_by_age_and_size(tmp_path):
+    cache = MeasurementCache(str(tmp_path / "cache.sqlite"), "test", -2, settings_key(), max_entries=2)
+    point = {"mean": -1e-6, "std": 1e-9, "min": -1.1e-6, "max": -0.9e-6}
+    for wavelength in (600, 601, 602):
+        cache.store(wavelength, 1, wavelength, point)
+    assert cache.evict() == 1
+    assert cache.lookup(600, 1) is None and cache.lookup(602, 1) is not None
+
+    cache.max_age_s = -1
+    assert cache.lookup(602, 1) is None and cache.expired == 1
+    assert cache.evict() == 2
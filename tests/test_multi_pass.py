@@ -0,0 +1,66 @@
+import numpy as np
+
+from multi_pass import PointAccumulator, run_passes, t_critical_95
+from simulated_instruments import connect_simulated
+
+
+def test_running_statistics_match_numpy():
+    values = np.random.default_rng(1).normal(-1e-6, 1e-8, size=(7, 3))
+    accumulator = PointAccumulator(3)
+    for row in values:
+        for index, value in enumerate(row):
+            accumulator.add(index, value, 600 + index)
+
+    assert np.allclose(accumulator.mean, values.mean(axis=0), rtol=1e-12)
+    assert np.allclose(accumulator.std(), values.std(axis=0, ddof=1), rtol=1e-9)
+    assert np.allclose(accumulator.standard_error(), values.std(axis=0, ddof=1) / np.sqrt(7), rtol=1e-9)
+    assert list(accumulator.wavelength_mean) == [600, 601, 602]
+
+
+def test_outliers_rejected_only_after_min_count():
+    accumulator = PointAccumulator(1, reject_sigma=3, min_count=5)
+    for value in [1.0, 1.1, 0.9, 1.05, 0.95]:
+        assert accumulator.add(0, value, 600)
+
+    assert not accumulator.add(0, 10.0, 600)
+    assert accumulator.add(0, 1.02, 600)
+    assert accumulator.count[0] == 6 and accumulator.rejected[0] == 1
+
+    early = PointAccumulator(1, reject_sigma=3, min_count=5)
+    assert all(early.add(0, value, 600) for value in [1.0, 1.1, 10.0])
+
+
+def test_clean_readings_are_rarely_rejected():
+    passes = 10
+    accumulator = PointAccumulator(2000, reject_sigma=3)
+    for value in np.random.default_rng(2).normal(size=(passes, 2000)):
+        for index in range(2000):
+            accumulator.add(index, value[index], 600)
+
+    assert accumulator.rejected.sum() / (passes * 2000) < 0.015
+
+
+def test_confidence_interval_and_single_pass():
+    assert t_critical_95(1) == 12.706 and t_critical_95(100) == 1.96 and np.isnan(t_critical_95(0))
+
+    accumulator = PointAccumulator(2)
+    for value in (1.0, 3.0):
+        accumulator.add(0, value, 600)
+    accumulator.add(1, 2.0, 601)
+    df = accumulator.to_dataframe()
+
+    assert np.isclose(df["ci95_high"][0] - df["rev_bias_list"][0], 12.706)
+    assert np.isnan(df["std"][1]) and list(df["passes"]) == [2, 1]
+
+
+def test_passes_alternate_direction_and_fold_by_wavelength():
+    chromometer, keithley = connect_simulated()
+    keithley.initialize(-2, 500e-6)
+    visited = []
+
+    df = run_passes(chromometer, keithley, [(None, 600), (None, 610), (None, 620)], passes=3, scan_speed=30000,
+                    readings_per_point=3, on_point=lambda index, wavelength, current: visited.append(wavelength))
+
+    assert [round(wavelength) for wavelength in visited] == [600, 610, 620, 620, 610, 600, 600, 610, 620]
+    assert list(df["passes"]) == [3, 3, 3]
+    assert list(np.round(df["wl_chromometer_list"])) == [600, 610, 620]
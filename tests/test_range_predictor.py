@@ -0,0 +1,47 @@
+import sweep_engine
+from range_predictor import RANGES_2602B, RangePredictor, is_overflow
+from simulated_instruments import connect_simulated
+from sweep_samples import STATUS_REMEASURED, SweepSamples
+
+
+def test_range_covers_neighbours_with_headroom():
+    predictor = RangePredictor(RANGES_2602B, headroom=2.0).load_sweep([600, 610, 620], [-0.3e-6, -4e-6, -0.2e-6])
+
+    assert predictor.range_for(600) == 1e-6
+    assert predictor.range_for(605) == 10e-6
+    assert predictor.range_for(615) == 10e-6
+    assert predictor.range_for(700) == 1e-6
+    assert RangePredictor().range_for(600) is None
+
+
+def test_overflow_readings_are_not_learned():
+    predictor = RangePredictor(RANGES_2602B)
+    predictor.update(600, 9.91e37)
+    predictor.update(600, float("nan"))
+    assert predictor.range_for(600) is None
+
+    predictor.update(600, -5e-3)
+    predictor.update(600, -5e-9)
+    assert predictor.range_for(600) == 100e-9
+    assert predictor.range_for_current(10) == RANGES_2602B[-1]
+
+
+def test_is_overflow():
+    assert is_overflow(-9.91e37)
+    assert is_overflow(2e-6, 1e-6)
+    assert not is_overflow(2e-6)
+    assert not is_overflow(-0.5e-6, 1e-6)
+
+
+def test_compliance_on_fixed_range_remeasures_with_autorange():
+    chromometer, keithley = connect_simulated()
+    keithley.initialize(-2, 500e-6)
+    predictor = RangePredictor(RANGES_2602B).load_sweep([600], [1e-9])
+    compliance = iter([True, False])
+    keithley.in_compliance = lambda: next(compliance)
+    samples = SweepSamples()
+
+    sweep_engine.run_sweep(chromometer, keithley, [(None, 600)], scan_speed=30000, readings_per_point=3,
+                           predictor=predictor, samples=samples)
+
+    assert samples.status[0] == STATUS_REMEASURED
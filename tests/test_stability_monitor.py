@@ -0,0 +1,59 @@
+import numpy as np
+
+from stability_monitor import MultiResolutionAggregator, ReadingRing, RollingCsv
+
+
+def test_ring_keeps_the_newest_readings_across_wraparound():
+    ring = ReadingRing(capacity=5)
+    ring.extend(np.arange(3.0), np.arange(3.0) * 10)
+    assert list(ring.latest()[0]) == [0, 1, 2]
+
+    ring.extend(np.arange(3.0, 7.0), np.arange(3.0, 7.0) * 10)
+    times, currents = ring.latest()
+    assert list(times) == [2, 3, 4, 5, 6]
+    assert list(currents) == [20, 30, 40, 50, 60]
+    assert list(ring.latest(2)[0]) == [5, 6]
+
+
+def test_ring_block_larger_than_capacity():
+    ring = ReadingRing(capacity=4)
+    ring.extend(np.arange(1.0), np.arange(1.0))
+    ring.extend(np.arange(1.0, 11.0), np.arange(1.0, 11.0))
+
+    assert list(ring.latest()[0]) == [7, 8, 9, 10]
+    assert ring.count == 11
+
+
+def test_csv_rotates_and_keeps_files(tmp_path):
+    path = str(tmp_path / "monitor_1s.csv")
+    csv = RollingCsv(path, "time,value", max_rows=2, keep_files=2)
+    for i in range(7):
+        csv.append(f"{i},{i}")
+    csv.close()
+
+    def rows(name):
+        with open(tmp_path / name) as f:
+            return f.read().splitlines()
+
+    assert rows("monitor_1s.csv") == ["time,value", "6,6"]
+    assert rows("monitor_1s.1.csv") == ["time,value", "4,4", "5,5"]
+    assert rows("monitor_1s.2.csv") == ["time,value", "2,2", "3,3"]
+    assert not (tmp_path / "monitor_1s.3.csv").exists()
+
+    reopened = RollingCsv(path, "time,value", max_rows=2, keep_files=2)
+    assert reopened.rows == 1
+    reopened.close()
+
+
+def test_aggregates_align_to_interval_boundaries():
+    emitted = []
+    aggregator = MultiResolutionAggregator([1, 10], lambda *row: emitted.append(row))
+    aggregator.add(np.array([9.2, 9.7, 10.1]), np.array([1.0, 3.0, 5.0]))
+    aggregator.add(np.array([10.6, 11.3]), np.array([7.0, 9.0]))
+    aggregator.flush()
+
+    assert (1, 9.0, 2, 1.0, 2.0, 3.0) in emitted
+    assert (1, 10.0, 2, 5.0, 6.0, 7.0) in emitted
+    assert (10, 0.0, 2, 1.0, 2.0, 3.0) in emitted
+    assert (10, 10.0, 3, 5.0, 7.0, 9.0) in emitted
+    assert len(emitted) == 5
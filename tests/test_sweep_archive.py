@@ -0,0 +1,32 @@
+import numpy as np
+
+from sweep_archive import COLUMN_DTYPE, SweepArchive
+
+
+def test_append_and_query(tmp_path):
+    archive = SweepArchive(str(tmp_path))
+    archive.append([500, 510, 520], [-1e-7, -2e-7, -3e-7], "red", -2, grating=1, scan_speed=300,
+                   date="2024-05-01_10-00-00")
+    archive.append([600, 610], [-4e-7, -5e-7], "blue", 0, date="2024-05-02_10-00-00")
+
+    runs = list(archive.query(device="red", wl_min=505))
+    assert len(runs) == 1
+    run, data = runs[0]
+    assert list(data["wl_chromometer_list"]) == [510, 520]
+    assert list(data["rev_bias_list"]) == [-2e-7, -3e-7]
+    assert list(archive.index()["run_id"]) == [0, 1]
+
+
+def test_interrupted_append_does_not_misalign_later_runs(tmp_path):
+    archive = SweepArchive(str(tmp_path))
+    archive.append([500, 510], [-1e-7, -2e-7], "red", -2)
+    # append died after the wavelengths were written, before the currents and the index row
+    with open(archive.wavelength_path, "ab") as f:
+        np.array([700, 710, 720], dtype=COLUMN_DTYPE).tofile(f)
+
+    archive.append([600, 610], [-4e-7, -5e-7], "red", -2)
+
+    run, data = list(archive.query())[-1]
+    assert run["offset"] == 2
+    assert list(data["wl_chromometer_list"]) == [600, 610]
+    assert list(data["rev_bias_list"]) == [-4e-7, -5e-7]
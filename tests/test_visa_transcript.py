@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+import instrument_io
+import sweep_engine
+from simulated_instruments import SimulatedChromometerHandle, SimulatedKeithley2602BHandle
+from smu_interface import connect_smu
+from sp_2150i_chromometer_driver import Chromometer
+from visa_transcript import (CHROMOMETER_CHANNEL, SMU_CHANNEL, RecordingHandle, Transcript, TranscriptMismatchError,
+                             connect_replay, load_transcript)
+
+SCHEDULE = [(None, 600), (None, 610), (None, 620)]
+
+
+@pytest.fixture
+def transcript_path(tmp_path):
+    path = str(tmp_path / "sweep.vtr")
+    light = SimulatedChromometerHandle()
+    with Transcript(path) as transcript:
+        chromometer = Chromometer(device_handle=RecordingHandle(light, transcript, CHROMOMETER_CHANNEL))
+        keithley = connect_smu("simulated", RecordingHandle(SimulatedKeithley2602BHandle(light), transcript,
+                                                            SMU_CHANNEL))
+        keithley.initialize(-2, 500e-6)
+        recorded = sweep_engine.run_sweep(chromometer, keithley, SCHEDULE, scan_speed=30000, readings_per_point=3)
+    yield path, recorded
+    instrument_io.set_sleep(time.sleep)
+
+
+def test_replay_reproduces_the_sweep_without_waiting(transcript_path):
+    path, recorded = transcript_path
+    chromometer, keithley = connect_replay(path)
+    keithley.initialize(-2, 500e-6)
+
+    started = time.monotonic()
+    # 10 nm per move at 30 nm/min would wait 20 s per point in a recorded or realtime sweep
+    replayed = sweep_engine.run_sweep(chromometer, keithley, SCHEDULE, scan_speed=30, readings_per_point=3)
+
+    assert time.monotonic() - started < 5
+    assert list(replayed["wl_chromometer_list"]) == list(recorded["wl_chromometer_list"])
+    assert list(replayed["rev_bias_list"]) == list(recorded["rev_bias_list"])
+    assert keithley.driver.device_handle.handle.remaining == 0
+
+
+def test_first_differing_command_is_reported(transcript_path):
+    path, recorded = transcript_path
+    chromometer, keithley = connect_replay(path)
+
+    with pytest.raises(TranscriptMismatchError, match="transcript has"):
+        keithley.initialize(-1, 500e-6)
+
+
+def test_transcript_keeps_channels_apart(transcript_path):
+    channels = load_transcript(transcript_path[0])
+
+    assert set(channels) == {CHROMOMETER_CHANNEL, SMU_CHANNEL}
+    assert channels[SMU_CHANNEL][0].command == "*IDN?"
+    assert all(record.status == 0 for records in channels.values() for record in records)
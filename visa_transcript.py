@@ -0,0 +1,302 @@
+import argparse
+import collections
+import struct
+import time
+
+from pyvisa import constants, errors
+
+"""
+Record and replay of instrument sessions.
+
+RecordingHandle sits between a driver's PolicyHandle and the pyvisa resource and appends every write, query, read
+and device clear to a transcript file: channel, operation, start time, duration, outcome, command and reply.
+ReplayHandle serves a transcript back to the same drivers, either as fast as possible or taking each operation's
+recorded duration, so driver and sweep changes can be benchmarked and regression checked against a real session
+without the bench.  A driver that sends something other than what was recorded gets a TranscriptMismatchError at
+the first differing command.
+
+File format, little endian: MAGIC, then one record per operation
+    <BBddiII   operation, channel, start [s since recording began], duration [s], status, command length,
+               reply length
+followed by the command and reply bytes (utf-8).  Status 0 is success, otherwise the VISA status code of the error
+raised (TIMEOUT_STATUS for timeouts outside VISA, OTHER_ERROR_STATUS for anything else).  A CHANNEL record (command
+= channel name) declares each channel before its first operation.
+
+Ex.
+    with Transcript("bench_2024-05-01.vtr") as transcript:
+        chromometer, smu = connect_recording(transcript, "COM4", "GPIB0::30::INSTR")
+        ... run a sweep ...
+
+    chromometer, smu = connect_replay("bench_2024-05-01.vtr", realtime=True)
+"""
+
+MAGIC = b"VTR1"
+RECORD = struct.Struct("<BBddiII")
+
+OP_CHANNEL = 0
+OP_WRITE = 1
+OP_QUERY = 2
+OP_READ = 3
+OP_CLEAR = 4
+OPERATION_NAMES = {OP_WRITE: "write", OP_QUERY: "query", OP_READ: "read", OP_CLEAR: "clear"}
+
+TIMEOUT_STATUS = int(constants.StatusCode.error_timeout)
+OTHER_ERROR_STATUS = -1
+
+CHROMOMETER_CHANNEL = "chromometer"
+SMU_CHANNEL = "smu"
+
+
+class TranscriptMismatchError(Exception):
+    """The driver sent something other than the next recorded operation."""
+
+
+class TranscriptRecord:
+    __slots__ = ("operation", "channel", "start", "duration", "status", "command", "reply")
+
+    def __init__(self, operation, channel, start, duration, status, command, reply):
+        self.operation = operation
+        self.channel = channel
+        self.start = start
+        self.duration = duration
+        self.status = status
+        self.command = command
+        self.reply = reply
+
+    def __repr__(self):
+        return (f"{OPERATION_NAMES.get(self.operation, self.operation)}({self.command!r}) -> {self.reply!r} "
+                f"[{self.duration * 1000:.2f} ms, status {self.status}]")
+
+
+class Transcript:
+    """
+    Writer.  Records are flushed as they are written so a crashed sweep still leaves a usable transcript.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.channels = {}
+        self.origin = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def channel(self, name):
+        """
+        :return: channel number of name, declared in the file on first use
+        """
+        if name not in self.channels:
+            self.channels[name] = len(self.channels)
+            self._write(OP_CHANNEL, self.channels[name], 0.0, 0.0, 0, name, "")
+        return self.channels[name]
+
+    def append(self, operation, channel, start, duration, status, command="", reply=""):
+        """
+        :param start: time.perf_counter() at the start of the operation
+        """
+        self._write(operation, channel, start - self.origin, duration, status, command, reply)
+
+    def _write(self, operation, channel, start, duration, status, command, reply):
+        command = (command or "").encode("utf-8")
+        reply = (reply or "").encode("utf-8")
+        self.file.write(RECORD.pack(operation, channel, start, duration, status, len(command), len(reply)))
+        self.file.write(command)
+        self.file.write(reply)
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def load_transcript(path):
+    """
+    :return: dict channel name -> list of TranscriptRecord in recorded order
+    """
+    names = {}
+    channels = collections.defaultdict(list)
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a VISA transcript")
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                break
+            operation, channel, start, duration, status, command_length, reply_length = RECORD.unpack(header)
+            command = f.read(command_length).decode("utf-8")
+            reply = f.read(reply_length).decode("utf-8")
+            if operation == OP_CHANNEL:
+                names[channel] = command
+                continue
+            channels[names[channel]].append(TranscriptRecord(operation, channel, start, duration, status, command,
+                                                             reply))
+    return dict(channels)
+
+
+def _error_status(exc):
+    if isinstance(exc, errors.VisaIOError):
+        return int(exc.error_code)
+    if isinstance(exc, TimeoutError):
+        return TIMEOUT_STATUS
+    return OTHER_ERROR_STATUS
+
+
+class RecordingHandle:
+    """
+    Wraps a pyvisa resource and records write/query/read/clear into a Transcript.  Every other attribute is passed
+    through to the resource.
+    """
+    def __init__(self, handle, transcript, channel):
+        object.__setattr__(self, "handle", handle)
+        object.__setattr__(self, "transcript", transcript)
+        object.__setattr__(self, "channel", transcript.channel(channel))
+
+    def __getattr__(self, name):
+        return getattr(self.handle, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.handle, name, value)
+
+    def _record(self, operation, function, command, *args):
+        start = time.perf_counter()
+        try:
+            reply = function(*args)
+        except Exception as exc:
+            self.transcript.append(operation, self.channel, start, time.perf_counter() - start, _error_status(exc),
+                                   command, str(exc))
+            raise
+        self.transcript.append(operation, self.channel, start, time.perf_counter() - start, 0, command,
+                               reply if isinstance(reply, str) else "")
+        return reply
+
+    def write(self, command, *args, **kwargs):
+        return self._record(OP_WRITE, lambda: self.handle.write(command, *args, **kwargs), command)
+
+    def query(self, command, *args, **kwargs):
+        return self._record(OP_QUERY, lambda: self.handle.query(command, *args, **kwargs), command)
+
+    def read(self, *args, **kwargs):
+        return self._record(OP_READ, lambda: self.handle.read(*args, **kwargs), "")
+
+    def clear(self):
+        return self._record(OP_CLEAR, self.handle.clear, "")
+
+
+class ReplayHandle:
+    """
+    Plays one channel of a transcript back as a pyvisa resource.
+
+    :param records: list of TranscriptRecord, ex. load_transcript(path)["smu"]
+    :param realtime: True sleeps each operation's recorded duration, False replies immediately
+    """
+    def __init__(self, records, realtime=False):
+        self.records = collections.deque(records)
+        self.realtime = realtime
+        self.timeout = 2000
+        self.replayed = 0
+
+    def _next(self, operation, command=""):
+        if not self.records:
+            raise TranscriptMismatchError(f"Transcript ended, driver sent {OPERATION_NAMES[operation]}({command!r})")
+        record = self.records.popleft()
+        if record.operation != operation or record.command != command:
+            raise TranscriptMismatchError(f"Operation {self.replayed}: driver sent "
+                                          f"{OPERATION_NAMES[operation]}({command!r}), transcript has {record!r}")
+        self.replayed += 1
+        if self.realtime:
+            time.sleep(record.duration)
+        if record.status == 0:
+            return record.reply
+        if record.status == OTHER_ERROR_STATUS:
+            raise OSError(record.reply)
+        raise errors.VisaIOError(record.status)
+
+    def write(self, command, *args, **kwargs):
+        self._next(OP_WRITE, command)
+
+    def query(self, command, *args, **kwargs):
+        return self._next(OP_QUERY, command)
+
+    def read(self, *args, **kwargs):
+        return self._next(OP_READ)
+
+    def clear(self):
+        self._next(OP_CLEAR)
+
+    def flush(self, *args):
+        pass
+
+    def close(self):
+        pass
+
+    @property
+    def remaining(self):
+        return len(self.records)
+
+
+def connect_recording(transcript, chromometer_resource="COM4", smu_resource="GPIB0::30::INSTR"):
+    """
+    Real instruments, every exchange recorded into transcript.
+
+    :param transcript: Transcript
+    :return: (Chromometer, smu_interface.SourceMeter)
+    """
+    import pyvisa
+    from sp_2150i_chromometer_driver import Chromometer, open_serial_port
+    from smu_interface import connect_smu
+
+    rm = pyvisa.ResourceManager()
+    chromometer = Chromometer(device_handle=RecordingHandle(open_serial_port(rm, chromometer_resource), transcript,
+                                                            CHROMOMETER_CHANNEL))
+    smu = connect_smu(smu_resource, RecordingHandle(rm.open_resource(smu_resource), transcript, SMU_CHANNEL))
+    chromometer.rm = rm  # closed when the chromometer is deleted
+    return chromometer, smu
+
+
+def connect_replay(path, realtime=False):
+    """
+    Drivers served by a transcript recorded with connect_recording, in the same order of calls.  Without realtime the
+    move waits and retry backoff of the drivers and the sweep (instrument_io.sleep) are made instant too.
+
+    :param realtime: see ReplayHandle
+    :return: (Chromometer, smu_interface.SourceMeter), either is None if the transcript has no such channel
+    """
+    from instrument_io import set_sleep
+    from sp_2150i_chromometer_driver import Chromometer
+    from smu_interface import connect_smu
+
+    channels = load_transcript(path)
+    set_sleep(time.sleep if realtime else lambda seconds: None)
+    chromometer = smu = None
+    if CHROMOMETER_CHANNEL in channels:
+        chromometer = Chromometer(device_handle=ReplayHandle(channels[CHROMOMETER_CHANNEL], realtime))
+    if SMU_CHANNEL in channels:
+        smu = connect_smu("replay", ReplayHandle(channels[SMU_CHANNEL], realtime))
+    return chromometer, smu
+
+
+def arg_handler(argv=None):
+    parser = argparse.ArgumentParser(description="Print a VISA transcript with per-command timing.")
+    parser.add_argument("transcript")
+    parser.add_argument("--summary", action="store_true", help="Only print count and total time per command.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = arg_handler()
+    for name, records in load_transcript(args.transcript).items():
+        print(f"== {name}: {len(records)} operations, {sum(r.duration for r in records):.3f} s on the bus")
+        if not args.summary:
+            for record in records:
+                print(f"{record.start:12.6f}  {record!r}")
+            continue
+        totals = collections.defaultdict(lambda: [0, 0.0])
+        for record in records:
+            totals[record.command or OPERATION_NAMES[record.operation]][0] += 1
+            totals[record.command or OPERATION_NAMES[record.operation]][1] += record.duration
+        for command, (count, total) in sorted(totals.items(), key=lambda item: -item[1][1]):
+            print(f"{total:10.3f} s  {count:6d}x  {command}")
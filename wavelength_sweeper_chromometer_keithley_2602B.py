@@ -1,15 +1,25 @@
 import pyvisa
 import argparse
-import time
-import pandas as pd
 import matplotlib.pyplot as plt
 
 from sp_2150i_chromometer_driver import Chromometer
-from keithley_2602B_driver import Keithley2602B
+from smu_interface import connect_smu
 from thorlabs_pm100_driver import ThorlabsPM100
+from sweep_archive import SweepArchive
+from live_plotter import LivePlotter
+from range_predictor import RangePredictor
+from integration_planner import IntegrationPlanner, smu_settings_functions
+from sweep_engine import build_wavelength_list, grating_schedule, run_sweep, save_sweep
+from multi_pass import run_passes
+from scan_speed_planner import ScanSpeedPlanner
+from settle_detector import SettleDetector
+from sweep_samples import SweepSamples
+from measurement_cache import MeasurementCache, settings_key
+from sweep_trace import TracedDriver, enable_tracing, export_trace, span
+from visa_transcript import Transcript, connect_recording, connect_replay
 
 """
-For Keithley 2602B (40V limit)
+For Keithley 2602B (40V limit), or Keithley 2410 via --smu-resource (both through smu_interface.SourceMeter).
 """
 
 class Debug:
@@ -40,7 +50,7 @@ class Plotter:
         plt.ylabel("Rev Bias Current [mA?]")
         #plt.xticks(range(len(data["wl_chromometer_list"])), data["wl_chromometer_list"])
         #plt.grid()
-        plt.savefig(filename + string_time)
+        plt.savefig(output_prefix + string_time)
         plt.show()
 
 
@@ -62,6 +72,65 @@ def arg_handler(argv=None):
     parser.add_argument("wavelength_stop_fine", type=int, nargs='?', help="The sweep stop wavelength as integer.")
     parser.add_argument("wavelength_step_fine", type=int, nargs='?', help="The sweep step in nanometers [nm].")
 
+    parser.add_argument("--chromometer-resource", default="COM4",
+                        help="Serial port of the chromometer, ex. COM4 or /dev/ttyUSB0.")
+    parser.add_argument("--smu-resource", default="GPIB0::30::INSTR",
+                        help="VISA resource of the source meter, model detected from *IDN?.")
+    parser.add_argument("--bias", type=float, default=-2, help="Source voltage [V].")
+    parser.add_argument("--current-limit", type=float, default=500e-6, help="Current compliance [A].")
+    parser.add_argument("--output-prefix", default="main_v4_red_0V_",
+                        help="Start of the output file names, followed by the date and time.")
+    parser.add_argument("--archive", help="Also append the sweep to this SweepArchive directory.")
+    parser.add_argument("--device", default="unknown", help="Device name recorded in the archive index.")
+    parser.add_argument("--live", action="store_true", help="Show a live plot that updates as points arrive.")
+    parser.add_argument("--predict-range", action="store_true",
+                        help="Use a fixed current range per wavelength predicted from a previous sweep (--range-from, "
+                             "else the latest archive run of --device at this bias) and the points measured so far. "
+                             "Falls back to autorange on overflow.")
+    parser.add_argument("--range-from", help="Previous sweep CSV used to predict current ranges.")
+    parser.add_argument("--noise-target", type=float,
+                        help="Target noise [A] of each averaged point; picks NPLC, filter count and readings per "
+                             "point from the device's cached noise model (measured first if missing).")
+    parser.add_argument("--noise-cache", default="noise_models.json", help="Noise model cache file.")
+    parser.add_argument("--recharacterize", action="store_true", help="Re-measure the noise model before the sweep.")
+    parser.add_argument("--grating-aware", action="store_true",
+                        help="Measure each wavelength on the grating with the closest blaze, indexing each grating "
+                             "at most once.")
+    parser.add_argument("--crossover", type=float, help="Fixed grating crossover wavelength [nm] for --grating-aware.")
+    parser.add_argument("--slew-speed", type=float,
+                        help="Scan speed [nm/min] for moves longer than --slew-threshold (rewinds, jumps between "
+                             "segments); all moves run at 300 nm/min without it.")
+    parser.add_argument("--slew-threshold", type=float, default=20, help="Shortest move [nm] slewed fast.")
+    parser.add_argument("--approach", type=float, default=0,
+                        help="Last part [nm] of a slewed move done at 300 nm/min.")
+    parser.add_argument("--settle", action="store_true",
+                        help="After each move sample the current until it is flat instead of waiting a fixed "
+                             "speed-derived time; the settle time of each point goes into the settle_s column.")
+    parser.add_argument("--settle-max", type=float, default=5, help="Longest settle wait [s] with --settle.")
+    parser.add_argument("--settle-tolerance", type=float, default=0.01,
+                        help="Allowed drift and noise across the settle window, relative to the current.")
+    parser.add_argument("--keep-samples", action="store_true",
+                        help="Keep every SMU reading (not only the average) with timestamps and status in "
+                             "<csv name>_samples.npz.")
+    parser.add_argument("--passes", type=int, default=1,
+                        help="Repeat the sweep this many times, alternating direction, and save one averaged sweep "
+                             "with std, sem and 95 %% confidence interval columns.")
+    parser.add_argument("--reject-sigma", type=float,
+                        help="With --passes, drop readings this many standard deviations from the running mean of "
+                             "their wavelength (from the sixth pass on).")
+    parser.add_argument("--cache",
+                        help="Point cache (SQLite file): points measured earlier with the same --device, bias, grating "
+                             "and averaging settings are reused instead of re-measured; marked in the cached column.")
+    parser.add_argument("--cache-max-age", type=float, default=3600,
+                        help="How long [s] a cached point stays valid.")
+    parser.add_argument("--record", help="Record every instrument exchange of this sweep into a VISA transcript file.")
+    parser.add_argument("--replay", help="Run against a recorded VISA transcript instead of the instruments.")
+    parser.add_argument("--realtime", action="store_true",
+                        help="With --replay, take each exchange's recorded time instead of replying immediately.")
+    parser.add_argument("--trace", nargs="?", const="sweep_trace.json",
+                        help="Record a timeline of sweep phases and instrument I/O and write it as Chrome trace-event "
+                             "JSON (default sweep_trace.json), viewable in chrome://tracing or ui.perfetto.dev.")
+
     args = parser.parse_args(argv)
 
     global wl_start_coarse
@@ -72,6 +141,38 @@ def arg_handler(argv=None):
     global wl_stop_fine
     global wl_step_fine
 
+    global chromometer_resource
+    global smu_resource
+    global bias_voltage
+    global current_limit
+
+    global output_prefix
+    global archive_dir
+    global device_name
+    global live_plot
+    global predict_range
+    global range_from
+    global noise_target
+    global noise_cache
+    global recharacterize
+    global grating_aware
+    global crossover_nm
+    global trace_path
+    global keep_samples
+    global settle
+    global settle_max
+    global settle_tolerance
+    global record_path
+    global replay_path
+    global replay_realtime
+    global slew_speed
+    global slew_threshold
+    global approach_nm
+    global passes
+    global cache_path
+    global cache_max_age
+    global reject_sigma
+
     wl_start_coarse = args.wavelength_start_coarse
     wl_stop_coarse = args.wavelength_stop_coarse
     wl_step_coarse = args.wavelength_step_coarse
@@ -80,69 +181,150 @@ def arg_handler(argv=None):
     wl_stop_fine = args.wavelength_stop_fine
     wl_step_fine = args.wavelength_step_fine
 
+    chromometer_resource = args.chromometer_resource
+    smu_resource = args.smu_resource
+    bias_voltage = args.bias
+    current_limit = args.current_limit
+
+    output_prefix = args.output_prefix
+    archive_dir = args.archive
+    device_name = args.device
+    live_plot = args.live
+    predict_range = args.predict_range
+    range_from = args.range_from
+    noise_target = args.noise_target
+    noise_cache = args.noise_cache
+    recharacterize = args.recharacterize
+    grating_aware = args.grating_aware
+    crossover_nm = args.crossover
+    trace_path = args.trace
+    keep_samples = args.keep_samples
+    settle = args.settle
+    settle_max = args.settle_max
+    settle_tolerance = args.settle_tolerance
+    record_path = args.record
+    replay_path = args.replay
+    replay_realtime = args.realtime
+    slew_speed = args.slew_speed
+    slew_threshold = args.slew_threshold
+    approach_nm = args.approach
+    passes = args.passes
+    cache_path = args.cache
+    cache_max_age = args.cache_max_age
+    reject_sigma = args.reject_sigma
+
 
 if __name__ == '__main__':
-    chromometer = Chromometer()
-    pm100 = ThorlabsPM100()
-    keithley = Keithley2602B()
+    arg_handler()  # creates wavelength variables
+    if trace_path is not None:
+        enable_tracing()
+
+    if replay_path is not None:
+        chromometer, keithley = connect_replay(replay_path, replay_realtime)
+    elif record_path is not None:
+        transcript = Transcript(record_path)
+        chromometer, keithley = connect_recording(transcript, chromometer_resource, smu_resource)
+    else:
+        chromometer = Chromometer(resource_name=chromometer_resource)
+        keithley = connect_smu(smu_resource)
+    pm100 = ThorlabsPM100() if replay_path is None else None
+    if trace_path is not None:
+        chromometer = TracedDriver(chromometer, "chromometer")
+        keithley = TracedDriver(keithley, "smu")
     debug = Debug()
-    wl_chromometer_list = []
-    rev_bias_list = []
 
     print(keithley.get_id())
     #print(pm100.measure_current())
-    keithley.keithley_initialize_2410()
-
-    arg_handler()  # creates wavelength variables
-
-    wl_list_coarse = [*range(wl_start_coarse, wl_stop_coarse + wl_step_coarse, wl_step_coarse)]
+    keithley.initialize(bias_voltage, current_limit)
 
+    segments = [(wl_start_coarse, wl_stop_coarse, wl_step_coarse)]
     if wl_start_fine is not None:
-        wl_list_fine = [*range(wl_start_fine, wl_stop_fine + wl_step_fine, wl_step_fine)]
-        wl_list = [wl for wl in wl_list_coarse if wl < wl_start_fine] + \
-                   wl_list_fine + \
-                  [wl for wl in wl_list_coarse if wl > wl_stop_fine]
-    else:
-        wl_list = wl_list_coarse
+        segments.append((wl_start_fine, wl_stop_fine, wl_step_fine))
+    with span("plan", "sweep"):
+        wl_list = build_wavelength_list(segments)
+        schedule, current_grating = grating_schedule(chromometer, wl_list, "auto" if grating_aware else None,
+                                                     crossover_nm)
 
     print(wl_list)
-
-    keithley.smua_output_on()
+    if grating_aware:
+        print("Grating schedule:", schedule)
+
+    live = LivePlotter(output_prefix).start() if live_plot else None
+
+    predictor = None
+    if predict_range:
+        predictor = RangePredictor(keithley.current_ranges)
+        if range_from is not None:
+            predictor.load_csv(range_from)
+        elif archive_dir is not None:
+            previous = SweepArchive(archive_dir).latest(device=device_name, bias=keithley.get_source_voltage())
+            if previous is not None:
+                predictor.load_sweep(previous[1]["wl_chromometer_list"], previous[1]["rev_bias_list"])
+
+    keithley.output_on()
     chrom_scan_speed = 300
-    chromometer.set_scan_speed_nm_p_min(chrom_scan_speed)
-
-    for wavelength in wl_list:
-        print("chrom speed: ", chromometer.get_scan_speed_nm_p_min_clean_output())
-        print("current chrom wl: ", chromometer.get_wavelength_nm_clean_output())
-        print("set wl: ", wavelength)
-
-        # find wavelength difference btwn current and target value
-        delta_wavelength_nm = abs(round(chromometer.get_wavelength_nm_clean_output() - wavelength))
-        chromometer.set_wavelength_nm(wavelength)
-
-        # must wait until chromometer reaches target wavelength, with safety factor at end
-        time.sleep((60 * delta_wavelength_nm) / chrom_scan_speed * 1.2)
-        print("current chrom wl: ", chromometer.get_wavelength_nm_clean_output())
-
-        avg_list = [keithley.SCPI_measure_i_clean() for i in range(0, 9)]
-        #print(avg_list)
-        avg = sum(avg_list)/len(avg_list)
-        #print(avg)
-
-        wl_chromometer_list.append(chromometer.get_wavelength_nm_clean_output())
-        #rev_bias_list.append(keithley.SCPI_measure_i_clean())
-        rev_bias_list.append(avg)
-
-    keithley.smua_output_off()
+    speed_planner = None
+    if slew_speed is not None:
+        speed_planner = ScanSpeedPlanner(chrom_scan_speed, slew_speed, slew_threshold, approach_nm)
+        speed_planner.apply_speed(chromometer, chrom_scan_speed)
+    else:
+        chromometer.set_scan_speed_nm_p_min(chrom_scan_speed)
+
+    readings_per_point = 9
+    plan = {}
+    if noise_target is not None:
+        planner = IntegrationPlanner(noise_cache, device_name)
+        apply_settings, measure_currents = smu_settings_functions(keithley)
+        if recharacterize or not planner.has_model():
+            chromometer.set_wavelength_nm(wl_list[0])
+            planner.characterize(apply_settings, measure_currents)
+        plan = planner.plan(noise_target)
+        planner.apply(plan, apply_settings)
+        readings_per_point = plan["readings"]
+        print("Integration plan:", plan)
+
+    samples = SweepSamples(len(schedule) * passes, readings_per_point) if keep_samples else None
+    settle_detector = SettleDetector(max_wait_s=settle_max, relative_tolerance=settle_tolerance) if settle else None
+    cache = None
+    if cache_path is not None and passes == 1:  # repeat passes always measure
+        cache = MeasurementCache(cache_path, device_name, bias_voltage,
+                                 settings_key(plan.get("nplc"), plan.get("count"), readings_per_point), cache_max_age)
+    if passes > 1:
+        df = run_passes(chromometer, keithley, schedule, passes, reject_sigma, scan_speed=chrom_scan_speed,
+                        readings_per_point=readings_per_point, predictor=predictor, live=live,
+                        current_grating=current_grating, speed_planner=speed_planner, samples=samples,
+                        settle_detector=settle_detector)
+    else:
+        df = run_sweep(chromometer, keithley, schedule, chrom_scan_speed, readings_per_point, predictor, live,
+                       current_grating, speed_planner=speed_planner, samples=samples, settle_detector=settle_detector,
+                       cache=cache)
+    if cache is not None:
+        print("Point cache:", cache.report(), "evicted", cache.evict())
+        cache.close()
+    if settle_detector is not None and "settle_s" in df:
+        print("Settle time [s]: mean", round(df["settle_s"].mean(), 3), "max", round(df["settle_s"].max(), 3),
+              "timeouts", settle_detector.timeouts)
+    if speed_planner is not None:
+        print("Scan speed plan:", speed_planner.report())
+
+    keithley.output_off()
+    if live is not None:
+        live.close()
+
+    df, string_time = save_sweep(df, keithley.get_source_voltage(), output_prefix, samples)
+    print(df)
 
-    combined_list = list(zip(wl_chromometer_list, rev_bias_list))
-    string_time = time.strftime("%Y-%m-%d_%H-%M-%S")
+    if archive_dir is not None:
+        gratings = set(df["grating"]) if "grating" in df else set()
+        with span("archive append", "persistence"):
+            SweepArchive(archive_dir).append(df["wl_chromometer_list"], df["rev_bias_list"], device_name,
+                                             float(df["Voltage"].iloc[0]), scan_speed=chrom_scan_speed,
+                                             grating=gratings.pop() if len(gratings) == 1 else None,
+                                             date=string_time, source=output_prefix + string_time + ".csv")
 
-    df = pd.DataFrame(combined_list, columns=["wl_chromometer_list", "rev_bias_list"])
-    df = df.assign(Voltage=keithley.SCPI_get_source_voltage())
-    filename = "main_v4_red_0V_"
-    df.to_csv(filename + string_time + ".csv", index=None)
-    print(df)
+    if trace_path is not None:
+        export_trace(trace_path)
+    if record_path is not None:
+        transcript.close()
 
     Plotter().line_dot_plot(df)
-